@@ -1,16 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
+from redis import Redis
 from uuid import uuid4
-from typing import Dict
-from cryptography.fernet import Fernet
 from ..config import get_settings
+from ..deps import get_redis
 from . import fitbit, garmin, oura, withings
+from .tokens import store_tokens
 
 router = APIRouter()
 _settings = get_settings()
-_cipher = Fernet(Fernet.generate_key())
-_token_store: Dict[str, Dict[str, str]] = {}
 
 
 class OAuthCallback(BaseModel):
@@ -18,15 +17,6 @@ class OAuthCallback(BaseModel):
     state: str
 
 
-def _encrypt(value: str) -> str:
-    return _cipher.encrypt(value.encode()).decode()
-
-
-def _store_tokens(user_id: str, vendor: str, tokens: Dict[str, str]) -> None:
-    encrypted = {k: _encrypt(v) for k, v in tokens.items()}
-    _token_store.setdefault(user_id, {})[vendor] = encrypted['access_token']
-
-
 @router.get('/fitbit/start')
 def fitbit_start() -> RedirectResponse:
     state = str(uuid4())
@@ -35,12 +25,12 @@ def fitbit_start() -> RedirectResponse:
 
 
 @router.get('/fitbit/callback')
-def fitbit_callback(code: str, state: str):
+def fitbit_callback(code: str, state: str, redis: Redis = Depends(get_redis)):
     try:
         tokens = fitbit.exchange_code(code)
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=400, detail=str(exc)) from exc
-    _store_tokens('demo-user', 'fitbit', tokens)
+    store_tokens(redis, 'demo-user', 'fitbit', tokens)
     return {'status': 'linked'}
 
 
@@ -51,8 +41,8 @@ def garmin_start() -> RedirectResponse:
 
 
 @router.get('/garmin/callback')
-def garmin_callback(code: str, state: str):
-    _store_tokens('demo-user', 'garmin', garmin.exchange_code(code))
+def garmin_callback(code: str, state: str, redis: Redis = Depends(get_redis)):
+    store_tokens(redis, 'demo-user', 'garmin', garmin.exchange_code(code))
     return {'status': 'linked'}
 
 
@@ -63,8 +53,8 @@ def oura_start() -> RedirectResponse:
 
 
 @router.get('/oura/callback')
-def oura_callback(code: str, state: str):
-    _store_tokens('demo-user', 'oura', oura.exchange_code(code))
+def oura_callback(code: str, state: str, redis: Redis = Depends(get_redis)):
+    store_tokens(redis, 'demo-user', 'oura', oura.exchange_code(code))
     return {'status': 'linked'}
 
 
@@ -75,6 +65,6 @@ def withings_start() -> RedirectResponse:
 
 
 @router.get('/withings/callback')
-def withings_callback(code: str, state: str):
-    _store_tokens('demo-user', 'withings', withings.exchange_code(code))
+def withings_callback(code: str, state: str, redis: Redis = Depends(get_redis)):
+    store_tokens(redis, 'demo-user', 'withings', withings.exchange_code(code))
     return {'status': 'linked'}
@@ -0,0 +1,35 @@
+from typing import AsyncIterator, Dict, Tuple
+import base64
+import hashlib
+import json
+from cryptography.fernet import Fernet, InvalidToken
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from ..config import get_settings
+
+# Linked vendor accounts: one Redis hash per vendor, userId -> the token set
+# Fernet-encrypted with a key derived from secret_key, so the pollers in
+# other processes (and after a restart) can read it.
+LINKS_PREFIX = 'links:'
+
+_settings = get_settings()
+_cipher = Fernet(base64.urlsafe_b64encode(hashlib.sha256(_settings.secret_key.encode()).digest()))
+
+
+def links_key(vendor: str) -> str:
+    return f'{LINKS_PREFIX}{vendor}'
+
+
+def store_tokens(redis: Redis, user_id: str, vendor: str, tokens: Dict[str, str]) -> None:
+    redis.hset(links_key(vendor), user_id, _cipher.encrypt(json.dumps(tokens).encode()))
+
+
+async def linked_accounts(redis: AsyncRedis, vendor: str, count: int = 1000) -> AsyncIterator[Tuple[str, Dict[str, str]]]:
+    # (userId, tokens) for every account linked to vendor, scanned a page at
+    # a time. Entries written under another secret_key are skipped.
+    async for user_id, sealed in redis.hscan_iter(links_key(vendor), count=count):
+        try:
+            tokens = json.loads(_cipher.decrypt(sealed))
+        except InvalidToken:
+            continue
+        yield user_id.decode() if isinstance(user_id, bytes) else user_id, tokens
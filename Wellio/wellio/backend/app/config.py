@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Literal, Optional
 from pydantic import AnyUrl
 from pydantic_settings import BaseSettings
 
@@ -6,10 +7,95 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     database_url: AnyUrl = 'postgresql+psycopg2://postgres:postgres@db:5432/wellio'
     redis_url: AnyUrl = 'redis://redis:6379/0'
+    # 'async' serves ingest and summary from async handlers on an AsyncEngine
+    # and redis.asyncio; the async URL defaults to database_url with its
+    # driver swapped (psycopg2 -> asyncpg).
+    io_mode: Literal['sync', 'async'] = 'sync'
+    async_database_url: Optional[AnyUrl] = None
+    # One Redis pool per process; requests wait up to redis_pool_timeout
+    # seconds for a free connection once redis_max_connections are in use.
+    redis_max_connections: int = 64
+    redis_pool_timeout: float = 5.0
+    redis_socket_timeout: float = 5.0
+    redis_socket_connect_timeout: float = 2.0
+    redis_health_check_interval: int = 30
     secret_key: str = 'dev-secret'
     fitbit_client_id: str = 'fitbit-client-id'
     fitbit_client_secret: str = 'fitbit-client-secret'
     fitbit_redirect_uri: AnyUrl = 'http://localhost:8000/oauth/fitbit/callback'
+    # Vendor polling (`python -m app.jobs.polling`): one keep-alive pool of
+    # poll_max_connections shared by all vendors; per vendor up to
+    # poll_*_concurrency accounts at a time, each held to the vendor's request
+    # quota. New accounts start at yesterday, stale ones catch up at most
+    # poll_max_days.
+    fitbit_api_url: str = 'https://api.fitbit.com'
+    poll_max_connections: int = 200
+    poll_timeout_s: float = 30.0
+    poll_fitbit_concurrency: int = 100
+    poll_fitbit_user_requests_per_hour: int = 150
+    poll_fitbit_app_requests_per_hour: Optional[int] = None
+    poll_max_days: int = 7
+    # Webhook signatures: Fitbit signs with fitbit_client_secret, the other
+    # vendors with these shared secrets (HMAC-SHA256, hex).
+    garmin_webhook_secret: str = 'garmin-webhook-secret'
+    oura_webhook_secret: str = 'oura-webhook-secret'
+    withings_webhook_secret: str = 'withings-webhook-secret'
+    # Verified webhook bodies go to a Redis Stream drained by
+    # `python -m app.webhooks.worker`; messages idle for webhook_claim_idle_ms
+    # are reclaimed and after webhook_max_deliveries moved to the dead letters.
+    webhook_stream_maxlen: int = 1_000_000
+    webhook_worker_batch: int = 100
+    webhook_worker_block_ms: int = 5000
+    webhook_claim_idle_ms: int = 60_000
+    webhook_max_deliveries: int = 5
+    # Bodies at least this large are decoded incrementally (ijson), one array
+    # element at a time, instead of with json.loads.
+    webhook_lazy_parse_min_bytes: int = 1024 * 1024
+    ingest_batch_max_events: int = 5000
+    # Cap on an ingest request body, both as sent and after gzip/zstd.
+    ingest_body_max_bytes: int = 8 * 1024 * 1024
+    ingest_stream_chunk_events: int = 1000
+    ingest_stream_max_line_bytes: int = 64 * 1024
+    ingest_stream_max_errors: int = 100
+    # Write-behind: accepted events are queued in-process and group-committed
+    # every write_behind_flush_ms or write_behind_flush_rows rows.
+    write_behind_enabled: bool = False
+    write_behind_max_rows: int = 50000
+    write_behind_flush_rows: int = 2000
+    write_behind_flush_ms: int = 200
+    # 'compact' stores 16-byte digests in per-user-per-hour Redis sets
+    # instead of one string key per event.
+    dedupe_keyspace: Literal['flat', 'compact'] = 'flat'
+    # Local Bloom filter + recent-keys LRU in front of the Redis dedupe keys.
+    dedupe_prefilter_enabled: bool = False
+    dedupe_prefilter_capacity: int = 5_000_000
+    dedupe_prefilter_error_rate: float = 0.001
+    dedupe_prefilter_lru_size: int = 100_000
+    dedupe_prefilter_deferred_max: int = 500
+    # Token buckets in Redis, one per userId and one per source, charged one
+    # token per event (rate in events/s). Requests over the limit get 429.
+    rate_limit_enabled: bool = False
+    rate_limit_user_rate: float = 50.0
+    rate_limit_user_burst: int = 5000
+    rate_limit_source_rate: float = 2000.0
+    rate_limit_source_burst: int = 50000
+    # Ingest requests allowed past the gate at once per process; the rest get
+    # 503. None disables the gate.
+    ingest_max_in_flight: Optional[int] = None
+    # Postgres only: range-partition events on ts by 'day' or 'month'. The
+    # scheduler keeps events_partitions_ahead future partitions and detaches
+    # (or drops) partitions older than events_retention_days.
+    events_partitioning: Optional[Literal['day', 'month']] = None
+    events_partitions_ahead: int = 7
+    events_retention_days: Optional[int] = None
+    events_partition_expiry: Literal['detach', 'drop'] = 'detach'
+    # /v1/users/{id}/hrv caches each window's metrics for hrv_cache_ttl_s
+    # once the window ended hrv_settle_s ago (windows with data only; ingest
+    # drops the entries new heart rate lands in). With hrv_nightly_enabled the
+    # scheduler fills yesterday's windows for every user with heart rate data.
+    hrv_cache_ttl_s: int = 30 * 86400
+    hrv_settle_s: int = 3600
+    hrv_nightly_enabled: bool = False
 
     model_config = {
         'env_file': '.env',
@@ -1,11 +1,47 @@
+from functools import lru_cache
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 from .config import get_settings
+from .pools import (
+    InstrumentedAsyncConnectionPool,
+    InstrumentedConnectionPool,
+    register_db_pool_metrics,
+    register_redis_pool_metrics,
+)
 
 settings = get_settings()
 engine = create_engine(str(settings.database_url), pool_pre_ping=True, future=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+register_db_pool_metrics(engine)
+
+_ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def _redis_pool_options() -> dict:
+    return {
+        'max_connections': settings.redis_max_connections,
+        'timeout': settings.redis_pool_timeout,
+        'socket_timeout': settings.redis_socket_timeout,
+        'socket_connect_timeout': settings.redis_socket_connect_timeout,
+        'health_check_interval': settings.redis_health_check_interval,
+    }
+
+
+redis_pool = InstrumentedConnectionPool.from_url(str(settings.redis_url), **_redis_pool_options())
+register_redis_pool_metrics(redis_pool)
+redis_client = Redis(connection_pool=redis_pool)
+
+
+def get_session_factory() -> sessionmaker:
+    # For work that outlives the request scope (streamed response bodies).
+    return SessionLocal
 
 
 def get_db():
@@ -17,4 +53,40 @@ def get_db():
 
 
 def get_redis() -> Redis:
-    return Redis.from_url(str(settings.redis_url))
+    return redis_client
+
+
+def async_database_url() -> str:
+    if settings.async_database_url:
+        return str(settings.async_database_url)
+    url = make_url(str(settings.database_url))
+    return url.set(drivername=_ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(hide_password=False)
+
+
+@lru_cache
+def get_async_engine() -> AsyncEngine:
+    async_engine = create_async_engine(async_database_url(), pool_pre_ping=True)
+    register_db_pool_metrics(async_engine.sync_engine, 'async_db_pool')
+    return async_engine
+
+
+@lru_cache
+def get_async_sessionmaker() -> async_sessionmaker:
+    return async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+@lru_cache
+def _async_redis_client() -> AsyncRedis:
+    # Created on first use so the pool's connections belong to the serving loop.
+    pool = InstrumentedAsyncConnectionPool.from_url(str(settings.redis_url), **_redis_pool_options())
+    register_redis_pool_metrics(pool)
+    return AsyncRedis(connection_pool=pool)
+
+
+async def get_async_redis() -> AsyncRedis:
+    return _async_redis_client()
@@ -0,0 +1,99 @@
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket
+from sqlalchemy.ext.asyncio import AsyncSession
+from redis.asyncio import Redis as AsyncRedis
+from ..config import get_settings
+from ..deps import get_async_db, get_async_redis
+from .buffer import WriteBehindBuffer, get_write_behind
+from .codecs import read_event, read_events
+from .pipeline import ingest_events_async, summarize
+from .ratelimit import ingest_gate, take_tokens_async
+from .stream import NdjsonDecoder, NdjsonError, ingest_ndjson
+from .ws import serve_ingest_ws
+
+# Same routes as ingest/router.py, served without the threadpool; main.py
+# mounts one or the other depending on Settings.io_mode.
+router = APIRouter()
+_settings = get_settings()
+
+
+async def _ingest(db: AsyncSession, redis: AsyncRedis, events: List[Any], buffer: Optional[WriteBehindBuffer]) -> List[Dict[str, str]]:
+    with ingest_gate():
+        await take_tokens_async(redis, events)
+        return await ingest_events_async(db, redis, events, buffer)
+
+
+@router.post('/telemetry', status_code=202)
+async def ingest(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    redis: AsyncRedis = Depends(get_async_redis),
+    buffer: Optional[WriteBehindBuffer] = Depends(get_write_behind),
+):
+    event = await read_event(request, _settings.ingest_body_max_bytes)
+    result = (await _ingest(db, redis, [event], buffer))[0]
+    if result['status'] == 'invalid':
+        raise HTTPException(status_code=400, detail=result['detail'])
+    return result
+
+
+@router.post('/telemetry:batch', status_code=202)
+async def ingest_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    redis: AsyncRedis = Depends(get_async_redis),
+    buffer: Optional[WriteBehindBuffer] = Depends(get_write_behind),
+):
+    events = await read_events(request, _settings.ingest_body_max_bytes)
+    if len(events) > _settings.ingest_batch_max_events:
+        raise HTTPException(
+            status_code=413,
+            detail=f'batch exceeds {_settings.ingest_batch_max_events} events',
+        )
+    return summarize(await _ingest(db, redis, events, buffer))
+
+
+@router.post('/telemetry:stream', status_code=202)
+async def ingest_stream(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    redis: AsyncRedis = Depends(get_async_redis),
+    buffer: Optional[WriteBehindBuffer] = Depends(get_write_behind),
+):
+    try:
+        decoder = NdjsonDecoder(
+            request.headers.get('content-encoding'),
+            max_line_bytes=_settings.ingest_stream_max_line_bytes,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=415, detail=str(exc)) from exc
+
+    async def ingest_chunk(events: List[Any]) -> List[Dict[str, str]]:
+        return await _ingest(db, redis, events, buffer)
+
+    try:
+        return await ingest_ndjson(
+            request.stream(),
+            decoder,
+            ingest_chunk,
+            _settings.ingest_stream_chunk_events,
+            _settings.ingest_stream_max_errors,
+        )
+    except NdjsonError as exc:
+        raise HTTPException(
+            status_code=400,
+            detail={'error': str(exc), 'line': exc.line_no, **exc.totals},
+        ) from exc
+
+
+@router.websocket('/telemetry/ws')
+async def ingest_ws(
+    websocket: WebSocket,
+    db: AsyncSession = Depends(get_async_db),
+    redis: AsyncRedis = Depends(get_async_redis),
+    buffer: Optional[WriteBehindBuffer] = Depends(get_write_behind),
+):
+    async def ingest_chunk(events: List[Any]) -> List[Dict[str, str]]:
+        return await _ingest(db, redis, events, buffer)
+
+    await serve_ingest_ws(websocket, ingest_chunk, _settings.ingest_batch_max_events)
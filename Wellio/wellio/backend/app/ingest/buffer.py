@@ -0,0 +1,211 @@
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+import logging
+import threading
+import time
+from redis import Redis
+from sqlalchemy.orm import Session
+from ..metrics import metrics
+from .pipeline import insert_rows, release_dropped
+
+logger = logging.getLogger(__name__)
+
+FLUSH_ATTEMPTS = 3
+
+# A queued row with the dedupe key (and compact-keyspace group) it was
+# marked seen under.
+_Entry = Tuple[Dict[str, Any], str, Optional[str]]
+
+
+class BufferFull(Exception):
+    pass
+
+
+class _Slot:
+    def __init__(self, buffer: 'WriteBehindBuffer', size: int):
+        self._buffer = buffer
+        self.size = size
+
+    def put(self, rows: Sequence[Dict[str, Any]], keys: Sequence[str], groups: Optional[Sequence[str]] = None) -> None:
+        self._buffer._put(list(zip(rows, keys, groups if groups is not None else [None] * len(rows))), self)
+
+
+class WriteBehindBuffer:
+    # Bounded in-process queue between ingest and Postgres. Requests reserve
+    # room before they touch Redis (so a full buffer is refused with 503 before
+    # any key is marked seen), enqueue their new rows and return; one flusher
+    # thread group-commits the queue every flush_ms or flush_rows rows.
+    # A batch that still fails after FLUSH_ATTEMPTS is split in halves until
+    # only the rows that fail on their own are left; those are dropped and
+    # their dedupe keys released, so a resend is accepted again.
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_rows: int,
+        flush_rows: int,
+        flush_ms: int,
+        name: str = 'ingest_buffer',
+        redis: Optional[Redis] = None,
+    ):
+        self._session_factory = session_factory
+        self._redis = redis
+        self._max_rows = max_rows
+        self._flush_rows = flush_rows
+        self._flush_interval = flush_ms / 1000
+        self._name = name
+        self._rows: Deque[_Entry] = deque()
+        self._reserved = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        metrics.gauge(f'{name}.queue_depth', lambda: len(self._rows))
+        metrics.gauge(f'{name}.reserved', lambda: self._reserved)
+
+    @property
+    def depth(self) -> int:
+        return len(self._rows)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @contextmanager
+    def reserve(self, size: int) -> Iterator[_Slot]:
+        with self._cond:
+            if self._stopping or len(self._rows) + self._reserved + size > self._max_rows:
+                metrics.incr(f'{self._name}.rejected')
+                raise BufferFull(f'{self._name} is full')
+            self._reserved += size
+        slot = _Slot(self, size)
+        try:
+            yield slot
+        finally:
+            with self._cond:
+                self._reserved -= slot.size
+                slot.size = 0
+
+    def _put(self, rows: Sequence[_Entry], slot: _Slot) -> None:
+        with self._cond:
+            if len(rows) > slot.size:
+                raise ValueError('rows exceed the reserved size')
+            self._rows.extend(rows)
+            self._reserved -= slot.size
+            slot.size = 0
+            if len(self._rows) >= self._flush_rows:
+                self._cond.notify()
+        metrics.incr(f'{self._name}.rows_enqueued', len(rows))
+
+    def flush(self) -> None:
+        # Synchronously drains whatever is queued; used by tests and shutdown.
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            self._write(batch)
+
+    def _take(self) -> List[_Entry]:
+        with self._cond:
+            count = min(len(self._rows), self._flush_rows)
+            return [self._rows.popleft() for _ in range(count)]
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self._flush_interval
+                while len(self._rows) < self._flush_rows and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                stopping = self._stopping
+            if stopping:
+                self.flush()
+                return
+            batch = self._take()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[_Entry]) -> None:
+        if not self._insert(batch, FLUSH_ATTEMPTS):
+            self._split(batch)
+
+    def _split(self, batch: List[_Entry]) -> None:
+        # Halves get a single attempt each; the retries above already rode
+        # out transient errors.
+        if len(batch) == 1:
+            self._drop(batch)
+            return
+        middle = len(batch) // 2
+        for part in (batch[:middle], batch[middle:]):
+            if not self._insert(part, 1):
+                self._split(part)
+
+    def _insert(self, batch: List[_Entry], attempts: int) -> bool:
+        rows = [row for row, _, _ in batch]
+        for attempt in range(1, attempts + 1):
+            started = time.perf_counter()
+            db = self._session_factory()
+            try:
+                inserted = insert_rows(db, rows)
+                db.commit()
+            except Exception:  # noqa: BLE001
+                db.rollback()
+                metrics.incr(f'{self._name}.flush_errors')
+                logger.exception('%s flush of %d rows failed (attempt %d)', self._name, len(rows), attempt)
+                if attempt < attempts:
+                    time.sleep(min(0.1 * 2 ** attempt, 2.0))
+                continue
+            finally:
+                db.close()
+            metrics.observe(f'{self._name}.flush_seconds', time.perf_counter() - started)
+            metrics.incr(f'{self._name}.flushes')
+            metrics.incr(f'{self._name}.rows_flushed', len(rows))
+            metrics.incr(f'{self._name}.rows_conflicted', len(rows) - len(inserted))
+            return True
+        return False
+
+    def _drop(self, batch: List[_Entry]) -> None:
+        metrics.incr(f'{self._name}.rows_dropped', len(batch))
+        logger.error('%s dropped %d rows: %r', self._name, len(batch), [row for row, _, _ in batch])
+        if self._redis is not None:
+            groups = [group for _, _, group in batch]
+            release_dropped(self._redis, [key for _, key, _ in batch], None if groups[0] is None else groups)
+
+
+_buffer: Optional[WriteBehindBuffer] = None
+
+
+def get_write_behind() -> Optional[WriteBehindBuffer]:
+    return _buffer
+
+
+def start_write_behind(
+    session_factory: Callable[[], Session],
+    redis: Redis,
+    max_rows: int,
+    flush_rows: int,
+    flush_ms: int,
+) -> WriteBehindBuffer:
+    global _buffer
+    if _buffer is None:
+        _buffer = WriteBehindBuffer(session_factory, max_rows, flush_rows, flush_ms, redis=redis)
+        _buffer.start()
+    return _buffer
+
+
+def stop_write_behind(timeout: Optional[float] = None) -> None:
+    global _buffer
+    if _buffer is not None:
+        _buffer.stop(timeout)
+        _buffer = None
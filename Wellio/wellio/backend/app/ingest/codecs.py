@@ -0,0 +1,206 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import io
+import json
+import zlib
+import cbor2
+import msgpack
+import numpy as np
+import zstandard
+from fastapi import HTTPException, Request
+from .rows import format_ts, format_ts_array
+
+# Request body negotiation for the ingest routes: Content-Type picks the
+# serialization (JSON, MessagePack, CBOR) and Content-Encoding an optional
+# gzip/zstd layer. Any of them may carry the columnar batch form:
+#
+#   {"userId": ..., "source": ..., "device": {...}, "kind": "heart_rate",
+#    "columns": {"ts": [...], "bpm": [...]}}
+#
+# where the shared fields are stated once and every column has one value per
+# event. ts values are ISO-8601 strings or epoch seconds; any column may also
+# be given once as a scalar at the top level (or "kind" as a column).
+
+JSON_TYPES = {'application/json'}
+MSGPACK_TYPES = {'application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack'}
+CBOR_TYPES = {'application/cbor'}
+ENCODINGS = ('identity', 'gzip', 'zstd')
+# Epoch seconds of datetime.min and datetime.max (UTC).
+_EPOCH_MIN = -62135596800
+_EPOCH_MAX = 253402300800
+
+
+class UnsupportedMediaType(ValueError):
+    pass
+
+
+class BodyError(ValueError):
+    pass
+
+
+def _media_type(content_type: Optional[str]) -> str:
+    return (content_type or 'application/json').split(';', 1)[0].strip().lower()
+
+
+def check_media(content_type: Optional[str], content_encoding: Optional[str]) -> None:
+    media_type = _media_type(content_type)
+    if media_type not in JSON_TYPES | MSGPACK_TYPES | CBOR_TYPES:
+        raise UnsupportedMediaType(f'unsupported content-type: {media_type}')
+    encoding = (content_encoding or 'identity').strip().lower()
+    if encoding not in ENCODINGS:
+        raise UnsupportedMediaType(f'unsupported content-encoding: {encoding}')
+
+
+def _decompress(body: bytes, encoding: str, max_bytes: int) -> bytes:
+    # Output is capped at max_bytes so a small compressed body cannot expand
+    # without bound.
+    if encoding == 'gzip':
+        data = _gunzip(body, max_bytes)
+    elif encoding == 'zstd':
+        # A body may hold several frames (e.g. `cat a.zst b.zst`).
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body), read_across_frames=True)
+        try:
+            data = reader.read(max_bytes + 1)
+        except zstandard.ZstdError as exc:
+            raise BodyError(f'corrupt zstd body: {exc}') from exc
+    else:
+        data = body
+    if len(data) > max_bytes:
+        raise BodyError(f'body exceeds {max_bytes} bytes')
+    return data
+
+
+def _gunzip(body: bytes, max_bytes: int) -> bytes:
+    # Concatenated gzip members (e.g. `cat a.gz b.gz`) are read back to back.
+    parts = []
+    size = 0
+    while True:
+        inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            data = inflate.decompress(body, max_bytes + 1 - size)
+        except zlib.error as exc:
+            raise BodyError(f'corrupt gzip body: {exc}') from exc
+        parts.append(data)
+        size += len(data)
+        if size > max_bytes:
+            break
+        if not inflate.eof:
+            raise BodyError('truncated gzip body')
+        body = inflate.unused_data
+        if not body:
+            break
+    return b''.join(parts)
+
+
+def decode_body(body: bytes, content_type: Optional[str], content_encoding: Optional[str], max_bytes: int) -> Any:
+    check_media(content_type, content_encoding)
+    data = _decompress(body, (content_encoding or 'identity').strip().lower(), max_bytes)
+    media_type = _media_type(content_type)
+    try:
+        if media_type in MSGPACK_TYPES:
+            return msgpack.unpackb(data, raw=False, strict_map_key=False)
+        if media_type in CBOR_TYPES:
+            return cbor2.loads(data)
+        return json.loads(data)
+    except (ValueError, msgpack.UnpackException, cbor2.CBORDecodeError) as exc:
+        raise BodyError(f'invalid {media_type} body: {exc}') from exc
+
+
+def _is_epoch(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _epoch_text(value: Any) -> Any:
+    # NaN and epochs datetime cannot represent stay numbers, which fail
+    # validation with their own row.
+    try:
+        return format_ts(datetime.fromtimestamp(value, timezone.utc))
+    except (OverflowError, OSError, ValueError):
+        return value
+
+
+def _ts_column(values: List[Any]) -> List[Any]:
+    # Epoch seconds become the same strings format_ts() produces; a whole
+    # numeric column within datetime's range is converted in one NumPy pass.
+    if values and all(_is_epoch(value) for value in values):
+        try:
+            seconds = np.asarray(values, dtype=np.float64)
+        except OverflowError:
+            seconds = None
+        if seconds is not None and bool(np.all((seconds >= _EPOCH_MIN) & (seconds < _EPOCH_MAX))):
+            return format_ts_array(np.round(seconds * 1e6).astype('datetime64[us]'))
+    return [_epoch_text(value) if _is_epoch(value) else value for value in values]
+
+
+def expand_columnar(batch: Dict[str, Any]) -> List[Any]:
+    columns = batch.get('columns')
+    if not isinstance(columns, dict) or not columns:
+        raise BodyError('columnar batch needs a non-empty "columns" object')
+    if not all(isinstance(values, list) for values in columns.values()) or len({len(v) for v in columns.values()}) != 1:
+        raise BodyError('columns must be arrays of equal length')
+    shared = {key: value for key, value in batch.items() if key != 'columns'}
+    if 'ts' in columns:
+        columns = {**columns, 'ts': _ts_column(columns['ts'])}
+    elif _is_epoch(shared.get('ts')):
+        shared['ts'] = _ts_column([shared['ts']])[0]
+    names = list(columns)
+    events = []
+    for row in zip(*(columns[name] for name in names)):
+        event = dict(shared)
+        event.update(zip(names, row))
+        events.append(event)
+    return events
+
+
+def body_events(document: Any) -> List[Any]:
+    # A list of events, one event, or a columnar batch (or a list of them).
+    if isinstance(document, dict):
+        return expand_columnar(document) if 'columns' in document else [document]
+    if isinstance(document, list):
+        events: List[Any] = []
+        for item in document:
+            if isinstance(item, dict) and 'columns' in item:
+                events.extend(expand_columnar(item))
+            else:
+                events.append(item)
+        return events
+    raise BodyError('body must be an event, a list of events or a columnar batch')
+
+
+async def read_body(request: Request, max_bytes: int) -> bytes:
+    # Raw (still encoded) bodies are capped at max_bytes as well.
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise HTTPException(status_code=413, detail=f'body exceeds {max_bytes} bytes')
+    return bytes(body)
+
+
+async def read_document(request: Request, max_bytes: int) -> Any:
+    body = await read_body(request, max_bytes)
+    try:
+        return decode_body(
+            body,
+            request.headers.get('content-type'),
+            request.headers.get('content-encoding'),
+            max_bytes,
+        )
+    except UnsupportedMediaType as exc:
+        raise HTTPException(status_code=415, detail=str(exc)) from exc
+    except BodyError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+async def read_event(request: Request, max_bytes: int) -> Dict[str, Any]:
+    document = await read_document(request, max_bytes)
+    if not isinstance(document, dict) or 'columns' in document:
+        raise HTTPException(status_code=400, detail='body must be a single event')
+    return document
+
+
+async def read_events(request: Request, max_bytes: int) -> List[Any]:
+    try:
+        return body_events(await read_document(request, max_bytes))
+    except BodyError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
@@ -1,10 +1,102 @@
+from datetime import datetime
+from typing import List, Optional, Sequence
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 
 IDEMPOTENCY_PREFIX = 'telemetry_dedupe:'
 TTL_SECONDS = 24 * 3600
 
+# Compact keyspace: instead of one string key (with its own TTL) per event,
+# the first 16 bytes of the SHA-256 digest go into a Redis set per user and
+# event hour, and the whole set expires as a unit TTL_SECONDS after its last
+# write. Callers opt in by passing a group from dedupe_group().
+COMPACT_PREFIX = 'telemetry_dedupe:g:'
+DIGEST_BYTES = 16
 
-def mark_seen(redis: Redis, key: str) -> bool:
+
+def dedupe_group(user_id: str, ts: datetime) -> str:
+    return f'{user_id}:{ts:%Y%m%d%H}'
+
+
+def _digest(key: str) -> bytes:
+    return bytes.fromhex(key[:DIGEST_BYTES * 2])
+
+
+def mark_seen(redis: Redis, key: str, group: Optional[str] = None) -> bool:
+    if group is not None:
+        return mark_seen_many(redis, [key], [group])[0]
     namespaced = f'{IDEMPOTENCY_PREFIX}{key}'
     added = redis.set(namespaced, '1', nx=True, ex=TTL_SECONDS)
     return bool(added)
+
+
+def _queue_commands(pipe, keys: Sequence[str], groups: Optional[Sequence[str]]) -> None:
+    if groups is None:
+        for key in keys:
+            pipe.set(f'{IDEMPOTENCY_PREFIX}{key}', '1', nx=True, ex=TTL_SECONDS)
+        return
+    for key, group in zip(keys, groups):
+        pipe.sadd(f'{COMPACT_PREFIX}{group}', _digest(key))
+    for group in dict.fromkeys(groups):
+        pipe.expire(f'{COMPACT_PREFIX}{group}', TTL_SECONDS)
+
+
+def _fresh(replies: Sequence, count: int) -> List[bool]:
+    # SET NX replies True/None, SADD replies 1/0; trailing EXPIRE replies
+    # are dropped.
+    return [bool(reply) for reply in replies[:count]]
+
+
+def mark_seen_many(redis: Redis, keys: Sequence[str], groups: Optional[Sequence[str]] = None) -> List[bool]:
+    if not keys:
+        return []
+    pipe = redis.pipeline(transaction=False)
+    _queue_commands(pipe, keys, groups)
+    return _fresh(pipe.execute(), len(keys))
+
+
+def _queue_release(pipe, keys: Sequence[str], groups: Optional[Sequence[str]]) -> None:
+    if groups is None:
+        for key in keys:
+            pipe.delete(f'{IDEMPOTENCY_PREFIX}{key}')
+        return
+    for key, group in zip(keys, groups):
+        pipe.srem(f'{COMPACT_PREFIX}{group}', _digest(key))
+
+
+def release_seen_many(redis: Redis, keys: Sequence[str], groups: Optional[Sequence[str]] = None) -> None:
+    # Undoes mark_seen_many for keys whose rows were never stored, so a
+    # retry of the same events is not answered as duplicate.
+    if not keys:
+        return
+    pipe = redis.pipeline(transaction=False)
+    _queue_release(pipe, keys, groups)
+    pipe.execute()
+
+
+async def mark_seen_async(redis: AsyncRedis, key: str, group: Optional[str] = None) -> bool:
+    return (await mark_seen_many_async(redis, [key], None if group is None else [group]))[0]
+
+
+async def mark_seen_many_async(
+    redis: AsyncRedis,
+    keys: Sequence[str],
+    groups: Optional[Sequence[str]] = None,
+) -> List[bool]:
+    if not keys:
+        return []
+    pipe = redis.pipeline(transaction=False)
+    _queue_commands(pipe, keys, groups)
+    return _fresh(await pipe.execute(), len(keys))
+
+
+async def release_seen_many_async(
+    redis: AsyncRedis,
+    keys: Sequence[str],
+    groups: Optional[Sequence[str]] = None,
+) -> None:
+    if not keys:
+        return
+    pipe = redis.pipeline(transaction=False)
+    _queue_release(pipe, keys, groups)
+    await pipe.execute()
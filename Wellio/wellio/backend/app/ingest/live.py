@@ -0,0 +1,30 @@
+from typing import Any, Dict, Sequence
+import json
+from .rows import event_from_row
+
+# Ingest publishes accepted events to telemetry:live:{user}; the live
+# WebSocket (users/live.py) fans them out to subscribers. Each ingest call
+# publishes at most one message per user, holding the newest event per kind.
+LIVE_PREFIX = 'telemetry:live:'
+
+
+def live_channel(user_id: str) -> str:
+    return f'{LIVE_PREFIX}{user_id}'
+
+
+def live_messages(rows: Sequence[Dict[str, Any]]) -> Dict[str, str]:
+    latest: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for row in rows:
+        by_kind = latest.setdefault(row['user_id'], {})
+        current = by_kind.get(row['kind'])
+        if current is None or row['ts'] >= current['ts']:
+            by_kind[row['kind']] = row
+    return {
+        user_id: json.dumps({'events': [event_from_row(row) for row in by_kind.values()]}, separators=(',', ':'))
+        for user_id, by_kind in latest.items()
+    }
+
+
+def queue_live(pipe, rows: Sequence[Dict[str, Any]]) -> None:
+    for user_id, message in live_messages(rows).items():
+        pipe.publish(live_channel(user_id), message)
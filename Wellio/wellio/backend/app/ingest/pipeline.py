@@ -0,0 +1,350 @@
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+import hashlib
+import logging
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from ..models import Event
+from ..config import get_settings
+from ..metrics import metrics
+from ..normalizer.batch import EventBatch
+from ..users.hrv import queue_invalidation as queue_hrv_invalidation
+from .idempotency import (
+    dedupe_group,
+    mark_seen_many,
+    mark_seen_many_async,
+    release_seen_many,
+    release_seen_many_async,
+)
+from .live import queue_live
+from .prefilter import get_seen_filter
+from .rollups import rollup_deltas, upsert_statement
+from .rows import event_row
+from .validation import batch_errors, validation_error
+from .vitals import queue_vitals, queue_vitals_async
+
+if TYPE_CHECKING:
+    from .buffer import WriteBehindBuffer
+
+# Keeps the bound parameters of one multi-row INSERT well below the
+# Postgres (65535) and SQLite (32766) limits.
+INSERT_CHUNK_ROWS = 1000
+
+_DEDUPE_COLUMNS = ['user_id', 'kind', 'ts', 'source']
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+RowIdentity = Tuple[str, str, datetime, str]
+
+_settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def _key(user_id: str, kind: str, ts: str, source: str) -> str:
+    return hashlib.sha256(f'{user_id}|{kind}|{ts}|{source}'.encode('utf-8')).hexdigest()
+
+
+def event_key(event: Dict[str, Any]) -> str:
+    # Batched events are keyed on their canonical ts text (format_ts).
+    return _key(event['userId'], event['kind'], event['ts'], event['source'])
+
+
+def row_identity(user_id: str, kind: str, ts: datetime, source: str) -> RowIdentity:
+    # Postgres hands back aware timestamps, SQLite naive ones; compare in naive UTC.
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return (user_id, kind, ts, source)
+
+
+def _insert_statements(dialect: str, rows: Sequence[Dict[str, Any]]):
+    # Multi-row INSERT ... ON CONFLICT DO NOTHING on uq_event_dedupe, returning
+    # the identity and measurements of every row actually written.
+    insert = _INSERTS[dialect]
+    for start in range(0, len(rows), INSERT_CHUNK_ROWS):
+        yield (
+            insert(Event)
+            .values(list(rows[start:start + INSERT_CHUNK_ROWS]))
+            .on_conflict_do_nothing(index_elements=_DEDUPE_COLUMNS)
+            .returning(
+                Event.user_id, Event.kind, Event.ts, Event.source,
+                Event.bpm, Event.steps, Event.dur_s, Event.stage,
+            )
+        )
+
+
+def _rollup_statements(dialect: str, written: Sequence[Any]):
+    # Rollups only count rows that were actually inserted, in the same
+    # transaction, so conflicts and rollbacks never skew them.
+    deltas = rollup_deltas(written)
+    for start in range(0, len(deltas), INSERT_CHUNK_ROWS):
+        yield upsert_statement(dialect, deltas[start:start + INSERT_CHUNK_ROWS])
+
+
+def insert_rows(db: Session, rows: Sequence[Dict[str, Any]]) -> List[RowIdentity]:
+    # The caller owns the transaction.
+    dialect = db.get_bind().dialect.name
+    written: List[Any] = []
+    for stmt in _insert_statements(dialect, rows):
+        written.extend(db.execute(stmt).all())
+    for stmt in _rollup_statements(dialect, written):
+        db.execute(stmt)
+    return [row_identity(*row[:4]) for row in written]
+
+
+async def insert_rows_async(db: AsyncSession, rows: Sequence[Dict[str, Any]]) -> List[RowIdentity]:
+    dialect = db.get_bind().dialect.name
+    written: List[Any] = []
+    for stmt in _insert_statements(dialect, rows):
+        written.extend((await db.execute(stmt)).all())
+    for stmt in _rollup_statements(dialect, written):
+        await db.execute(stmt)
+    return [row_identity(*row[:4]) for row in written]
+
+
+Results = List[Optional[Dict[str, str]]]
+Candidates = List[Tuple[int, Dict[str, Any]]]
+
+
+def _prepare(events: Sequence[Any]) -> Tuple[Results, Candidates, List[str], Optional[List[str]]]:
+    # events may mix event dicts and EventBatches; results and candidates are
+    # indexed by event, with each batch contributing len(batch) of them.
+    results: Results = []
+    candidates: Candidates = []
+    keys: List[str] = []
+    for event in events:
+        if isinstance(event, EventBatch):
+            _prepare_batch(event, results, candidates, keys)
+            continue
+        index = len(results)
+        results.append(None)
+        error = validation_error(event)
+        if error is None:
+            try:
+                candidates.append((index, event_row(event)))
+                keys.append(event_key(event))
+                continue
+            except ValueError as exc:
+                error = str(exc)
+        results[index] = {'status': 'invalid', 'detail': f'invalid telemetry: {error}'}
+    groups = None
+    if _settings.dedupe_keyspace == 'compact':
+        groups = [dedupe_group(row['user_id'], row['ts']) for _, row in candidates]
+    return results, candidates, keys, groups
+
+
+def _prepare_batch(batch: EventBatch, results: Results, candidates: Candidates, keys: List[str]) -> None:
+    offset = len(results)
+    errors = batch_errors(batch)
+    results.extend([None] * len(batch))
+    for index, error in errors.items():
+        results[offset + index] = {'status': 'invalid', 'detail': f'invalid telemetry: {error}'}
+    valid = [index for index in range(len(batch)) if index not in errors]
+    texts = batch.ts_text()
+    user_id, kind, source = batch.header['userId'], batch.kind, batch.header['source']
+    for index, row in zip(valid, batch.rows(valid)):
+        candidates.append((offset + index, row))
+        keys.append(_key(user_id, kind, texts[index], source))
+
+
+def _mark_seen(redis: Redis, keys: List[str], groups: Optional[List[str]]) -> List[bool]:
+    seen_filter = get_seen_filter()
+    if seen_filter is None:
+        return mark_seen_many(redis, keys, groups)
+    plan = seen_filter.plan(keys, groups)
+    redis_keys = plan.redis_keys
+    return plan.resolve(mark_seen_many(redis, redis_keys, plan.redis_groups) if redis_keys else [])
+
+
+async def _mark_seen_async(redis: AsyncRedis, keys: List[str], groups: Optional[List[str]]) -> List[bool]:
+    seen_filter = get_seen_filter()
+    if seen_filter is None:
+        return await mark_seen_many_async(redis, keys, groups)
+    plan = seen_filter.plan(keys, groups)
+    redis_keys = plan.redis_keys
+    return plan.resolve(await mark_seen_many_async(redis, redis_keys, plan.redis_groups) if redis_keys else [])
+
+
+def _fresh_keys(
+    keys: List[str],
+    groups: Optional[List[str]],
+    fresh: Sequence[bool],
+) -> Tuple[List[str], Optional[List[str]]]:
+    # The keys (and groups) this call marked seen.
+    marked = [index for index, is_new in enumerate(fresh) if is_new]
+    return [keys[index] for index in marked], None if groups is None else [groups[index] for index in marked]
+
+
+def _marked(
+    keys: List[str],
+    groups: Optional[List[str]],
+    fresh: Sequence[bool],
+) -> Tuple[List[str], Optional[List[str]]]:
+    # _fresh_keys(), forgotten again when the insert fails.
+    marked_keys, marked_groups = _fresh_keys(keys, groups, fresh)
+    seen_filter = get_seen_filter()
+    if seen_filter is not None:
+        seen_filter.forget(marked_keys)
+    return marked_keys, marked_groups
+
+
+def _release_seen(redis: Redis, keys: List[str], groups: Optional[List[str]], fresh: Sequence[bool]) -> None:
+    try:
+        release_seen_many(redis, *_marked(keys, groups, fresh))
+    except RedisError:
+        metrics.incr('ingest.release_errors')
+        logger.exception('releasing dedupe keys after a failed insert failed')
+
+
+def release_dropped(redis: Redis, keys: List[str], groups: Optional[List[str]]) -> None:
+    # For rows the write-behind flusher gave up on.
+    _release_seen(redis, keys, groups, [True] * len(keys))
+
+
+async def _release_seen_async(
+    redis: AsyncRedis,
+    keys: List[str],
+    groups: Optional[List[str]],
+    fresh: Sequence[bool],
+) -> None:
+    try:
+        await release_seen_many_async(redis, *_marked(keys, groups, fresh))
+    except RedisError:
+        metrics.incr('ingest.release_errors')
+        logger.exception('releasing dedupe keys after a failed insert failed')
+
+
+def _fresh_rows(results: Results, candidates: Candidates, fresh: Sequence[bool]) -> Candidates:
+    new_rows = []
+    for (index, row), is_new in zip(candidates, fresh):
+        if is_new:
+            new_rows.append((index, row))
+        else:
+            results[index] = {'status': 'duplicate'}
+    return new_rows
+
+
+def _resolve(results: Results, new_rows: Candidates, inserted: Sequence[RowIdentity]) -> List[Dict[str, str]]:
+    written = set(inserted)
+    for index, row in new_rows:
+        identity = row_identity(row['user_id'], row['kind'], row['ts'], row['source'])
+        if identity in written:
+            written.discard(identity)
+            results[index] = {'status': 'accepted'}
+        else:
+            results[index] = {'status': 'duplicate'}
+    return results  # type: ignore[return-value]
+
+
+def _accept_buffered(results: Results, new_rows: Candidates) -> List[Dict[str, str]]:
+    for index, _ in new_rows:
+        results[index] = {'status': 'accepted'}
+    return results  # type: ignore[return-value]
+
+
+def _accepted_rows(results: Sequence[Dict[str, str]], new_rows: Candidates) -> List[Dict[str, Any]]:
+    return [row for index, row in new_rows if results[index]['status'] == 'accepted']
+
+
+def _write_through(redis: Redis, rows: List[Dict[str, Any]]) -> None:
+    # Vitals cache, live fan-out and HRV cache invalidation in one round trip.
+    # Best effort: the events are already stored, so a Redis failure only
+    # delays these views.
+    if not rows:
+        return
+    try:
+        pipe = redis.pipeline(transaction=False)
+        queue_vitals(redis, pipe, rows)
+        queue_live(pipe, rows)
+        queue_hrv_invalidation(pipe, rows)
+        pipe.execute()
+    except RedisError:
+        metrics.incr('write_through.errors')
+        logger.exception('write-through of %d events failed', len(rows))
+
+
+async def _write_through_async(redis: AsyncRedis, rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        return
+    try:
+        pipe = redis.pipeline(transaction=False)
+        await queue_vitals_async(redis, pipe, rows)
+        queue_live(pipe, rows)
+        queue_hrv_invalidation(pipe, rows)
+        await pipe.execute()
+    except RedisError:
+        metrics.incr('write_through.errors')
+        logger.exception('write-through of %d events failed', len(rows))
+
+
+def ingest_events(
+    db: Session,
+    redis: Redis,
+    events: Sequence[Any],
+    buffer: Optional['WriteBehindBuffer'] = None,
+) -> List[Dict[str, str]]:
+    results, candidates, keys, groups = _prepare(events)
+    if buffer is not None:
+        # Room is reserved before Redis marks anything seen, so a BufferFull
+        # rejection leaves the events retryable.
+        with buffer.reserve(len(candidates)) as slot:
+            fresh = _mark_seen(redis, keys, groups)
+            new_rows = _fresh_rows(results, candidates, fresh)
+            slot.put([row for _, row in new_rows], *_fresh_keys(keys, groups, fresh))
+        resolved = _accept_buffered(results, new_rows)
+    else:
+        fresh = _mark_seen(redis, keys, groups)
+        new_rows = _fresh_rows(results, candidates, fresh)
+        inserted: List[RowIdentity] = []
+        if new_rows:
+            try:
+                inserted = insert_rows(db, [row for _, row in new_rows])
+                db.commit()
+            except Exception:
+                db.rollback()
+                _release_seen(redis, keys, groups, fresh)
+                raise
+        resolved = _resolve(results, new_rows, inserted)
+    _write_through(redis, _accepted_rows(resolved, new_rows))
+    return resolved
+
+
+async def ingest_events_async(
+    db: AsyncSession,
+    redis: AsyncRedis,
+    events: Sequence[Any],
+    buffer: Optional['WriteBehindBuffer'] = None,
+) -> List[Dict[str, str]]:
+    results, candidates, keys, groups = _prepare(events)
+    if buffer is not None:
+        with buffer.reserve(len(candidates)) as slot:
+            fresh = await _mark_seen_async(redis, keys, groups)
+            new_rows = _fresh_rows(results, candidates, fresh)
+            slot.put([row for _, row in new_rows], *_fresh_keys(keys, groups, fresh))
+        resolved = _accept_buffered(results, new_rows)
+    else:
+        fresh = await _mark_seen_async(redis, keys, groups)
+        new_rows = _fresh_rows(results, candidates, fresh)
+        inserted: List[RowIdentity] = []
+        if new_rows:
+            try:
+                inserted = await insert_rows_async(db, [row for _, row in new_rows])
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                await _release_seen_async(redis, keys, groups, fresh)
+                raise
+        resolved = _resolve(results, new_rows, inserted)
+    await _write_through_async(redis, _accepted_rows(resolved, new_rows))
+    return resolved
+
+
+def summarize(results: Sequence[Dict[str, str]]) -> Dict[str, Any]:
+    counts = {'accepted': 0, 'duplicate': 0, 'invalid': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return {**counts, 'results': list(results)}
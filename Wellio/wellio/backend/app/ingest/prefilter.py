@@ -0,0 +1,204 @@
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import math
+import threading
+import time
+from ..metrics import metrics
+from .idempotency import TTL_SECONDS
+
+NEW = 'new'
+SEEN = 'seen'
+MAYBE = 'maybe'
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> List[int]:
+        # Keys are already SHA-256 hex digests; double hashing over two
+        # 64-bit slices gives the k probe positions.
+        h1 = int(key[:16], 16)
+        h2 = int(key[16:32], 16) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def estimated_fp_rate(self) -> float:
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class SeenFilter:
+    # Local pre-filter in front of the Redis idempotency keys.
+    #
+    # check() answers SEEN (in the recent-keys LRU within the TTL window),
+    # NEW (in neither Bloom generation, so never added here) or MAYBE (Bloom
+    # hit, Redis has to decide). Generations rotate every window seconds, so a
+    # key is remembered for between one and two windows. NEW keys skip the
+    # Redis round trip; they are collected and published to Redis with the
+    # next pipelined call so other processes still see them. Redis and the DB
+    # unique constraint remain the authority.
+
+    def __init__(
+        self,
+        capacity: int,
+        error_rate: float,
+        lru_size: int,
+        deferred_max: int,
+        window_seconds: int = TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._lru_size = lru_size
+        self._deferred_max = deferred_max
+        self._window = window_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous: Optional[BloomFilter] = None
+        self._started = clock()
+        self._recent: 'OrderedDict[str, float]' = OrderedDict()
+        self._deferred: List[Tuple[str, Optional[str]]] = []
+        self._counts = {SEEN: 0, NEW: 0, MAYBE: 0, 'false_positives': 0, 'maybe_resolved': 0, 'rotations': 0}
+
+    def _rotate(self, now: float) -> None:
+        if now - self._started >= self._window:
+            self._previous = self._current
+            self._current = BloomFilter(self._capacity, self._error_rate)
+            self._started = now
+            self._counts['rotations'] += 1
+
+    def _check(self, key: str, now: float) -> str:
+        added = self._recent.get(key)
+        if added is not None:
+            if now - added < self._window:
+                self._recent.move_to_end(key)
+                return SEEN
+            del self._recent[key]
+        if key in self._current or (self._previous is not None and key in self._previous):
+            return MAYBE
+        return NEW
+
+    def _add(self, key: str, now: float) -> None:
+        self._current.add(key)
+        self._recent[key] = now
+        self._recent.move_to_end(key)
+        while len(self._recent) > self._lru_size:
+            self._recent.popitem(last=False)
+
+    def check(self, key: str) -> str:
+        with self._lock:
+            now = self._clock()
+            self._rotate(now)
+            return self._check(key, now)
+
+    def plan(self, keys: Sequence[str], groups: Optional[Sequence[str]] = None) -> 'DedupePlan':
+        plan = DedupePlan(self, keys, groups)
+        with self._lock:
+            now = self._clock()
+            self._rotate(now)
+            for index, key in enumerate(keys):
+                answer = self._check(key, now)
+                self._counts[answer] += 1
+                if answer == SEEN:
+                    plan.fresh[index] = False
+                elif answer == NEW:
+                    plan.fresh[index] = True
+                    self._add(key, now)
+                    self._deferred.append((key, None if groups is None else groups[index]))
+                else:
+                    plan.remote.append(index)
+            if plan.remote or len(self._deferred) >= self._deferred_max:
+                plan.publish = self._deferred
+                self._deferred = []
+        return plan
+
+    def _resolve(self, keys: Sequence[str], remote: Sequence[int], answers: Sequence[bool]) -> None:
+        with self._lock:
+            now = self._clock()
+            for index, is_new in zip(remote, answers):
+                self._counts['maybe_resolved'] += 1
+                if is_new:
+                    self._counts['false_positives'] += 1
+                self._add(keys[index], now)
+
+    def forget(self, keys: Sequence[str]) -> None:
+        # Keys released after a failed insert. They stay in the Bloom filter
+        # (so they come back as MAYBE and Redis decides) but must no longer be
+        # answered SEEN locally or published.
+        forgotten = set(keys)
+        with self._lock:
+            for key in forgotten:
+                self._recent.pop(key, None)
+            self._deferred = [item for item in self._deferred if item[0] not in forgotten]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counts = dict(self._counts)
+            estimated = self._current.estimated_fp_rate()
+            age = self._clock() - self._started
+            deferred = len(self._deferred)
+        checked = counts[SEEN] + counts[NEW] + counts[MAYBE]
+        return {
+            **counts,
+            'checked': checked,
+            'answered_locally': (counts[SEEN] + counts[NEW]) / checked if checked else 0.0,
+            'observed_fp_rate': counts['false_positives'] / counts['maybe_resolved'] if counts['maybe_resolved'] else 0.0,
+            'estimated_fp_rate': estimated,
+            'generation_age_s': age,
+            'deferred': deferred,
+        }
+
+
+class DedupePlan:
+    def __init__(self, seen_filter: SeenFilter, keys: Sequence[str], groups: Optional[Sequence[str]]):
+        self._filter = seen_filter
+        self._keys = keys
+        self._groups = groups
+        self.fresh: List[Optional[bool]] = [None] * len(keys)
+        self.remote: List[int] = []
+        self.publish: List[Tuple[str, Optional[str]]] = []
+
+    @property
+    def redis_keys(self) -> List[str]:
+        # Keys whose answer is needed first, then deferred NEW keys being
+        # published (their answers are ignored).
+        return [self._keys[index] for index in self.remote] + [key for key, _ in self.publish]
+
+    @property
+    def redis_groups(self) -> Optional[List[str]]:
+        if self._groups is None:
+            return None
+        return [self._groups[index] for index in self.remote] + [group for _, group in self.publish]  # type: ignore[misc]
+
+    def resolve(self, answers: Sequence[bool]) -> List[bool]:
+        remote_answers = answers[:len(self.remote)]
+        for index, is_new in zip(self.remote, remote_answers):
+            self.fresh[index] = is_new
+        self._filter._resolve(self._keys, self.remote, remote_answers)
+        return self.fresh  # type: ignore[return-value]
+
+
+_filter: Optional[SeenFilter] = None
+
+
+def get_seen_filter() -> Optional[SeenFilter]:
+    return _filter
+
+
+def configure_seen_filter(seen_filter: Optional[SeenFilter]) -> None:
+    global _filter
+    _filter = seen_filter
+    if seen_filter is not None:
+        metrics.gauge('dedupe_prefilter.stats', seen_filter.stats)
@@ -0,0 +1,230 @@
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import logging
+import math
+import threading
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+from ..metrics import metrics
+
+RATE_LIMIT_PREFIX = 'ratelimit:'
+
+logger = logging.getLogger(__name__)
+
+# Token buckets stored as hashes {tokens, ts}, refilled lazily from the Redis
+# clock so every API process shares one time source. All buckets touched by
+# a request are checked first and only debited if every one of them allows
+# it, so a rejected request costs nothing. A request may cost more than a
+# bucket's burst (a large batch): it is let through once the bucket holds
+# min(cost, burst) tokens and leaves the bucket in debt.
+#
+# KEYS: bucket hashes. ARGV: rate, burst, cost for each key in turn.
+# Returns {allowed, wait in ms, 1-based index of the bucket that refused}.
+_TAKE = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local levels = {}
+local wait = 0
+local refused = 0
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[i * 3 - 2])
+  local burst = tonumber(ARGV[i * 3 - 1])
+  local cost = tonumber(ARGV[i * 3])
+  local state = redis.call('HMGET', key, 'tokens', 'ts')
+  local level = tonumber(state[1]) or burst
+  local last = tonumber(state[2]) or now
+  level = math.min(burst, level + math.max(0, now - last) * rate)
+  levels[i] = level
+  local needed = math.min(cost, burst)
+  if level < needed then
+    local key_wait = (needed - level) / rate
+    if key_wait > wait then
+      wait = key_wait
+      refused = i
+    end
+  end
+end
+if refused > 0 then
+  return {0, math.ceil(wait * 1000), refused}
+end
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[i * 3 - 2])
+  local burst = tonumber(ARGV[i * 3 - 1])
+  local level = levels[i] - tonumber(ARGV[i * 3])
+  redis.call('HSET', key, 'tokens', tostring(level), 'ts', tostring(now))
+  -- Once refilled to burst the bucket is indistinguishable from a missing one.
+  redis.call('PEXPIRE', key, math.ceil((burst - level) / rate * 1000) + 1000)
+end
+return {1, 0, 0}
+"""
+
+
+class RateLimited(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f'{scope} rate limit exceeded')
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: float = 1):
+        super().__init__('ingest is at capacity')
+        self.retry_after = retry_after
+
+
+Bucket = Tuple[str, str, int]
+
+
+class RateLimiter:
+    # Per-user and per-source buckets, charged one token per event.
+
+    def __init__(self, user_rate: float, user_burst: int, source_rate: float, source_burst: int):
+        self._limits = {
+            'user': (user_rate, user_burst),
+            'source': (source_rate, source_burst),
+        }
+
+    def buckets(self, events: Sequence[Any]) -> List[Bucket]:
+        # Events without a usable userId/source are invalid and never reach
+        # the database, so they are not charged.
+        costs: Counter = Counter()
+        for event in events:
+            if not isinstance(event, dict):
+                continue
+            for scope, field in (('user', 'userId'), ('source', 'source')):
+                value = event.get(field)
+                if isinstance(value, str) and value:
+                    costs[(scope, value)] += 1
+        return [(scope, value, cost) for (scope, value), cost in costs.items()]
+
+    def _script_args(self, buckets: Sequence[Bucket]) -> Tuple[List[str], List[Any]]:
+        keys: List[str] = []
+        args: List[Any] = []
+        for scope, value, cost in buckets:
+            rate, burst = self._limits[scope]
+            keys.append(f'{RATE_LIMIT_PREFIX}{scope}:{value}')
+            args.extend((rate, burst, cost))
+        return keys, args
+
+    def _decide(self, buckets: Sequence[Bucket], reply: Sequence[int]) -> None:
+        allowed, wait_ms, refused = (int(value) for value in reply)
+        events = sum(cost for scope, _, cost in buckets if scope == 'user')
+        if allowed:
+            metrics.incr('ratelimit.allowed')
+            metrics.incr('ratelimit.allowed_events', events)
+            return
+        scope = buckets[refused - 1][0]
+        metrics.incr(f'ratelimit.limited.{scope}')
+        metrics.incr('ratelimit.limited_events', events)
+        metrics.observe('ratelimit.retry_after', wait_ms / 1000)
+        raise RateLimited(scope, wait_ms / 1000)
+
+    def take(self, redis: Redis, events: Sequence[Any]) -> None:
+        buckets = self.buckets(events)
+        if not buckets:
+            return
+        keys, args = self._script_args(buckets)
+        try:
+            reply = redis.eval(_TAKE, len(keys), *keys, *args)
+        except RedisError:
+            # Fail open: dedupe needs Redis too and will surface the outage.
+            metrics.incr('ratelimit.errors')
+            logger.exception('rate limit check failed')
+            return
+        self._decide(buckets, reply)
+
+    async def take_async(self, redis: AsyncRedis, events: Sequence[Any]) -> None:
+        buckets = self.buckets(events)
+        if not buckets:
+            return
+        keys, args = self._script_args(buckets)
+        try:
+            reply = await redis.eval(_TAKE, len(keys), *keys, *args)
+        except RedisError:
+            metrics.incr('ratelimit.errors')
+            logger.exception('rate limit check failed')
+            return
+        self._decide(buckets, reply)
+
+
+async def reserve_async(redis: AsyncRedis, limits: Sequence[Tuple[str, float, int]], cost: int = 1) -> float:
+    # cost tokens from every bucket in limits, (name, rate per second, burst),
+    # for clients of other rate-limited services such as the vendor pollers.
+    # Returns 0 once taken, or the seconds until they would be; fails open.
+    if not limits:
+        return 0.0
+    keys = [f'{RATE_LIMIT_PREFIX}{name}' for name, _, _ in limits]
+    args: List[Any] = []
+    for _, rate, burst in limits:
+        args.extend((rate, burst, cost))
+    try:
+        allowed, wait_ms, _ = await redis.eval(_TAKE, len(keys), *keys, *args)
+    except RedisError:
+        metrics.incr('ratelimit.errors')
+        logger.exception('rate limit check failed')
+        return 0.0
+    return 0.0 if int(allowed) else int(wait_ms) / 1000
+
+
+class ConcurrencyGate:
+    # Caps ingest requests doing Redis/DB work at once in this process; the
+    # rest are shed with 503 instead of queueing on the connection pools.
+
+    def __init__(self, limit: int, name: str = 'ingest_gate'):
+        self._limit = limit
+        self._name = name
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        metrics.gauge(f'{name}.in_flight', lambda: self.in_flight)
+
+    @contextmanager
+    def enter(self) -> Iterator[None]:
+        with self._lock:
+            if self.in_flight >= self._limit:
+                metrics.incr(f'{self._name}.rejected')
+                raise Overloaded()
+            self.in_flight += 1
+        metrics.incr(f'{self._name}.admitted')
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+_limiter: Optional[RateLimiter] = None
+_gate: Optional[ConcurrencyGate] = None
+
+
+def configure_rate_limits(limiter: Optional[RateLimiter]) -> None:
+    global _limiter
+    _limiter = limiter
+
+
+def configure_ingest_gate(gate: Optional[ConcurrencyGate]) -> None:
+    global _gate
+    _gate = gate
+
+
+def take_tokens(redis: Redis, events: Sequence[Any]) -> None:
+    if _limiter is not None:
+        _limiter.take(redis, events)
+
+
+async def take_tokens_async(redis: AsyncRedis, events: Sequence[Any]) -> None:
+    if _limiter is not None:
+        await _limiter.take_async(redis, events)
+
+
+@contextmanager
+def ingest_gate() -> Iterator[None]:
+    if _gate is None:
+        yield
+        return
+    with _gate.enter():
+        yield
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {'Retry-After': str(max(1, math.ceil(seconds)))}
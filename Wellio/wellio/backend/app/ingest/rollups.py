@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Tuple
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from ..models import EventRollup
+
+GRANULARITIES = ('hour', 'day')
+SLEEP_STAGES = ('light', 'deep', 'rem', 'awake')
+_SUM_COLUMNS = ['count', 'bpm_sum', 'steps_total'] + [f'sleep_{stage}_s' for stage in SLEEP_STAGES]
+
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+# SQLite's scalar min()/max() take several arguments like least()/greatest(),
+# but return NULL if any of them is NULL, hence the coalesce in both.
+_LEAST = {'postgresql': func.least, 'sqlite': func.min}
+_GREATEST = {'postgresql': func.greatest, 'sqlite': func.max}
+
+BucketKey = Tuple[str, str, str, datetime]
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    ts = ts.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        ts = ts.replace(hour=0)
+    return ts
+
+
+def _empty(key: BucketKey) -> Dict[str, Any]:
+    user_id, kind, granularity, start = key
+    delta: Dict[str, Any] = {column: 0 for column in _SUM_COLUMNS}
+    delta.update(user_id=user_id, kind=kind, granularity=granularity, bucket_start=start, bpm_min=None, bpm_max=None)
+    return delta
+
+
+def rollup_deltas(rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    # rows carry user_id, kind, ts, bpm, steps, dur_s and stage (inserted
+    # event rows or RETURNING tuples). Deltas come back sorted by key so
+    # concurrent upserts lock rollup rows in the same order.
+    deltas: Dict[BucketKey, Dict[str, Any]] = {}
+    for row in rows:
+        for granularity in GRANULARITIES:
+            key = (row.user_id, row.kind, granularity, bucket_start(row.ts, granularity))
+            delta = deltas.get(key)
+            if delta is None:
+                delta = deltas[key] = _empty(key)
+            delta['count'] += 1
+            if row.bpm is not None:
+                delta['bpm_sum'] += row.bpm
+                delta['bpm_min'] = row.bpm if delta['bpm_min'] is None else min(delta['bpm_min'], row.bpm)
+                delta['bpm_max'] = row.bpm if delta['bpm_max'] is None else max(delta['bpm_max'], row.bpm)
+            if row.steps is not None:
+                delta['steps_total'] += row.steps
+            if row.dur_s is not None and row.stage in SLEEP_STAGES:
+                delta[f'sleep_{row.stage}_s'] += row.dur_s
+    return [deltas[key] for key in sorted(deltas)]
+
+
+def upsert_statement(dialect: str, deltas: List[Dict[str, Any]]):
+    stmt = _INSERTS[dialect](EventRollup).values(deltas)
+    table = EventRollup.__table__
+    least, greatest = _LEAST[dialect], _GREATEST[dialect]
+    updates = {column: table.c[column] + stmt.excluded[column] for column in _SUM_COLUMNS}
+    updates['bpm_min'] = least(
+        func.coalesce(table.c.bpm_min, stmt.excluded.bpm_min),
+        func.coalesce(stmt.excluded.bpm_min, table.c.bpm_min),
+    )
+    updates['bpm_max'] = greatest(
+        func.coalesce(table.c.bpm_max, stmt.excluded.bpm_max),
+        func.coalesce(stmt.excluded.bpm_max, table.c.bpm_max),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=['user_id', 'kind', 'granularity', 'bucket_start'],
+        set_=updates,
+    )
@@ -1,54 +1,100 @@
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
 from redis import Redis
-from jsonschema import Draft7Validator, ValidationError
-from pathlib import Path
-import hashlib
-import json
+from ..config import get_settings
 from ..deps import get_db, get_redis
-from ..models import Event
-from .idempotency import mark_seen
+from .buffer import WriteBehindBuffer, get_write_behind
+from .codecs import read_event, read_events
+from .pipeline import ingest_events, summarize
+from .ratelimit import ingest_gate, take_tokens
+from .stream import NdjsonDecoder, NdjsonError, ingest_ndjson
+from .ws import serve_ingest_ws
 
 router = APIRouter()
+_settings = get_settings()
 
-_schema_path = Path(__file__).resolve().parents[3] / 'shared' / 'schemas' / 'telemetry.schema.json'
-with _schema_path.open('r', encoding='utf-8') as fh:
-    _schema = json.load(fh)
-_validator = Draft7Validator(_schema)
+
+async def _ingest(db: Session, redis: Redis, events: List[Any], buffer: Optional[WriteBehindBuffer]) -> List[Dict[str, str]]:
+    # The concurrency gate comes first, so a request shed with 503 spends no
+    # tokens; both are checked before any dedupe key or row is written.
+    with ingest_gate():
+        await run_in_threadpool(take_tokens, redis, events)
+        return await run_in_threadpool(ingest_events, db, redis, events, buffer)
 
 
 @router.post('/telemetry', status_code=202)
-def ingest(event: dict, db: Session = Depends(get_db), redis: Redis = Depends(get_redis)):
+async def ingest(
+    request: Request,
+    db: Session = Depends(get_db),
+    redis: Redis = Depends(get_redis),
+    buffer: Optional[WriteBehindBuffer] = Depends(get_write_behind),
+):
+    event = await read_event(request, _settings.ingest_body_max_bytes)
+    result = (await _ingest(db, redis, [event], buffer))[0]
+    if result['status'] == 'invalid':
+        raise HTTPException(status_code=400, detail=result['detail'])
+    return result
+
+
+@router.post('/telemetry:batch', status_code=202)
+async def ingest_batch(
+    request: Request,
+    db: Session = Depends(get_db),
+    redis: Redis = Depends(get_redis),
+    buffer: Optional[WriteBehindBuffer] = Depends(get_write_behind),
+):
+    events = await read_events(request, _settings.ingest_body_max_bytes)
+    if len(events) > _settings.ingest_batch_max_events:
+        raise HTTPException(
+            status_code=413,
+            detail=f'batch exceeds {_settings.ingest_batch_max_events} events',
+        )
+    return summarize(await _ingest(db, redis, events, buffer))
+
+
+@router.post('/telemetry:stream', status_code=202)
+async def ingest_stream(
+    request: Request,
+    db: Session = Depends(get_db),
+    redis: Redis = Depends(get_redis),
+    buffer: Optional[WriteBehindBuffer] = Depends(get_write_behind),
+):
     try:
-        _validator.validate(event)
-    except ValidationError as exc:
-        raise HTTPException(status_code=400, detail=f'invalid telemetry: {exc.message}') from exc
-
-    key = hashlib.sha256(
-        f"{event['userId']}|{event['kind']}|{event['ts']}|{event['source']}".encode('utf-8')
-    ).hexdigest()
-
-    if not mark_seen(redis, key):
-        return {'status': 'duplicate'}
-
-    device = event.get('device', {})
-    db_event = Event(
-        user_id=event['userId'],
-        kind=event['kind'],
-        ts=datetime.fromisoformat(event['ts'].replace('Z', '+00:00')),
-        source=event['source'],
-        device_vendor=device.get('vendor'),
-        device_model=device.get('model'),
-        payload=event,
-    )
-
-    db.add(db_event)
+        decoder = NdjsonDecoder(
+            request.headers.get('content-encoding'),
+            max_line_bytes=_settings.ingest_stream_max_line_bytes,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=415, detail=str(exc)) from exc
+
+    async def ingest_chunk(events: List[Any]) -> List[Dict[str, str]]:
+        return await _ingest(db, redis, events, buffer)
+
     try:
-        db.commit()
-    except IntegrityError:
-        db.rollback()
-        return {'status': 'duplicate'}
+        return await ingest_ndjson(
+            request.stream(),
+            decoder,
+            ingest_chunk,
+            _settings.ingest_stream_chunk_events,
+            _settings.ingest_stream_max_errors,
+        )
+    except NdjsonError as exc:
+        raise HTTPException(
+            status_code=400,
+            detail={'error': str(exc), 'line': exc.line_no, **exc.totals},
+        ) from exc
+
+
+@router.websocket('/telemetry/ws')
+async def ingest_ws(
+    websocket: WebSocket,
+    db: Session = Depends(get_db),
+    redis: Redis = Depends(get_redis),
+    buffer: Optional[WriteBehindBuffer] = Depends(get_write_behind),
+):
+    async def ingest_chunk(events: List[Any]) -> List[Dict[str, str]]:
+        return await _ingest(db, redis, events, buffer)
 
-    return {'status': 'accepted'}
+    await serve_ingest_ws(websocket, ingest_chunk, _settings.ingest_batch_max_events)
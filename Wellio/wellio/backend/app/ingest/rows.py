@@ -0,0 +1,85 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+import numpy as np
+
+# Conversion between canonical telemetry events and events table rows.
+
+
+def parse_ts(value: str) -> datetime:
+    ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc)
+    return ts
+
+
+def format_ts(ts: datetime) -> str:
+    # SQLite hands back naive timestamps, which are stored in UTC.
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts.isoformat() + 'Z'
+
+
+def format_ts_array(values: np.ndarray) -> List[str]:
+    # format_ts() for a datetime64 array of naive UTC instants.
+    return [
+        text[:-7] + 'Z' if text.endswith('.000000') else text + 'Z'
+        for text in np.datetime_as_string(values.astype('datetime64[us]'), unit='us').tolist()
+    ]
+
+
+MEASUREMENT_COLUMNS = ['bpm', 'steps', 'dur_s', 'stage']
+_COLUMN_FIELDS = {'userId', 'kind', 'ts', 'source', 'device', *MEASUREMENT_COLUMNS}
+_DEVICE_COLUMNS = {'vendor': 'device_vendor', 'model': 'device_model'}
+
+
+def split_payload(event: Dict[str, Any]) -> Dict[str, Any]:
+    # The part of an event that has no column of its own.
+    rest = {key: value for key, value in event.items() if key not in _COLUMN_FIELDS}
+    device = {key: value for key, value in event.get('device', {}).items() if key not in _DEVICE_COLUMNS}
+    if device:
+        rest['device'] = device
+    return rest
+
+
+def event_row(event: Dict[str, Any]) -> Dict[str, Any]:
+    device = event.get('device', {})
+    row = {
+        'user_id': event['userId'],
+        'kind': event['kind'],
+        'ts': parse_ts(event['ts']),
+        'source': event['source'],
+        'device_vendor': device.get('vendor'),
+        'device_model': device.get('model'),
+        'payload': split_payload(event),
+    }
+    for column in MEASUREMENT_COLUMNS:
+        row[column] = event.get(column)
+    return row
+
+
+def _number(value: Any) -> Any:
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def event_from_row(row: Any) -> Dict[str, Any]:
+    # Inverse of event_row() for an event_row() dict, a result row or an
+    # Event instance.
+    get = row.get if isinstance(row, dict) else lambda name: getattr(row, name)
+    payload = dict(get('payload') or {})
+    device = {column: get(name) for column, name in _DEVICE_COLUMNS.items() if get(name) is not None}
+    device.update(payload.pop('device', {}))
+    event: Dict[str, Any] = {
+        'kind': get('kind'),
+        'userId': get('user_id'),
+        'device': device,
+        'source': get('source'),
+        'ts': format_ts(get('ts')),
+    }
+    for column in MEASUREMENT_COLUMNS:
+        value = get(column)
+        if value is not None:
+            event[column] = _number(value)
+    event.update(payload)
+    return event
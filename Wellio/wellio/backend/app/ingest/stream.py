@@ -0,0 +1,138 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+import json
+import zlib
+
+# Upper bound on the bytes inflated from a single gzip input chunk before the
+# decoder hands lines back; keeps a compressed bomb from expanding in one go.
+INFLATE_STEP_BYTES = 64 * 1024
+
+
+class NdjsonError(ValueError):
+    def __init__(self, message: str, line_no: int):
+        super().__init__(message)
+        self.line_no = line_no
+        self.totals: Dict[str, Any] = {}
+
+
+class NdjsonDecoder:
+    # Incremental NDJSON splitter: feed raw (optionally gzip'd) body chunks,
+    # get back complete (line number, line) pairs. Holds at most one partial
+    # line plus one inflate step in memory.
+
+    def __init__(self, content_encoding: Optional[str] = None, max_line_bytes: int = 64 * 1024):
+        encoding = (content_encoding or 'identity').strip().lower()
+        if encoding not in ('identity', 'gzip'):
+            raise ValueError(f'unsupported content-encoding: {encoding}')
+        self._gzip = encoding == 'gzip'
+        self._inflate = self._new_inflate() if self._gzip else None
+        self._max_line_bytes = max_line_bytes
+        self._buffer = bytearray()
+        self._received = False
+        self.line_no = 0
+
+    @staticmethod
+    def _new_inflate():
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def feed(self, chunk: bytes) -> Iterator[Tuple[int, bytes]]:
+        if not self._gzip:
+            yield from self._split(chunk)
+            return
+        self._received = self._received or bool(chunk)
+        while chunk:
+            try:
+                data = self._inflate.decompress(chunk, INFLATE_STEP_BYTES)
+            except zlib.error as exc:
+                raise NdjsonError(f'corrupt gzip stream: {exc}', self.line_no) from exc
+            chunk = self._inflate.unconsumed_tail
+            if self._inflate.eof and self._inflate.unused_data:
+                # Concatenated gzip members (e.g. `cat a.gz b.gz`).
+                chunk = self._inflate.unused_data + chunk
+                self._inflate = self._new_inflate()
+            yield from self._split(data)
+
+    def close(self) -> Iterator[Tuple[int, bytes]]:
+        if self._gzip:
+            if self._received and not self._inflate.eof:
+                raise NdjsonError('truncated gzip stream', self.line_no)
+            yield from self._split(self._inflate.flush())
+        if self._buffer.strip():
+            self.line_no += 1
+            line = bytes(self._buffer)
+            self._buffer.clear()
+            yield self.line_no, line
+        self._buffer.clear()
+
+    def _split(self, data: bytes) -> Iterator[Tuple[int, bytes]]:
+        if not data:
+            return
+        self._buffer += data
+        start = 0
+        while True:
+            end = self._buffer.find(b'\n', start)
+            if end < 0:
+                break
+            self.line_no += 1
+            line = bytes(self._buffer[start:end])
+            start = end + 1
+            if len(line) > self._max_line_bytes:
+                raise NdjsonError(f'line exceeds {self._max_line_bytes} bytes', self.line_no)
+            if line.strip():
+                yield self.line_no, line
+        del self._buffer[:start]
+        if len(self._buffer) > self._max_line_bytes:
+            raise NdjsonError(f'line exceeds {self._max_line_bytes} bytes', self.line_no + 1)
+
+
+IngestChunk = Callable[[List[Any]], Awaitable[List[Dict[str, str]]]]
+
+
+async def ingest_ndjson(
+    body: AsyncIterator[bytes],
+    decoder: NdjsonDecoder,
+    ingest_chunk: IngestChunk,
+    chunk_events: int,
+    max_errors: int,
+) -> Dict[str, Any]:
+    totals: Dict[str, Any] = {'accepted': 0, 'duplicate': 0, 'invalid': 0, 'errors': []}
+    chunk: List[Any] = []
+    line_nos: List[int] = []
+
+    def record_error(line_no: int, detail: str) -> None:
+        totals['invalid'] += 1
+        if len(totals['errors']) < max_errors:
+            totals['errors'].append({'line': line_no, 'detail': detail})
+
+    async def flush() -> None:
+        if not chunk:
+            return
+        results = await ingest_chunk(list(chunk))
+        for line_no, result in zip(line_nos, results):
+            if result['status'] == 'invalid':
+                record_error(line_no, result['detail'])
+            else:
+                totals[result['status']] += 1
+        chunk.clear()
+        line_nos.clear()
+
+    async def consume(lines: Iterator[Tuple[int, bytes]]) -> None:
+        for line_no, line in lines:
+            try:
+                chunk.append(json.loads(line))
+                line_nos.append(line_no)
+            except ValueError as exc:
+                record_error(line_no, f'invalid json: {exc}')
+                continue
+            if len(chunk) >= chunk_events:
+                await flush()
+
+    try:
+        async for body_chunk in body:
+            await consume(decoder.feed(body_chunk))
+        await consume(decoder.close())
+    except NdjsonError as exc:
+        await flush()
+        exc.totals = totals
+        raise
+    await flush()
+    return totals
@@ -0,0 +1,249 @@
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+import json
+import numbers
+import numpy as np
+from jsonschema import Draft7Validator
+
+if TYPE_CHECKING:
+    from ..normalizer.batch import EventBatch
+
+_schema_path = Path(__file__).resolve().parents[3] / 'shared' / 'schemas' / 'telemetry.schema.json'
+with _schema_path.open('r', encoding='utf-8') as fh:
+    _schema = json.load(fh)
+_validator = Draft7Validator(_schema)
+
+# The schema file stays the single source of truth. At import time every
+# `oneOf` branch is turned into a plain Python predicate keyed by its `kind`
+# const, so a valid event costs one dict lookup and one straight-line check
+# instead of a trial of every branch. The predicate only answers valid /
+# invalid; error messages still come from _validator so they are unchanged.
+
+_ROOT_KEYWORDS = {'$schema', 'title', 'description', 'oneOf', 'definitions'}
+_IGNORED_KEYWORDS = {'title', 'description', '$schema', '$comment', 'definitions', 'format'}
+_TYPE_CHECKS = {
+    'object': 'isinstance({v}, dict)',
+    'array': 'isinstance({v}, list)',
+    'string': 'isinstance({v}, str)',
+    'boolean': 'isinstance({v}, bool)',
+    'null': '{v} is None',
+    'number': '(isinstance({v}, _Number) and not isinstance({v}, bool))',
+    'integer': (
+        '((isinstance({v}, int) and not isinstance({v}, bool))'
+        ' or (isinstance({v}, float) and {v}.is_integer()))'
+    ),
+}
+_NUMERIC_BOUNDS = {
+    'minimum': '<',
+    'maximum': '>',
+    'exclusiveMinimum': '<=',
+    'exclusiveMaximum': '>=',
+}
+_MISSING = object()
+
+
+class _Unsupported(Exception):
+    pass
+
+
+class _Compiler:
+    def __init__(self, root: Dict[str, Any]):
+        self._root = root
+        self._lines: List[str] = []
+        self._names = 0
+        self.namespace: Dict[str, Any] = {'_Number': numbers.Number, '_MISSING': _MISSING}
+
+    def compile(self, schema: Any, name: str) -> Callable[[Any], bool]:
+        self._lines = [f'def {name}(v0):']
+        self._emit(schema, 'v0', 1, depth=0)
+        self._lines.append('    return True')
+        self.source = '\n'.join(self._lines)
+        exec(compile(self.source, f'<telemetry-schema:{name}>', 'exec'), self.namespace)  # noqa: S102
+        return self.namespace[name]
+
+    def _var(self) -> str:
+        self._names += 1
+        return f'v{self._names}'
+
+    def _const(self, value: Any) -> str:
+        self._names += 1
+        name = f'_c{self._names}'
+        self.namespace[name] = value
+        return name
+
+    def _line(self, indent: int, text: str) -> None:
+        self._lines.append('    ' * indent + text)
+
+    def _fail_unless(self, indent: int, condition: str) -> None:
+        self._line(indent, f'if not ({condition}):')
+        self._line(indent + 1, 'return False')
+
+    def _resolve(self, ref: str) -> Any:
+        if not ref.startswith('#/'):
+            raise _Unsupported(ref)
+        node = self._root
+        for part in ref[2:].split('/'):
+            node = node[part]
+        return node
+
+    def _emit(self, schema: Any, v: str, indent: int, depth: int) -> None:
+        if depth > 32 or not isinstance(schema, dict):
+            raise _Unsupported(schema)
+        if '$ref' in schema:
+            # Draft 7: siblings of $ref are ignored.
+            self._emit(self._resolve(schema['$ref']), v, indent, depth + 1)
+            return
+
+        keywords = set(schema) - _IGNORED_KEYWORDS
+        handled = {'type', 'const', 'enum', 'properties', 'required', 'additionalProperties', 'items'}
+        handled |= set(_NUMERIC_BOUNDS)
+        if keywords - handled:
+            raise _Unsupported(keywords - handled)
+
+        declared = schema.get('type')
+        types = [declared] if isinstance(declared, str) else list(declared or [])
+        if types:
+            if any(t not in _TYPE_CHECKS for t in types):
+                raise _Unsupported(types)
+            self._fail_unless(indent, ' or '.join(_TYPE_CHECKS[t].format(v=v) for t in types))
+
+        if 'const' in schema:
+            if not isinstance(schema['const'], str):
+                raise _Unsupported(schema['const'])
+            self._fail_unless(indent, f"isinstance({v}, str) and {v} == {self._const(schema['const'])}")
+        if 'enum' in schema:
+            if not all(isinstance(item, str) for item in schema['enum']):
+                raise _Unsupported(schema['enum'])
+            self._fail_unless(indent, f"isinstance({v}, str) and {v} in {self._const(frozenset(schema['enum']))}")
+
+        bounds = [(key, op) for key, op in _NUMERIC_BOUNDS.items() if key in schema]
+        if bounds:
+            inner = indent
+            if not types or any(t not in ('number', 'integer') for t in types):
+                self._line(indent, f"if {_TYPE_CHECKS['number'].format(v=v)}:")
+                inner = indent + 1
+            for key, op in bounds:
+                self._line(inner, f'if {v} {op} {self._const(schema[key])}:')
+                self._line(inner + 1, 'return False')
+
+        object_keys = {'properties', 'required', 'additionalProperties'} & keywords
+        if object_keys:
+            inner = indent
+            if types != ['object']:
+                self._line(indent, f'if isinstance({v}, dict):')
+                inner = indent + 1
+            self._emit_object(schema, v, inner, depth)
+
+        if 'items' in schema:
+            inner = indent
+            if types != ['array']:
+                self._line(indent, f'if isinstance({v}, list):')
+                inner = indent + 1
+            item = self._var()
+            self._line(inner, f'for {item} in {v}:')
+            self._emit(schema['items'], item, inner + 1, depth + 1)
+
+    def _emit_object(self, schema: Dict[str, Any], v: str, indent: int, depth: int) -> None:
+        properties = schema.get('properties', {})
+        required = schema.get('required', [])
+        additional = schema.get('additionalProperties', True)
+        if additional is False:
+            self._fail_unless(indent, f'{v}.keys() <= {self._const(frozenset(properties))}')
+        elif additional is not True:
+            raise _Unsupported(additional)
+        if required:
+            self._fail_unless(indent, ' and '.join(f'{self._const(key)} in {v}' for key in required))
+        for key, subschema in properties.items():
+            child = self._var()
+            if key in required:
+                self._line(indent, f'{child} = {v}[{self._const(key)}]')
+                self._emit(subschema, child, indent, depth + 1)
+            else:
+                self._line(indent, f'{child} = {v}.get({self._const(key)}, _MISSING)')
+                self._line(indent, f'if {child} is not _MISSING:')
+                mark = len(self._lines)
+                self._emit(subschema, child, indent + 1, depth + 1)
+                if len(self._lines) == mark:
+                    self._line(indent + 1, 'pass')
+
+
+def _compile_kinds(root: Dict[str, Any]) -> Dict[str, Callable[[Any], bool]]:
+    if set(root) - _ROOT_KEYWORDS:
+        return {}
+    checks: Dict[str, Callable[[Any], bool]] = {}
+    for index, branch in enumerate(root.get('oneOf', [])):
+        kind = branch.get('properties', {}).get('kind', {}).get('const')
+        if not isinstance(kind, str) or 'kind' not in branch.get('required', []) or kind in checks:
+            return {}
+        try:
+            checks[kind] = _Compiler(root).compile(branch, f'check_{index}')
+        except _Unsupported:
+            # Keyword the compiler does not know: keep the dispatch, let
+            # jsonschema evaluate just this branch.
+            checks[kind] = Draft7Validator({**branch, 'definitions': root.get('definitions', {})}).is_valid
+    return checks
+
+
+_checks_by_kind = _compile_kinds(_schema)
+
+
+def validation_error(event: Any) -> Optional[str]:
+    if type(event) is dict:
+        kind = event.get('kind')
+        check = _checks_by_kind.get(kind) if isinstance(kind, str) else None
+        if check is not None and check(event):
+            return None
+    # Slow path, only for events that are (or may be) invalid: the exact
+    # error Draft7Validator.validate() would raise.
+    for error in _validator.iter_errors(event):
+        return error.message
+    return None
+
+
+# Batches: the header is checked once as a template event, and the numeric
+# measurement columns against the same schema's integer type and bounds in
+# one array pass. Only rows that fail are rebuilt as dicts, so their messages
+# come from _validator as above.
+_COLUMN_BOUNDS = {
+    'minimum': np.less,
+    'maximum': np.greater,
+    'exclusiveMinimum': np.less_equal,
+    'exclusiveMaximum': np.greater_equal,
+}
+
+
+def _column_rules(root: Dict[str, Any]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    rules: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for branch in root.get('oneOf', []):
+        kind = branch.get('properties', {}).get('kind', {}).get('const')
+        if isinstance(kind, str):
+            rules[kind] = {
+                name: prop for name, prop in branch.get('properties', {}).items()
+                if prop.get('type') in ('number', 'integer')
+            }
+    return rules
+
+
+_rules_by_kind = _column_rules(_schema)
+
+
+def batch_errors(batch: 'EventBatch') -> Dict[int, str]:
+    # {row index: error} for the rows that fail. A bad header fails every
+    # row, each with its own message (rare, so no shortcut).
+    if validation_error(batch.template()) is not None:
+        return {index: validation_error(event) or 'invalid value' for index, event in enumerate(batch.events())}
+    invalid = np.zeros(len(batch), dtype=bool)
+    for name, prop in _rules_by_kind.get(batch.kind, {}).items():
+        values = batch.columns.get(name)
+        if values is None:
+            continue
+        invalid |= np.isnan(values)
+        if prop['type'] == 'integer':
+            invalid |= np.mod(values, 1) != 0
+        for keyword, outside in _COLUMN_BOUNDS.items():
+            if keyword in prop:
+                invalid |= outside(values, prop[keyword])
+    errors = {}
+    for index in np.flatnonzero(invalid).tolist():
+        errors[index] = validation_error(batch.event(index)) or 'invalid value'
+    return errors
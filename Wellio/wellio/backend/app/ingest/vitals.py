@@ -0,0 +1,145 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from .rollups import SLEEP_STAGES
+
+# Latest vitals per user in one Redis hash, written through on ingest:
+# last bpm, the step total of the newest UTC day and the stage totals of the
+# newest night. The Lua script compares timestamps/days inside Redis, so late
+# or out-of-order events never overwrite newer values.
+VITALS_PREFIX = 'vitals:'
+VITALS_TTL_SECONDS = 8 * 24 * 3600
+# A night is filed under the day it ends on: sleep before noon counts toward
+# that morning, sleep after noon toward the next one.
+_NIGHT_SHIFT = timedelta(hours=12)
+
+_UPDATE_VITALS = """
+-- Redis embeds Lua 5.1; table.unpack keeps the script portable to 5.2+.
+local unpack = unpack or table.unpack
+local key = KEYS[1]
+local stages = {'light', 'deep', 'rem', 'awake'}
+local fields = {'bpm', 'bpm_ts', 'steps', 'steps_day', 'steps_ts', 'sleep_day', 'sleep_ts'}
+for _, stage in ipairs(stages) do table.insert(fields, 'sleep_' .. stage .. '_s') end
+local values = redis.call('HMGET', key, unpack(fields))
+local h = {}
+for i, field in ipairs(fields) do h[field] = values[i] end
+local changed = {}
+local function set(field, value) h[field] = value; changed[field] = value end
+
+for i = 2, #ARGV, 5 do
+  local kind, ts, day, value, extra = ARGV[i], tonumber(ARGV[i + 1]), ARGV[i + 2], ARGV[i + 3], ARGV[i + 4]
+  if kind == 'heart_rate' then
+    if ts > tonumber(h.bpm_ts or '-1') then
+      set('bpm', value); set('bpm_ts', ts)
+    end
+  elseif kind == 'steps' then
+    local current = h.steps_day or ''
+    if day > current then
+      set('steps_day', day); set('steps', value); set('steps_ts', ts)
+    elseif day == current then
+      local total = tonumber(h.steps or '0')
+      -- P1D events carry the running day total, others an increment.
+      if extra == 'P1D' then
+        total = math.max(total, tonumber(value))
+      else
+        total = total + tonumber(value)
+      end
+      set('steps', total)
+      if ts > tonumber(h.steps_ts or '-1') then set('steps_ts', ts) end
+    end
+  elseif kind == 'sleep' then
+    local current = h.sleep_day or ''
+    if day > current then
+      set('sleep_day', day); set('sleep_ts', ts)
+      for _, stage in ipairs(stages) do set('sleep_' .. stage .. '_s', 0) end
+    end
+    if day >= current then
+      local field = 'sleep_' .. extra .. '_s'
+      set(field, tonumber(h[field] or '0') + tonumber(value))
+      if ts > tonumber(h.sleep_ts or '-1') then set('sleep_ts', ts) end
+    end
+  end
+end
+
+local flat = {}
+for field, value in pairs(changed) do
+  table.insert(flat, field); table.insert(flat, tostring(value))
+end
+if #flat > 0 then
+  redis.call('HSET', key, unpack(flat))
+  redis.call('EXPIRE', key, ARGV[1])
+end
+return #flat / 2
+"""
+
+
+def vitals_key(user_id: str) -> str:
+    return f'{VITALS_PREFIX}{user_id}'
+
+
+def _event_args(row: Dict[str, Any]) -> Optional[List[Any]]:
+    ts = row['ts']
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    ts_ms = int(ts.timestamp() * 1000)
+    kind = row['kind']
+    if kind == 'heart_rate':
+        return [kind, ts_ms, '', row['bpm'], '']
+    if kind == 'steps':
+        return [kind, ts_ms, f'{ts:%Y%m%d}', row['steps'], row['payload'].get('window') or '']
+    if kind == 'sleep' and row['stage'] in SLEEP_STAGES:
+        return [kind, ts_ms, f'{ts + _NIGHT_SHIFT:%Y%m%d}', row['dur_s'], row['stage']]
+    return None
+
+
+def vitals_updates(rows: Sequence[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    # Script arguments per user: the TTL, then five values per event.
+    updates: Dict[str, List[Any]] = defaultdict(lambda: [VITALS_TTL_SECONDS])
+    for row in rows:
+        args = _event_args(row)
+        if args is not None:
+            updates[row['user_id']].extend(args)
+    return dict(updates)
+
+
+def queue_vitals(redis: Redis, pipe, rows: Sequence[Dict[str, Any]]) -> None:
+    script = redis.register_script(_UPDATE_VITALS)
+    for user_id, args in vitals_updates(rows).items():
+        script(keys=[vitals_key(user_id)], args=args, client=pipe)
+
+
+async def queue_vitals_async(redis: AsyncRedis, pipe, rows: Sequence[Dict[str, Any]]) -> None:
+    script = redis.register_script(_UPDATE_VITALS)
+    for user_id, args in vitals_updates(rows).items():
+        await script(keys=[vitals_key(user_id)], args=args, client=pipe)
+
+
+def _iso(ts_ms: Optional[str]) -> Optional[str]:
+    if ts_ms is None:
+        return None
+    return datetime.fromtimestamp(int(float(ts_ms)) / 1000, timezone.utc).isoformat()
+
+
+def _day(value: str) -> str:
+    return f'{value[:4]}-{value[4:6]}-{value[6:]}'
+
+
+def vitals_response(fields: Dict[Any, Any]) -> Dict[str, Any]:
+    h = {
+        (key.decode() if isinstance(key, bytes) else key): (value.decode() if isinstance(value, bytes) else value)
+        for key, value in fields.items()
+    }
+    vitals: Dict[str, Any] = {'heart_rate': None, 'steps': None, 'sleep': None}
+    if 'bpm' in h:
+        vitals['heart_rate'] = {'bpm': float(h['bpm']), 'ts': _iso(h.get('bpm_ts'))}
+    if 'steps_day' in h:
+        vitals['steps'] = {'day': _day(h['steps_day']), 'total': int(float(h['steps'])), 'ts': _iso(h.get('steps_ts'))}
+    if 'sleep_day' in h:
+        vitals['sleep'] = {
+            'day': _day(h['sleep_day']),
+            'stages_s': {stage: float(h.get(f'sleep_{stage}_s', 0)) for stage in SLEEP_STAGES},
+            'ts': _iso(h.get('sleep_ts')),
+        }
+    return vitals
@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+from fastapi import WebSocket, WebSocketDisconnect
+from ..metrics import metrics
+from ..normalizer.ble_hr import normalize_ble_frames
+from .buffer import BufferFull
+from .pipeline import event_key
+from .ratelimit import Overloaded, RateLimited
+from .stream import IngestChunk
+
+# Long-lived ingest channel. Clients send
+#   {"seq": n, "events": [...]}                       canonical events, or
+#   {"seq": n, "userId": ..., "device": {...},
+#    "frames": [{"frame": "<base64 HR measurement>", "ts": ...}, ...]}
+# with strictly increasing seq, and receive a cumulative
+#   {"ack": n, "accepted": a, "duplicate": d, "invalid": i, "errors": [...]}
+# once everything up to n is stored, so they can drop their resend buffer up
+# to n. A seq at or below the last ack is a resend and is only re-acked.
+# Events already accepted on this connection are answered as duplicates
+# without a Redis round trip. A message that cannot be stored right now is
+# answered {"error": ..., "seq": n, "retry_after": s} and the connection is
+# closed: later messages may already be on the wire and must not be acked
+# past it, so the client resends everything unacked on reconnect.
+
+RECENT_KEYS = 4096
+MAX_ERRORS = 20
+CLOSE_INVALID = 1007
+CLOSE_ERROR = 1011
+CLOSE_TRY_AGAIN = 1013
+
+logger = logging.getLogger(__name__)
+
+
+class WsProtocolError(ValueError):
+    pass
+
+
+class IngestConnection:
+    def __init__(self, max_events: int):
+        self.max_events = max_events
+        self.last_ack = -1
+        self.user_id: Optional[str] = None
+        self.device: Dict[str, Any] = {}
+        self._recent: 'OrderedDict[str, None]' = OrderedDict()
+
+    def parse(self, text: str) -> Tuple[int, List[Any]]:
+        try:
+            message = json.loads(text)
+        except ValueError as exc:
+            raise WsProtocolError(f'invalid json: {exc}') from exc
+        if not isinstance(message, dict) or not isinstance(message.get('seq'), int):
+            raise WsProtocolError('messages must be objects with an integer seq')
+        self.user_id = message.get('userId', self.user_id)
+        self.device = message.get('device', self.device)
+        events = message.get('events', [])
+        frames = message.get('frames', [])
+        if not isinstance(events, list) or not isinstance(frames, list):
+            raise WsProtocolError('events and frames must be arrays')
+        events = list(events)
+        if len(events) + len(frames) > self.max_events:
+            raise WsProtocolError(f'message exceeds {self.max_events} events')
+        events.extend(self._frame_events(frames))
+        return message['seq'], events
+
+    def _frame_events(self, frames: List[Any]) -> List[Any]:
+        # All frames of a message are decoded in one batch; entries that are
+        # not objects are passed on and fail validation.
+        payloads = [{'userId': self.user_id, 'device': self.device, **frame} for frame in frames if isinstance(frame, dict)]
+        decoded = iter(normalize_ble_frames(payloads))
+        return [
+            {key: value for key, value in next(decoded).items() if value is not None} if isinstance(frame, dict) else frame
+            for frame in frames
+        ]
+
+    def split_seen(self, events: List[Any]) -> Tuple[List[Tuple[int, Optional[str], Any]], int]:
+        # (position, dedupe key or None, event) for everything still to
+        # ingest, plus the number of events already accepted here.
+        fresh = []
+        seen = 0
+        for index, event in enumerate(events):
+            try:
+                key: Optional[str] = event_key(event)
+            except (KeyError, TypeError):
+                key = None
+            if key is not None and key in self._recent:
+                seen += 1
+            else:
+                fresh.append((index, key, event))
+        return fresh, seen
+
+    def remember(self, key: str) -> None:
+        self._recent[key] = None
+        self._recent.move_to_end(key)
+        while len(self._recent) > RECENT_KEYS:
+            self._recent.popitem(last=False)
+
+
+async def serve_ingest_ws(websocket: WebSocket, ingest_chunk: IngestChunk, max_events: int) -> None:
+    await websocket.accept()
+    connection = IngestConnection(max_events)
+    metrics.incr('ingest_ws.connections')
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                seq, events = connection.parse(text)
+            except WsProtocolError as exc:
+                await websocket.send_json({'error': str(exc)})
+                await websocket.close(code=CLOSE_INVALID)
+                return
+            metrics.incr('ingest_ws.messages')
+            if seq <= connection.last_ack:
+                await websocket.send_json({'ack': connection.last_ack, 'accepted': 0, 'duplicate': 0, 'invalid': 0, 'errors': []})
+                continue
+            fresh, seen = connection.split_seen(events)
+            try:
+                results = await ingest_chunk([event for _, _, event in fresh]) if fresh else []
+            except BufferFull:
+                await _refuse(websocket, 'busy', seq, 1, CLOSE_TRY_AGAIN)
+                return
+            except (RateLimited, Overloaded) as exc:
+                error = 'rate_limited' if isinstance(exc, RateLimited) else 'busy'
+                await _refuse(websocket, error, seq, exc.retry_after, CLOSE_TRY_AGAIN)
+                return
+            except Exception:  # noqa: BLE001
+                logger.exception('ws ingest of seq %d failed', seq)
+                await _refuse(websocket, 'unavailable', seq, 1, CLOSE_ERROR)
+                return
+            metrics.incr('ingest_ws.local_duplicates', seen)
+            ack: Dict[str, Any] = {'ack': seq, 'accepted': 0, 'duplicate': seen, 'invalid': 0, 'errors': []}
+            for (index, key, _), result in zip(fresh, results):
+                status = result['status']
+                ack[status] += 1
+                if status == 'invalid':
+                    if len(ack['errors']) < MAX_ERRORS:
+                        ack['errors'].append({'index': index, 'detail': result['detail']})
+                elif key is not None:
+                    connection.remember(key)
+            connection.last_ack = seq
+            await websocket.send_json(ack)
+    except WebSocketDisconnect:
+        pass
+
+
+async def _refuse(websocket: WebSocket, error: str, seq: int, retry_after: float, code: int) -> None:
+    # seq is not acked; the client resends it after reconnecting.
+    metrics.incr(f'ingest_ws.refused.{error}')
+    await websocket.send_json({'error': error, 'seq': seq, 'retry_after': retry_after})
+    await websocket.close(code=code)
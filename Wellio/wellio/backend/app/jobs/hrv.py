@@ -0,0 +1,50 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Optional
+import logging
+from redis import Redis
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from ..config import get_settings
+from ..deps import SessionLocal, get_redis
+from ..metrics import metrics
+from ..models import Event
+from ..users.hrv import HRV_WINDOWS, cache_entries, compute_windows, hrv_columns, hrv_stmt, store_cached, window_starts
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+
+def compute_nightly_hrv(
+    session_factory: Callable[[], Session] = SessionLocal,
+    redis: Optional[Redis] = None,
+    day: Optional[date] = None,
+) -> int:
+    # Caches the day window and its hour windows of `day` (yesterday, UTC)
+    # for every user with heart rate events that day: one query and one
+    # array pass per user. Returns the number of users.
+    redis = redis or get_redis()
+    day = day or (datetime.now(timezone.utc) - timedelta(days=1)).date()
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    end = start + timedelta(days=1)
+    now = datetime.now(timezone.utc)
+    db = session_factory()
+    users = 0
+    try:
+        user_ids = db.scalars(
+            select(Event.user_id)
+            .where(Event.kind == 'heart_rate', Event.ts >= start, Event.ts < end)
+            .distinct()
+        ).all()
+        for user_id in user_ids:
+            columns = hrv_columns(db.execute(hrv_stmt(user_id, start, end)).all())
+            for window, width in HRV_WINDOWS.items():
+                starts = window_starts(start, end, width)
+                results = compute_windows(columns, start, width, len(starts))
+                entries = cache_entries(user_id, window, starts, results, list(range(len(starts))), now, _settings.hrv_settle_s)
+                store_cached(redis, entries, _settings.hrv_cache_ttl_s)
+            users += 1
+    finally:
+        db.close()
+    metrics.incr('hrv.nightly_users', users)
+    logger.info('hrv: cached %s for %d users', day.isoformat(), users)
+    return users
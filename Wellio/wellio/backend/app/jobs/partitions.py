@@ -0,0 +1,180 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+import logging
+from sqlalchemy import Index, MetaData, Table, UniqueConstraint, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from ..config import get_settings
+from ..models import Event
+
+logger = logging.getLogger(__name__)
+
+# Range partitioning of `events` on ts (Postgres only). Postgres requires the
+# partition key in every unique constraint: uq_event_dedupe already contains
+# ts, and the primary key becomes (id, ts). The ORM keeps mapping Event by id,
+# which stays unique through the shared BIGSERIAL sequence.
+# Rows outside every managed range land in the DEFAULT partition. Postgres
+# refuses to add a partition for a range the default partition already
+# holds rows of, so new partitions are created detached, take over their
+# rows from the default partition and are attached in one transaction.
+
+PARENT = Event.__tablename__
+DEFAULT_PARTITION = f'{PARENT}_default'
+_NAME_FORMATS = {'day': '%Y%m%d', 'month': '%Y%m'}
+
+
+def partitioned_events_table() -> Table:
+    source = Event.__table__
+    columns = []
+    for column in source.columns:
+        copy = column._copy()
+        if column.name == 'ts':
+            copy.primary_key = True
+        columns.append(copy)
+    constraints = [
+        UniqueConstraint(*constraint.columns.keys(), name=constraint.name)
+        for constraint in source.constraints
+        if isinstance(constraint, UniqueConstraint)
+    ]
+    indexes = [Index(index.name, *index.columns.keys()) for index in source.indexes]
+    return Table(
+        PARENT,
+        MetaData(),
+        *columns,
+        *constraints,
+        *indexes,
+        postgresql_partition_by='RANGE (ts)',
+    )
+
+
+def partition_start(day: date, granularity: str) -> date:
+    return day.replace(day=1) if granularity == 'month' else day
+
+
+def next_start(start: date, granularity: str) -> date:
+    if granularity == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def partition_name(start: date, granularity: str) -> str:
+    return f'{PARENT}_p{start.strftime(_NAME_FORMATS[granularity])}'
+
+
+def parse_partition_name(name: str, granularity: str) -> Optional[date]:
+    prefix = f'{PARENT}_p'
+    if not name.startswith(prefix):
+        return None
+    try:
+        return datetime.strptime(name[len(prefix):], _NAME_FORMATS[granularity]).date()
+    except ValueError:
+        return None
+
+
+def _bound(day: date) -> str:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).isoformat()
+
+
+def partition_ddl(today: date, granularity: str, ahead: int) -> List[Tuple[str, List[str]]]:
+    # The current partition plus `ahead` future ones, each as the statements
+    # of its own transaction.
+    start = partition_start(today, granularity)
+    statements = []
+    for _ in range(ahead + 1):
+        end = next_start(start, granularity)
+        name = partition_name(start, granularity)
+        statements.append((name, [
+            f'CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS)',
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+            f"WHERE ts >= '{_bound(start)}' AND ts < '{_bound(end)}' RETURNING *) "
+            f'INSERT INTO {name} SELECT * FROM moved',
+            f'ALTER TABLE {PARENT} ATTACH PARTITION {name} '
+            f"FOR VALUES FROM ('{_bound(start)}') TO ('{_bound(end)}')",
+        ]))
+        start = end
+    return statements
+
+
+def expired_partitions(names: Iterable[str], granularity: str, cutoff: date) -> List[str]:
+    # Partitions whose whole range ends on or before the cutoff.
+    expired = []
+    for name in names:
+        start = parse_partition_name(name, granularity)
+        if start is not None and next_start(start, granularity) <= cutoff:
+            expired.append(name)
+    return sorted(expired)
+
+
+def create_partitioned_events(conn: Connection) -> bool:
+    if inspect(conn).has_table(PARENT):
+        return False
+    partitioned_events_table().create(conn)
+    # Catches backfills older than the oldest managed partition.
+    conn.execute(text(f'CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT'))
+    return True
+
+
+def list_partitions(conn: Connection) -> List[str]:
+    rows = conn.execute(text(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE parent.relname = :parent'
+    ), {'parent': PARENT})
+    return [row[0] for row in rows]
+
+
+def is_partitioned(conn: Connection) -> bool:
+    return conn.execute(text(
+        'SELECT 1 FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid '
+        'WHERE pg_class.relname = :parent'
+    ), {'parent': PARENT}).first() is not None
+
+
+def maintain_partitions(engine: Optional[Engine] = None, today: Optional[date] = None) -> dict:
+    settings = get_settings()
+    granularity = settings.events_partitioning
+    if granularity is None:
+        return {'created': [], 'expired': []}
+    if engine is None:
+        from ..deps import engine
+    if engine.dialect.name != 'postgresql':
+        return {'created': [], 'expired': []}
+    today = today or datetime.now(timezone.utc).date()
+    created, expired = [], []
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            # A pre-existing heap table has to be migrated by hand first.
+            logger.warning('%s is not partitioned; skipping partition maintenance', PARENT)
+            return {'created': [], 'expired': []}
+        existing = set(list_partitions(conn))
+    # One transaction per partition, so a failing one does not hold back the
+    # others on every run.
+    for name, statements in partition_ddl(today, granularity, settings.events_partitions_ahead):
+        if name in existing:
+            continue
+        if DEFAULT_PARTITION not in existing:
+            statements = statements[:1] + statements[2:]
+        if _run(engine, name, statements):
+            created.append(name)
+    if settings.events_retention_days is not None:
+        cutoff = today - timedelta(days=settings.events_retention_days)
+        for name in expired_partitions(existing, granularity, cutoff):
+            statements = [f'ALTER TABLE {PARENT} DETACH PARTITION {name}']
+            if settings.events_partition_expiry == 'drop':
+                statements.append(f'DROP TABLE {name}')
+            if _run(engine, name, statements):
+                expired.append(name)
+    if created or expired:
+        logger.info('events partitions created=%s expired=%s', created, expired)
+    return {'created': created, 'expired': expired}
+
+
+def _run(engine: Engine, name: str, statements: List[str]) -> bool:
+    try:
+        with engine.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+    except Exception:  # noqa: BLE001
+        logger.exception('maintenance of partition %s failed', name)
+        return False
+    return True
@@ -1,14 +1,226 @@
-from typing import List, Dict
-from ..normalizer import fitbit as fitbit_norm
-
-
-def poll_vendor_sources() -> List[Dict[str, str]]:
-    # In production we would fetch using stored tokens and enqueue normalization jobs.
-    dummy_payload = {
-        'user_id': 'demo-user',
-        'dateTime': '2023-09-01',
-        'heart_rate': {'dataset': [{'time': '00:00:00', 'value': 60}]},
-        'steps': {'dateTime': '2023-09-01', 'value': 1000},
-        'device': {'vendor': 'Fitbit', 'model': 'Inspire'}
-    }
-    return list(fitbit_norm.normalize_fitbit(dummy_payload))
+from collections import Counter
+from datetime import date, datetime, time as day_time, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import logging
+import time
+import httpx
+from redis.asyncio import Redis as AsyncRedis
+from ..auth.tokens import linked_accounts
+from ..config import get_settings
+from ..ingest.ratelimit import reserve_async
+from ..metrics import metrics
+from ..webhooks.queue import enqueue_async
+
+# Vendor polling, for data the vendors do not push (Fitbit intraday heart
+# rate). One cycle walks every linked account of each poller's vendor over a
+# shared httpx.AsyncClient, so connections are kept alive across users.
+# A poller runs `concurrency` accounts at a time and charges every request to
+# Redis token buckets (per user, optionally per app) matching the vendor's
+# quota; a user out of quota, or answered 429/401, is left for the next
+# cycle. Fetched payloads go onto the webhook stream and are ingested by the
+# webhook workers. Each account's cursor (how far it has been fetched) is
+# kept in the poll:cursor:{vendor} hash and only moved once the data is
+# queued, so a failed cycle refetches rather than skips.
+#
+#   python -m app.jobs.polling [--every SECONDS]
+
+CURSOR_PREFIX = 'poll:cursor:'
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+
+def cursor_key(vendor: str) -> str:
+    return f'{CURSOR_PREFIX}{vendor}'
+
+
+class _Stop(Exception):
+    # Ends an account's cycle early; the reason is the metric name.
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class FitbitPoller:
+    vendor = 'fitbit'
+
+    def __init__(
+        self,
+        base_url: str,
+        concurrency: int,
+        user_requests_per_hour: int,
+        app_requests_per_hour: Optional[int] = None,
+        max_days: int = 7,
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.max_days = max_days
+        self._limits: List[Tuple[str, float, int]] = [('poll:fitbit:user:{user_id}', user_requests_per_hour / 3600, user_requests_per_hour)]
+        if app_requests_per_hour:
+            self._limits.append(('poll:fitbit:app', app_requests_per_hour / 3600, app_requests_per_hour))
+
+    def _start(self, cursor: Optional[str], today: date) -> datetime:
+        # New accounts start at yesterday; stale ones catch up max_days.
+        earliest = datetime.combine(today - timedelta(days=self.max_days - 1), day_time())
+        if cursor is None:
+            return max(earliest, datetime.combine(today - timedelta(days=1), day_time()))
+        return max(earliest, datetime.fromisoformat(cursor))
+
+    async def _get(self, client: httpx.AsyncClient, redis: AsyncRedis, user_id: str, token: str, path: str) -> Dict[str, Any]:
+        limits = [(name.format(user_id=user_id), rate, burst) for name, rate, burst in self._limits]
+        if await reserve_async(redis, limits):
+            raise _Stop('quota')
+        response = await client.get(f'{self.base_url}{path}', headers={'Authorization': f'Bearer {token}'})
+        metrics.incr(f'polling.{self.vendor}.requests')
+        if response.status_code == 429:
+            raise _Stop('throttled')
+        if response.status_code == 401:
+            raise _Stop('unauthorized')
+        response.raise_for_status()
+        return response.json()
+
+    async def poll_account(
+        self,
+        client: httpx.AsyncClient,
+        redis: AsyncRedis,
+        user_id: str,
+        tokens: Dict[str, str],
+        cursor: Optional[str],
+        today: date,
+    ) -> Optional[str]:
+        # Intraday heart rate from the cursor to now, a day per request.
+        # Returns the new cursor: the last sample queued, or the start of the
+        # next day once a day before yesterday came back empty.
+        start = self._start(cursor, today)
+        day = start.date()
+        try:
+            while day <= today:
+                since = start.strftime('%H:%M') if day == start.date() else '00:00'
+                body = await self._get(
+                    client,
+                    redis,
+                    user_id,
+                    tokens['access_token'],
+                    f'/1/user/-/activities/heart/date/{day.isoformat()}/1d/1sec/time/{since}/23:59.json',
+                )
+                dataset = body.get('activities-heart-intraday', {}).get('dataset', [])
+                if dataset:
+                    payload = {
+                        'user_id': user_id,
+                        'dateTime': day.isoformat(),
+                        'heart_rate': {'dataset': dataset},
+                        'device': {'vendor': 'Fitbit'},
+                    }
+                    await enqueue_async(redis, self.vendor, json.dumps(payload).encode())
+                    metrics.incr(f'polling.{self.vendor}.samples', len(dataset))
+                    cursor = f"{day.isoformat()}T{dataset[-1]['time']}"
+                elif day < today - timedelta(days=1):
+                    cursor = datetime.combine(day + timedelta(days=1), day_time()).isoformat()
+                day += timedelta(days=1)
+        except _Stop as stop:
+            metrics.incr(f'polling.{self.vendor}.{stop.reason}')
+        return cursor
+
+
+async def poll_vendor(
+    client: httpx.AsyncClient,
+    redis: AsyncRedis,
+    poller: Any,
+    today: Optional[date] = None,
+) -> Dict[str, int]:
+    # One cycle over every linked account: a producer scans the links into a
+    # bounded queue drained by `concurrency` workers, so memory stays flat
+    # however many accounts there are.
+    today = today or datetime.now(timezone.utc).date()
+    queue: 'asyncio.Queue[Optional[Tuple[str, Dict[str, str]]]]' = asyncio.Queue(maxsize=poller.concurrency * 2)
+    stats: Counter = Counter()
+    key = cursor_key(poller.vendor)
+
+    async def work() -> None:
+        while True:
+            account = await queue.get()
+            if account is None:
+                return
+            user_id, tokens = account
+            try:
+                cursor = await redis.hget(key, user_id)
+                cursor = cursor.decode() if isinstance(cursor, bytes) else cursor
+                moved = await poller.poll_account(client, redis, user_id, tokens, cursor, today)
+                if moved is not None and moved != cursor:
+                    await redis.hset(key, user_id, moved)
+                stats['polled'] += 1
+            except Exception:
+                stats['failed'] += 1
+                logger.exception('polling %s for %s failed', poller.vendor, user_id)
+
+    workers = [asyncio.ensure_future(work()) for _ in range(poller.concurrency)]
+    try:
+        async for account in linked_accounts(redis, poller.vendor):
+            await queue.put(account)
+    finally:
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    metrics.incr(f'polling.{poller.vendor}.accounts', stats['polled'])
+    metrics.incr(f'polling.{poller.vendor}.failed', stats['failed'])
+    return dict(stats)
+
+
+def vendor_pollers() -> List[Any]:
+    return [
+        FitbitPoller(
+            _settings.fitbit_api_url,
+            _settings.poll_fitbit_concurrency,
+            _settings.poll_fitbit_user_requests_per_hour,
+            _settings.poll_fitbit_app_requests_per_hour,
+            _settings.poll_max_days,
+        ),
+    ]
+
+
+def vendor_client(**kwargs: Any) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=_settings.poll_max_connections, max_keepalive_connections=_settings.poll_max_connections)
+    return httpx.AsyncClient(limits=limits, timeout=_settings.poll_timeout_s, **kwargs)
+
+
+async def poll_all(client: httpx.AsyncClient, redis: AsyncRedis, pollers: Optional[List[Any]] = None) -> Dict[str, Dict[str, int]]:
+    pollers = vendor_pollers() if pollers is None else pollers
+    results = await asyncio.gather(*(poll_vendor(client, redis, poller) for poller in pollers))
+    return {poller.vendor: result for poller, result in zip(pollers, results)}
+
+
+async def _poll_once() -> Dict[str, Dict[str, int]]:
+    # Client and Redis connections live for one cycle, on its event loop.
+    redis = AsyncRedis.from_url(str(_settings.redis_url))
+    try:
+        async with vendor_client() as client:
+            return await poll_all(client, redis)
+    finally:
+        await redis.close()
+
+
+def poll_vendor_sources() -> Dict[str, Dict[str, int]]:
+    started = time.perf_counter()
+    result = asyncio.run(_poll_once())
+    metrics.observe('polling.cycle_s', time.perf_counter() - started)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Poll linked vendor accounts.')
+    parser.add_argument('--every', type=float, default=None, help='repeat every N seconds instead of running once')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    while True:
+        started = time.monotonic()
+        logger.info('poll cycle: %s', poll_vendor_sources())
+        if args.every is None:
+            return
+        time.sleep(max(0.0, args.every - (time.monotonic() - started)))
+
+
+if __name__ == '__main__':
+    main()
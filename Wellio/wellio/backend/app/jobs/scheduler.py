@@ -1,8 +1,18 @@
+from typing import List
 from apscheduler.schedulers.background import BackgroundScheduler
-from .polling import poll_vendor_sources
+from .hrv import compute_nightly_hrv
+from .partitions import maintain_partitions
 
+# Jobs are added at startup, each only when its setting asks for it.
 scheduler = BackgroundScheduler()
-scheduler.add_job(poll_vendor_sources, 'interval', minutes=15, id='vendor-poll')
+
+
+def schedule_jobs(partitions: bool, hrv_nightly: bool) -> List[str]:
+    if partitions:
+        scheduler.add_job(maintain_partitions, 'interval', hours=1, id='events-partitions', replace_existing=True)
+    if hrv_nightly:
+        scheduler.add_job(compute_nightly_hrv, 'cron', hour=2, minute=30, timezone='UTC', id='hrv-nightly', replace_existing=True)
+    return [job.id for job in scheduler.get_jobs()]
 
 
 def start_scheduler() -> None:
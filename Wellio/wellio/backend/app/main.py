@@ -1,42 +1,371 @@
-from fastapi import FastAPI, Depends
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Iterator, List, Literal, Optional, Tuple
+import json
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func
-from .deps import get_db
-from .models import Base, Event
+from sqlalchemy import func, select, tuple_
+from .config import get_settings
+from .deps import get_async_sessionmaker, get_session_factory, redis_client, SessionLocal
+from .metrics import metrics
+from .models import Base, Event, EventRollup
+from .ingest.rows import event_from_row, format_ts, parse_ts
+from .ingest.rollups import SLEEP_STAGES, bucket_start
 from .ingest.router import router as ingest_router
+from .ingest.async_router import router as async_ingest_router
+from .ingest.buffer import BufferFull, start_write_behind, stop_write_behind
+from .ingest.prefilter import SeenFilter, configure_seen_filter
+from .ingest.ratelimit import (
+    ConcurrencyGate,
+    Overloaded,
+    RateLimited,
+    RateLimiter,
+    configure_ingest_gate,
+    configure_rate_limits,
+    retry_after_header,
+)
 from .auth.router import router as auth_router
 from .webhooks.router import router as webhook_router
+from .users.live import close_live_hub
+from .users.router import router as users_router
+from .jobs.partitions import create_partitioned_events, maintain_partitions
+from .jobs.scheduler import schedule_jobs, start_scheduler
 from .deps import engine
 
+_settings = get_settings()
+
 app = FastAPI(title='Wellio Auto-Connect API')
-app.include_router(ingest_router, prefix='/v1')
+app.include_router(async_ingest_router if _settings.io_mode == 'async' else ingest_router, prefix='/v1')
 app.include_router(auth_router, prefix='/oauth')
 app.include_router(webhook_router, prefix='/webhooks')
+app.include_router(users_router, prefix='/v1/users')
 
 
 @app.on_event('startup')
 def on_startup() -> None:
+    partitioned = bool(_settings.events_partitioning) and engine.dialect.name == 'postgresql'
+    if partitioned:
+        # The partitioned parent must exist before create_all, which would
+        # otherwise create events as a plain heap table.
+        with engine.begin() as conn:
+            create_partitioned_events(conn)
+        maintain_partitions(engine)
     Base.metadata.create_all(bind=engine)
+    if schedule_jobs(partitions=partitioned, hrv_nightly=_settings.hrv_nightly_enabled):
+        start_scheduler()
+    if _settings.dedupe_prefilter_enabled:
+        configure_seen_filter(SeenFilter(
+            _settings.dedupe_prefilter_capacity,
+            _settings.dedupe_prefilter_error_rate,
+            _settings.dedupe_prefilter_lru_size,
+            _settings.dedupe_prefilter_deferred_max,
+        ))
+    if _settings.rate_limit_enabled:
+        configure_rate_limits(RateLimiter(
+            _settings.rate_limit_user_rate,
+            _settings.rate_limit_user_burst,
+            _settings.rate_limit_source_rate,
+            _settings.rate_limit_source_burst,
+        ))
+    if _settings.ingest_max_in_flight:
+        configure_ingest_gate(ConcurrencyGate(_settings.ingest_max_in_flight))
+    if _settings.write_behind_enabled:
+        start_write_behind(
+            SessionLocal,
+            redis_client,
+            _settings.write_behind_max_rows,
+            _settings.write_behind_flush_rows,
+            _settings.write_behind_flush_ms,
+        )
 
 
-@app.get('/v1/summary')
-def summary(from_: str, to: str, db: Session = Depends(get_db)):
-    stmt = (
-        select(
-            Event.kind,
-            func.date_trunc('day', Event.ts).label('day'),
-            func.jsonb_agg(Event.payload).label('events')
-        )
-        .where(Event.ts.between(from_, to))
-        .group_by(Event.kind, func.date_trunc('day', Event.ts))
-        .order_by('day')
+@app.on_event('shutdown')
+def on_shutdown() -> None:
+    stop_write_behind()
+
+
+@app.on_event('shutdown')
+async def on_shutdown_async() -> None:
+    await close_live_hub()
+
+
+@app.exception_handler(BufferFull)
+def buffer_full(request: Request, exc: BufferFull) -> JSONResponse:
+    return JSONResponse(status_code=503, content={'detail': str(exc)}, headers={'Retry-After': '1'})
+
+
+@app.exception_handler(RateLimited)
+def rate_limited(request: Request, exc: RateLimited) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={'detail': str(exc), 'scope': exc.scope},
+        headers=retry_after_header(exc.retry_after),
+    )
+
+
+@app.exception_handler(Overloaded)
+def overloaded(request: Request, exc: Overloaded) -> JSONResponse:
+    return JSONResponse(status_code=503, content={'detail': str(exc)}, headers=retry_after_header(exc.retry_after))
+
+
+@app.get('/v1/metrics')
+def get_metrics():
+    return metrics.snapshot()
+
+
+EVENTS_PAGE_DEFAULT = 1000
+EVENTS_PAGE_MAX = 10000
+# Rows fetched per round trip from the server-side cursor, and events per
+# body chunk written to the client.
+EVENTS_YIELD_PER = 500
+
+
+def _parse_after(after: str) -> Tuple[datetime, int]:
+    try:
+        ts, event_id = after.rsplit(',', 1)
+        return parse_ts(ts), int(event_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='after must be "<ts>,<id>"')
+
+
+def _events_stmt(from_: str, to: str, user_id: Optional[str]):
+    # With user_id the scan runs on idx_events_user_ts.
+    stmt = select(
+        Event.id,
+        Event.kind,
+        Event.user_id,
+        Event.ts,
+        Event.source,
+        Event.device_vendor,
+        Event.device_model,
+        Event.bpm,
+        Event.steps,
+        Event.dur_s,
+        Event.stage,
+        Event.payload,
+    ).where(Event.ts.between(from_, to))
+    if user_id is not None:
+        stmt = stmt.where(Event.user_id == user_id)
+    return stmt.order_by(Event.ts, Event.id)
+
+
+def _page_stmt(from_: str, to: str, user_id: Optional[str], after: Optional[str], limit: int):
+    # Keyset pagination on (ts, id).
+    stmt = _events_stmt(from_, to, user_id)
+    if after is not None:
+        stmt = stmt.where(tuple_(Event.ts, Event.id) > tuple_(*_parse_after(after)))
+    # One extra row tells whether another page follows.
+    return stmt.limit(limit + 1).execution_options(yield_per=EVENTS_YIELD_PER)
+
+
+def _utc_day(dialect: str):
+    # SQLite's date() already normalizes the stored offset to UTC.
+    if dialect == 'postgresql':
+        return func.date(func.timezone('UTC', Event.ts))
+    return func.date(Event.ts)
+
+
+def _summary_stmt(dialect: str, from_: str, to: str, user_id: Optional[str]):
+    # Ordered so each (day, kind) group arrives contiguously and can be
+    # written out as soon as the next one starts.
+    stmt = _events_stmt(from_, to, user_id).order_by(None)
+    stmt = stmt.order_by(_utc_day(dialect), Event.kind, Event.ts, Event.id)
+    return stmt.execution_options(yield_per=EVENTS_YIELD_PER)
+
+
+class _SummaryGroups:
+    # Writes [{"kind", "day", "events": [...]}, ...] incrementally, grouping
+    # events by UTC day and kind as the ordered rows stream past.
+
+    def __init__(self):
+        self._group = None
+        self._count = 0
+        self._pending: List[str] = ['[']
+
+    def add(self, row) -> Optional[str]:
+        group = (bucket_start(row.ts, 'day'), row.kind)
+        if group != self._group:
+            head = '' if self._group is None else ']},'
+            day, kind = group
+            self._pending.append(head + '{"kind":' + json.dumps(kind) + ',"day":' + json.dumps(day.isoformat()) + ',"events":[')
+            self._group = group
+        else:
+            self._pending.append(',')
+        self._pending.append(json.dumps(event_from_row(row), separators=(',', ':')))
+        self._count += 1
+        if self._count % EVENTS_YIELD_PER == 0:
+            return self._drain()
+        return None
+
+    def close(self) -> str:
+        self._pending.append(']' if self._group is None else ']}]')
+        return self._drain()
+
+    def _drain(self) -> str:
+        chunk = ''.join(self._pending)
+        self._pending = []
+        return chunk
+
+
+def _summary_body(session_factory: Callable[[], Session], from_: str, to: str, user_id: Optional[str]) -> Iterator[str]:
+    with session_factory() as db:
+        groups = _SummaryGroups()
+        for row in db.execute(_summary_stmt(db.get_bind().dialect.name, from_, to, user_id)):
+            chunk = groups.add(row)
+            if chunk:
+                yield chunk
+        yield groups.close()
+
+
+async def _summary_body_async(sessions: async_sessionmaker, from_: str, to: str, user_id: Optional[str]) -> AsyncIterator[str]:
+    async with sessions() as db:
+        groups = _SummaryGroups()
+        async for row in await db.stream(_summary_stmt(db.get_bind().dialect.name, from_, to, user_id)):
+            chunk = groups.add(row)
+            if chunk:
+                yield chunk
+        yield groups.close()
+
+
+class _EventsPage:
+    # Writes {"events": [...], "next_after": ...} incrementally so a page is
+    # never materialized in memory.
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._count = 0
+        self._last = None
+        self._more = False
+        self._pending: List[str] = ['{"events":[']
+
+    def add(self, row) -> Optional[str]:
+        if self._count == self._limit:
+            self._more = True
+            return None
+        prefix = ',' if self._count else ''
+        self._pending.append(prefix + json.dumps(event_from_row(row), separators=(',', ':')))
+        self._count += 1
+        self._last = row
+        if len(self._pending) >= EVENTS_YIELD_PER:
+            return self._drain()
+        return None
+
+    def close(self) -> str:
+        next_after = None
+        if self._more:
+            next_after = f'{format_ts(self._last.ts)},{self._last.id}'
+        self._pending.append('],"next_after":' + json.dumps(next_after) + '}')
+        return self._drain()
+
+    def _drain(self) -> str:
+        chunk = ''.join(self._pending)
+        self._pending = []
+        return chunk
+
+
+def _events_body(session_factory: Callable[[], Session], stmt, limit: int) -> Iterator[str]:
+    # The session is opened here rather than taken from get_db: the body is
+    # sent after the endpoint has returned.
+    with session_factory() as db:
+        page = _EventsPage(limit)
+        for row in db.execute(stmt):
+            chunk = page.add(row)
+            if chunk:
+                yield chunk
+        yield page.close()
+
+
+async def _events_body_async(sessions: async_sessionmaker, stmt, limit: int) -> AsyncIterator[str]:
+    async with sessions() as db:
+        page = _EventsPage(limit)
+        async for row in await db.stream(stmt):
+            chunk = page.add(row)
+            if chunk:
+                yield chunk
+        yield page.close()
+
+
+def _rollup_stmt(from_: str, to: str, aggregate: str, user_id: Optional[str]):
+    stmt = select(EventRollup).where(
+        EventRollup.granularity == aggregate,
+        EventRollup.bucket_start.between(from_, to),
     )
-    rows = db.execute(stmt).all()
-    return [
-        {
-            'kind': row.kind,
-            'day': row.day.isoformat(),
-            'events': row.events,
-        }
-        for row in rows
-    ]
+    if user_id is not None:
+        stmt = stmt.where(EventRollup.user_id == user_id)
+    return stmt.order_by(EventRollup.bucket_start, EventRollup.user_id, EventRollup.kind)
+
+
+def _rollup_rows(rollups):
+    rows = []
+    for rollup in rollups:
+        start = rollup.bucket_start
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        row = {'userId': rollup.user_id, 'kind': rollup.kind, 'bucket': start.isoformat(), 'count': rollup.count}
+        if rollup.kind == 'heart_rate':
+            row['bpm'] = {
+                'min': rollup.bpm_min,
+                'max': rollup.bpm_max,
+                'mean': rollup.bpm_sum / rollup.count if rollup.count else None,
+            }
+        elif rollup.kind == 'steps':
+            row['steps'] = rollup.steps_total
+        elif rollup.kind == 'sleep':
+            row['sleep_s'] = {stage: getattr(rollup, f'sleep_{stage}_s') for stage in SLEEP_STAGES}
+        rows.append(row)
+    return rows
+
+
+def summary(
+    from_: str,
+    to: str,
+    user_id: Optional[str] = None,
+    aggregate: Optional[Literal['hour', 'day']] = None,
+    session_factory: Callable[[], Session] = Depends(get_session_factory),
+):
+    if aggregate is not None:
+        with session_factory() as db:
+            return _rollup_rows(db.execute(_rollup_stmt(from_, to, aggregate, user_id)).scalars())
+    return StreamingResponse(_summary_body(session_factory, from_, to, user_id), media_type='application/json')
+
+
+async def summary_async(
+    from_: str,
+    to: str,
+    user_id: Optional[str] = None,
+    aggregate: Optional[Literal['hour', 'day']] = None,
+    sessions: async_sessionmaker = Depends(get_async_sessionmaker),
+):
+    if aggregate is not None:
+        async with sessions() as db:
+            return _rollup_rows((await db.execute(_rollup_stmt(from_, to, aggregate, user_id))).scalars())
+    return StreamingResponse(_summary_body_async(sessions, from_, to, user_id), media_type='application/json')
+
+
+def events(
+    from_: str,
+    to: str,
+    user_id: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(EVENTS_PAGE_DEFAULT, ge=1, le=EVENTS_PAGE_MAX),
+    session_factory: Callable[[], Session] = Depends(get_session_factory),
+):
+    stmt = _page_stmt(from_, to, user_id, after, limit)
+    return StreamingResponse(_events_body(session_factory, stmt, limit), media_type='application/json')
+
+
+async def events_async(
+    from_: str,
+    to: str,
+    user_id: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(EVENTS_PAGE_DEFAULT, ge=1, le=EVENTS_PAGE_MAX),
+    sessions: async_sessionmaker = Depends(get_async_sessionmaker),
+):
+    stmt = _page_stmt(from_, to, user_id, after, limit)
+    return StreamingResponse(_events_body_async(sessions, stmt, limit), media_type='application/json')
+
+
+app.add_api_route('/v1/summary', summary_async if _settings.io_mode == 'async' else summary, methods=['GET'])
+app.add_api_route('/v1/events', events_async if _settings.io_mode == 'async' else events, methods=['GET'])
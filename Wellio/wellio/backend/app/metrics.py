@@ -0,0 +1,63 @@
+from typing import Any, Callable, Dict
+import threading
+
+
+class _Timing:
+    __slots__ = ('count', 'total', 'max', 'last')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'last': self.last,
+        }
+
+
+class Metrics:
+    # In-process counters, timings and polled gauges, served as JSON by
+    # GET /v1/metrics. Names are dotted: '<component>.<metric>'.
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._timings: Dict[str, _Timing] = {}
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = _Timing()
+            timing.count += 1
+            timing.total += seconds
+            timing.last = seconds
+            timing.max = max(timing.max, seconds)
+
+    def gauge(self, name: str, read: Callable[[], Any]) -> None:
+        with self._lock:
+            self._gauges[name] = read
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: timing.snapshot() for name, timing in self._timings.items()}
+            gauges = dict(self._gauges)
+        return {
+            'counters': counters,
+            'timings': timings,
+            'gauges': {name: read() for name, read in gauges.items()},
+        }
+
+
+metrics = Metrics()
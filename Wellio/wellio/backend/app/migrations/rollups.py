@@ -0,0 +1,60 @@
+from typing import Optional
+import logging
+from sqlalchemy import delete, func, select
+from sqlalchemy.engine import Engine
+from ..ingest.pipeline import INSERT_CHUNK_ROWS
+from ..ingest.rollups import rollup_deltas, upsert_statement
+from ..models import Event, EventRollup
+
+logger = logging.getLogger(__name__)
+
+# Rebuilds event_rollups from events, e.g. after the table is first added.
+# Ingest keeps rollups current from then on; only events that existed when
+# the rebuild started are counted, so it can run while ingest is live
+# (transactions still in flight at that moment are the only blind spot).
+
+BATCH_ROWS = 5000
+_COLUMNS = (Event.id, Event.user_id, Event.kind, Event.ts, Event.bpm, Event.steps, Event.dur_s, Event.stage)
+
+
+def rebuild(engine: Engine, batch_rows: int = BATCH_ROWS) -> int:
+    with engine.begin() as conn:
+        max_id = conn.execute(select(func.max(Event.id))).scalar()
+        conn.execute(delete(EventRollup))
+    if max_id is None:
+        return 0
+    counted = 0
+    last_id = 0
+    while last_id < max_id:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(*_COLUMNS)
+                .where(Event.id > last_id, Event.id <= max_id)
+                .order_by(Event.id)
+                .limit(batch_rows)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            deltas = rollup_deltas(rows)
+            for start in range(0, len(deltas), INSERT_CHUNK_ROWS):
+                conn.execute(upsert_statement(engine.dialect.name, deltas[start:start + INSERT_CHUNK_ROWS]))
+        counted += len(rows)
+        logger.info('rollups: %d events counted (last id %d)', counted, last_id)
+    return counted
+
+
+def upgrade(engine: Optional[Engine] = None) -> int:
+    if engine is None:
+        from ..deps import engine
+    EventRollup.__table__.create(engine, checkfirst=True)
+    return rebuild(engine)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    print(f'counted {upgrade()} events')
+
+
+if __name__ == '__main__':
+    main()
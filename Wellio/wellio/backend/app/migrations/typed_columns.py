@@ -0,0 +1,74 @@
+from typing import Optional
+import logging
+from sqlalchemy import bindparam, inspect, select, text, update
+from sqlalchemy.engine import Engine
+from ..ingest.rows import MEASUREMENT_COLUMNS, split_payload
+from ..models import Event
+
+logger = logging.getLogger(__name__)
+
+# Moves bpm/steps/dur_s/stage out of events.payload into their typed columns
+# and strips the fields that already have columns from payload. Rows are
+# walked in id order, one transaction per batch, so the migration can be
+# stopped and rerun; rows whose payload no longer carries userId are done.
+
+BATCH_ROWS = 5000
+
+
+def add_columns(engine: Engine) -> None:
+    existing = {column['name'] for column in inspect(engine).get_columns(Event.__tablename__)}
+    with engine.begin() as conn:
+        for name in MEASUREMENT_COLUMNS:
+            if name not in existing:
+                column_type = Event.__table__.c[name].type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {Event.__tablename__} ADD COLUMN {name} {column_type}'))
+
+
+def backfill(engine: Engine, batch_rows: int = BATCH_ROWS) -> int:
+    table = Event.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam('_id'), table.c.ts == bindparam('_ts'))
+        .values({name: bindparam(name) for name in [*MEASUREMENT_COLUMNS, 'payload']})
+    )
+    migrated = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.ts, table.c.payload)
+                .where(table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_rows)
+            ).all()
+            if not rows:
+                return migrated
+            last_id = rows[-1].id
+            params = []
+            for row in rows:
+                event = row.payload or {}
+                if 'userId' not in event:
+                    continue
+                values = {name: event.get(name) for name in MEASUREMENT_COLUMNS}
+                params.append({'_id': row.id, '_ts': row.ts, 'payload': split_payload(event), **values})
+            if params:
+                conn.execute(stmt, params)
+        migrated += len(params)
+        logger.info('typed columns: %d rows migrated (last id %d)', migrated, last_id)
+
+
+def upgrade(engine: Optional[Engine] = None) -> int:
+    if engine is None:
+        from ..deps import engine
+    add_columns(engine)
+    return backfill(engine)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    migrated = upgrade()
+    print(f'migrated {migrated} rows')
+
+
+if __name__ == '__main__':
+    main()
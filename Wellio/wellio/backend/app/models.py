@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, Text, TIMESTAMP, String, JSON, Index, UniqueConstraint
+from sqlalchemy import Column, BigInteger, Float, Integer, Text, TIMESTAMP, String, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -7,13 +7,21 @@ Base = declarative_base()
 class Event(Base):
     __tablename__ = 'events'
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    # SQLite only autoincrements an INTEGER PRIMARY KEY (the rowid alias).
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
     user_id = Column(Text, nullable=False)
     kind = Column(String(32), nullable=False)
     ts = Column(TIMESTAMP(timezone=True), nullable=False)
     source = Column(String(64), nullable=False)
     device_vendor = Column(String(64))
     device_model = Column(String(64))
+    # Measurements live in typed columns (NULL for other kinds); payload only
+    # keeps the fields without a column of their own (meta, window, extra
+    # device fields).
+    bpm = Column(Float)
+    steps = Column(Integer)
+    dur_s = Column(Float)
+    stage = Column(String(16))
     payload = Column(JSON, nullable=False)
 
     __table_args__ = (
@@ -21,3 +29,27 @@ class Event(Base):
         Index('idx_events_user_ts', 'user_id', 'ts'),
         Index('idx_events_kind_ts', 'kind', 'ts'),
     )
+
+
+class EventRollup(Base):
+    # Per user/kind/bucket aggregates, upserted in the same transaction as the
+    # events they cover. bpm mean is bpm_sum / count.
+    __tablename__ = 'event_rollups'
+
+    user_id = Column(Text, primary_key=True)
+    kind = Column(String(32), primary_key=True)
+    granularity = Column(String(8), primary_key=True)
+    bucket_start = Column(TIMESTAMP(timezone=True), primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+    bpm_min = Column(Float)
+    bpm_max = Column(Float)
+    bpm_sum = Column(Float, nullable=False, default=0)
+    steps_total = Column(BigInteger, nullable=False, default=0)
+    sleep_light_s = Column(Float, nullable=False, default=0)
+    sleep_deep_s = Column(Float, nullable=False, default=0)
+    sleep_rem_s = Column(Float, nullable=False, default=0)
+    sleep_awake_s = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('idx_event_rollups_granularity_bucket', 'granularity', 'bucket_start'),
+    )
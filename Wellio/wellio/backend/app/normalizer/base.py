@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from typing import Iterable, Dict, Any
+from .batch import Normalized, group_events
 
 
 class Normalizer(ABC):
@@ -10,3 +11,8 @@ class Normalizer(ABC):
     @abstractmethod
     def normalize(self, payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
         raise NotImplementedError
+
+    def normalize_batches(self, payload: Dict[str, Any]) -> Iterable[Normalized]:
+        # Columnar form of normalize(); override where the payload can be
+        # turned into arrays without building the dicts first.
+        return group_events(self.normalize(payload))
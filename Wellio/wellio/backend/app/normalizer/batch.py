@@ -0,0 +1,199 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+import numpy as np
+from ..ingest.rollups import SLEEP_STAGES
+from ..ingest.rows import format_ts_array, parse_ts, split_payload
+
+# Columnar form of normalized events. An EventBatch holds events of one kind
+# that share everything but ts and their measurements (userId, source,
+# device, window, meta): the shared fields are stored once in header, ts as a
+# datetime64[us] array of naive UTC instants and the measurements as typed
+# arrays. NaN marks a missing float value; stage is stored as an index into
+# STAGES. Events that do not fit (unparseable ts, a stage outside the enum, a
+# non-numeric measurement, per-beat RR intervals) stay plain dicts next to the
+# batches, so normalizers produce a mix of both (Normalized).
+
+STAGES = list(SLEEP_STAGES)
+_STAGE_CODES = {stage: code for code, stage in enumerate(STAGES)}
+
+KIND_COLUMNS = {
+    'heart_rate': ('bpm',),
+    'steps': ('steps',),
+    'sleep': ('stage', 'dur_s'),
+}
+_DTYPES = {'bpm': np.float64, 'steps': np.float64, 'dur_s': np.float64, 'stage': np.uint8}
+# Stand-ins that pass the schema, for validating a header on its own.
+_PLACEHOLDERS = {'bpm': 0, 'steps': 0, 'dur_s': 0, 'stage': STAGES[0]}
+
+MAX_BATCH_EVENTS = 8192
+
+
+class EventBatch:
+    __slots__ = ('header', 'ts', 'columns')
+
+    def __init__(self, header: Dict[str, Any], ts: np.ndarray, columns: Dict[str, np.ndarray]):
+        self.header = header
+        self.ts = ts.astype('datetime64[us]', copy=False)
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    @property
+    def kind(self) -> str:
+        return self.header['kind']
+
+    @property
+    def nbytes(self) -> int:
+        return self.ts.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def ts_text(self) -> List[str]:
+        return format_ts_array(self.ts)
+
+    def values(self, column: str) -> List[Any]:
+        # Python values per event; None where missing.
+        values = self.columns[column]
+        if column == 'stage':
+            return [STAGES[code] for code in values.tolist()]
+        present = (~np.isnan(values)).tolist()
+        if column == 'steps':
+            return [int(value) if ok else None for value, ok in zip(values.tolist(), present)]
+        return [value if ok else None for value, ok in zip(values.tolist(), present)]
+
+    def _measurements(self) -> List[List[Any]]:
+        return [self.values(column) for column in self.columns]
+
+    def events(self) -> Iterator[Dict[str, Any]]:
+        names = list(self.columns)
+        for ts, *measurements in zip(self.ts_text(), *self._measurements()):
+            event = dict(self.header)
+            event['ts'] = ts
+            for name, value in zip(names, measurements):
+                if value is not None:
+                    event[name] = value
+            yield event
+
+    def event(self, index: int) -> Dict[str, Any]:
+        return next(self.slice(index, index + 1).events())
+
+    def slice(self, start: int, stop: int) -> 'EventBatch':
+        return EventBatch(self.header, self.ts[start:stop], {name: values[start:stop] for name, values in self.columns.items()})
+
+    def template(self) -> Dict[str, Any]:
+        # The header as one schema-valid event, to validate it once per batch.
+        event = {**self.header, 'ts': '2000-01-01T00:00:00Z'}
+        for column in self.columns:
+            event[column] = _PLACEHOLDERS[column]
+        return event
+
+    def rows(self, indices: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+        # event_row() of each event, built straight from the arrays.
+        device = self.header.get('device', {})
+        base = {
+            'user_id': self.header['userId'],
+            'kind': self.kind,
+            'source': self.header['source'],
+            'device_vendor': device.get('vendor'),
+            'device_model': device.get('model'),
+            'payload': split_payload(self.header),
+            'bpm': None,
+            'steps': None,
+            'dur_s': None,
+            'stage': None,
+        }
+        batch = self if indices is None else EventBatch(
+            self.header,
+            self.ts[list(indices)],
+            {name: values[list(indices)] for name, values in self.columns.items()},
+        )
+        names = list(batch.columns)
+        rows = []
+        for ts, *measurements in zip(batch.ts.tolist(), *batch._measurements()):
+            row = dict(base)
+            row['ts'] = ts.replace(tzinfo=timezone.utc)
+            row.update(zip(names, measurements))
+            rows.append(row)
+        return rows
+
+
+Normalized = Union[EventBatch, Dict[str, Any]]
+
+
+def _measurement(column: str, value: Any) -> Any:
+    # The typed form of a value, or None if it has none.
+    if column == 'stage':
+        return _STAGE_CODES.get(value) if isinstance(value, str) else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if column == 'steps' and not float(value).is_integer():
+        return None
+    return float(value)
+
+
+def _utc_instant(ts: Any) -> Optional[datetime]:
+    if not isinstance(ts, str):
+        return None
+    try:
+        instant = parse_ts(ts)
+    except ValueError:
+        return None
+    return instant.replace(tzinfo=None)
+
+
+class _Builder:
+    def __init__(self, header: Dict[str, Any]):
+        self.header = header
+        self.ts: List[datetime] = []
+        self.columns: Dict[str, List[Any]] = {column: [] for column in KIND_COLUMNS[header['kind']]}
+
+    def add(self, ts: datetime, values: Dict[str, Any]) -> None:
+        self.ts.append(ts)
+        for column, column_values in self.columns.items():
+            column_values.append(values[column])
+
+    def build(self) -> EventBatch:
+        return EventBatch(
+            self.header,
+            np.array(self.ts, dtype='datetime64[us]'),
+            {column: np.array(values, dtype=_DTYPES[column]) for column, values in self.columns.items()},
+        )
+
+
+def group_events(events: Iterable[Any], max_events: int = MAX_BATCH_EVENTS) -> Iterator[Normalized]:
+    # Runs of events with the same header become one EventBatch each (at most
+    # max_events long); everything else is passed through unchanged.
+    builder: Optional[_Builder] = None
+    for event in events:
+        columns = KIND_COLUMNS.get(event.get('kind')) if isinstance(event, dict) and 'rr' not in event else None
+        ts = _utc_instant(event.get('ts')) if columns else None
+        values: Dict[str, Any] = {}
+        if ts is not None:
+            for column in columns:  # type: ignore[union-attr]
+                value = event.get(column)
+                values[column] = _measurement(column, value) if value is not None else (None if column == 'stage' else np.nan)
+        if ts is None or any(value is None for value in values.values()):
+            if builder is not None:
+                yield builder.build()
+                builder = None
+            yield event
+            continue
+        header = {key: value for key, value in event.items() if key != 'ts' and key not in columns}  # type: ignore[operator]
+        if builder is None or builder.header != header or len(builder.ts) >= max_events:
+            if builder is not None:
+                yield builder.build()
+            builder = _Builder(header)
+        builder.add(ts, values)
+    if builder is not None:
+        yield builder.build()
+
+
+def iter_events(items: Iterable[Normalized]) -> Iterator[Dict[str, Any]]:
+    for item in items:
+        if isinstance(item, EventBatch):
+            yield from item.events()
+        else:
+            yield item
+
+
+def count_events(items: Sequence[Normalized]) -> int:
+    return sum(len(item) if isinstance(item, EventBatch) else 1 for item in items)
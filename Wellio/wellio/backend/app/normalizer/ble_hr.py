@@ -1,28 +1,190 @@
-from typing import Dict, Any, Iterable
+from typing import Dict, Any, Iterable, List, Optional, Sequence
 from datetime import datetime
 import base64
+import binascii
+import struct
+import numpy as np
+from .base import Normalizer
+
+# Heart Rate Measurement characteristic (0x2A37):
+#   flags                uint8
+#   heart rate           uint8, or uint16 LE if flags bit 0
+#   energy expended      uint16 LE kJ, if flags bit 3
+#   RR intervals         uint16 LE each in 1/1024 s, if flags bit 4, to the end
+# Bits 1-2 are the sensor contact status: bit 2 says the sensor reports it,
+# bit 1 that skin contact is detected.
+HR_UINT16 = 0x01
+CONTACT_DETECTED = 0x02
+CONTACT_SUPPORTED = 0x04
+ENERGY_PRESENT = 0x08
+RR_PRESENT = 0x10
+RR_UNITS_PER_S = 1024
+
+_RR_MS = 1000 / RR_UNITS_PER_S
+_UINT16 = struct.Struct('<H')
+# Gathers for truncated frames may read this far past the last frame; they
+# are masked out afterwards.
+_PADDING = np.zeros(8, dtype=np.uint8)
+
+
+def decode_hr_measurement(data: bytes) -> Dict[str, Any]:
+    # One frame as event fields: bpm, plus rr (milliseconds), energy_kj and
+    # sensor_contact when the frame carries them.
+    view = memoryview(data)
+    if not view:
+        raise ValueError('empty heart rate measurement')
+    flags = view[0]
+    offset = 3 if flags & HR_UINT16 else 2
+    if flags & ENERGY_PRESENT:
+        offset += 2
+    if len(view) < offset:
+        raise ValueError(f'heart rate measurement truncated at {len(view)} bytes')
+    fields: Dict[str, Any] = {'bpm': _UINT16.unpack_from(view, 1)[0] if flags & HR_UINT16 else view[1]}
+    if flags & ENERGY_PRESENT:
+        fields['energy_kj'] = _UINT16.unpack_from(view, offset - 2)[0]
+    if flags & RR_PRESENT:
+        count = (len(view) - offset) // 2
+        fields['rr'] = [raw * _RR_MS for raw in struct.unpack_from(f'<{count}H', view, offset)]
+    if flags & CONTACT_SUPPORTED:
+        fields['sensor_contact'] = bool(flags & CONTACT_DETECTED)
+    return fields
 
 
 def parse_hr_measurement(frame_b64: str) -> int:
-    data = base64.b64decode(frame_b64)
-    if not data:
-        return 0
-    flags = data[0]
-    if flags & 0x01:
-        return int.from_bytes(data[1:3], byteorder='little')
-    return data[1]
+    return decode_hr_measurement(base64.b64decode(frame_b64))['bpm']
 
 
-def normalize_ble_notification(payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
-    bpm = payload.get('bpm')
-    if bpm is None and 'frame' in payload:
-        bpm = parse_hr_measurement(payload['frame'])
-    yield {
+class HrFrames:
+    # decode_hr_frames() output: one entry per frame in each array, and the
+    # RR intervals of all frames back to back, frame i's being
+    # rr_ms[rr_offsets[i]:rr_offsets[i + 1]].
+    __slots__ = ('valid', 'bpm', 'energy_kj', 'has_energy', 'contact', 'rr_ms', 'rr_offsets', 'has_rr')
+
+    def __init__(self, valid, bpm, energy_kj, has_energy, contact, rr_ms, rr_offsets, has_rr):
+        self.valid = valid
+        self.bpm = bpm
+        self.energy_kj = energy_kj
+        self.has_energy = has_energy
+        # -1 where the sensor does not report contact, else 0 or 1.
+        self.contact = contact
+        self.rr_ms = rr_ms
+        self.rr_offsets = rr_offsets
+        self.has_rr = has_rr
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+    def fields(self) -> List[Optional[Dict[str, Any]]]:
+        # decode_hr_measurement() of every frame; None for malformed frames.
+        rr = self.rr_ms.tolist()
+        offsets = self.rr_offsets.tolist()
+        decoded: List[Optional[Dict[str, Any]]] = []
+        for index, (valid, bpm, energy, has_energy, contact, has_rr) in enumerate(zip(
+            self.valid.tolist(),
+            self.bpm.tolist(),
+            self.energy_kj.tolist(),
+            self.has_energy.tolist(),
+            self.contact.tolist(),
+            self.has_rr.tolist(),
+        )):
+            if not valid:
+                decoded.append(None)
+                continue
+            fields: Dict[str, Any] = {'bpm': bpm}
+            if has_energy:
+                fields['energy_kj'] = energy
+            if has_rr:
+                fields['rr'] = rr[offsets[index]:offsets[index + 1]]
+            if contact >= 0:
+                fields['sensor_contact'] = bool(contact)
+            decoded.append(fields)
+        return decoded
+
+
+def decode_hr_frames(frames: Sequence[bytes]) -> HrFrames:
+    # Every frame at once: the frames are joined into one byte array and each
+    # field is gathered for all of them with index arithmetic.
+    lengths = np.fromiter(map(len, frames), dtype=np.int64, count=len(frames))
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    data = np.concatenate([np.frombuffer(b''.join(frames), dtype=np.uint8), _PADDING])
+
+    flags = np.where(lengths > 0, data[starts], 0)
+    wide = (flags & HR_UINT16) != 0
+    has_energy = (flags & ENERGY_PRESENT) != 0
+    rr_start = starts + np.where(wide, 3, 2) + np.where(has_energy, 2, 0)
+    valid = (lengths > 0) & (rr_start <= ends)
+
+    first = data[starts + 1].astype(np.int64)
+    bpm = np.where(wide, first | (data[starts + 2].astype(np.int64) << 8), first)
+    energy_at = rr_start - 2
+    energy_kj = data[energy_at].astype(np.int64) | (data[energy_at + 1].astype(np.int64) << 8)
+    contact = np.where((flags & CONTACT_SUPPORTED) != 0, ((flags & CONTACT_DETECTED) != 0).astype(np.int8), -1)
+
+    has_rr = valid & ((flags & RR_PRESENT) != 0)
+    counts = np.where(has_rr, (ends - rr_start) // 2, 0)
+    rr_offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+    np.cumsum(counts, out=rr_offsets[1:])
+    # Byte position of every RR interval: its frame's first RR byte plus two
+    # bytes per interval before it in that frame.
+    positions = np.repeat(rr_start - 2 * rr_offsets[:-1], counts) + 2 * np.arange(rr_offsets[-1])
+    rr_raw = data[positions].astype(np.int64) | (data[positions + 1].astype(np.int64) << 8)
+
+    return HrFrames(valid, bpm, energy_kj, has_energy & valid, contact, rr_raw * _RR_MS, rr_offsets, has_rr)
+
+
+def _event(payload: Dict[str, Any], fields: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    event = {
         'kind': 'heart_rate',
         'userId': payload.get('userId', 'unknown-user'),
         'source': 'ble',
         'ts': payload.get('ts', datetime.utcnow().isoformat()),
-        'bpm': bpm,
+        'bpm': payload.get('bpm'),
         'device': payload.get('device', {}),
         'meta': payload.get('meta'),
     }
+    if fields:
+        contact = fields.pop('sensor_contact', None)
+        event.update(fields)
+        if contact is not None:
+            event['meta'] = {**(event['meta'] or {}), 'sensor_contact': contact}
+    return event
+
+
+def _frame_bytes(frame: Any) -> bytes:
+    # Malformed base64 decodes to an empty, invalid frame.
+    try:
+        return binascii.a2b_base64(frame)
+    except (binascii.Error, TypeError, ValueError):
+        return b''
+
+
+def normalize_ble_notification(payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    fields = None
+    if payload.get('bpm') is None and 'frame' in payload:
+        try:
+            fields = decode_hr_measurement(_frame_bytes(payload['frame']))
+        except ValueError:
+            # Leaves bpm unset, so the event fails validation.
+            pass
+    yield _event(payload, fields)
+
+
+def normalize_ble_frames(payloads: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # normalize_ble_notification() for a list of notifications, with all
+    # their frames decoded in one decode_hr_frames() call.
+    framed = [index for index, payload in enumerate(payloads) if payload.get('bpm') is None and 'frame' in payload]
+    decoded: List[Optional[Dict[str, Any]]] = [None] * len(payloads)
+    if framed:
+        fields = decode_hr_frames([_frame_bytes(payloads[index]['frame']) for index in framed]).fields()
+        for index, frame_fields in zip(framed, fields):
+            decoded[index] = frame_fields
+    return [_event(payload, fields) for payload, fields in zip(payloads, decoded)]
+
+
+class BleNormalizer(Normalizer):
+    def accepts(self, source: str) -> bool:
+        return source == 'ble'
+
+    def normalize(self, payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        return normalize_ble_notification(payload)
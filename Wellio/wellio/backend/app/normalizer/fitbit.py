@@ -1,20 +1,117 @@
-from typing import Dict, Any, Iterable, List
+from typing import Dict, Any, Iterable, Iterator, List, Optional
 from datetime import datetime, timezone
+from itertools import islice
+import numpy as np
+from .base import Normalizer
+from .batch import EventBatch, Normalized, group_events
 
+# Intraday heart rate is converted a chunk of samples at a time: the
+# 'HH:MM:SS' times are parsed as a byte matrix and added to the day as
+# datetime64 offsets, so a 1 Hz day (86,400 samples) needs no per-sample
+# datetime work. Chunks bound memory when the dataset is a lazily decoded
+# array (see webhooks/payloads.py).
+HR_CHUNK_SAMPLES = 8192
 
-def normalize_fitbit(payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
-    user_id = payload.get('user_id', 'fitbit-user')
-    device_info = payload.get('device', {})
-    for hr_sample in payload.get('heart_rate', {}).get('dataset', []):
-        ts = datetime.fromisoformat(f"{payload['dateTime']}T{hr_sample['time']}").replace(tzinfo=timezone.utc)
+_COLON = ord(':')
+_ZERO = ord('0')
+
+
+def _heart_rate_scalar(day: str, samples: List[Dict[str, Any]]) -> List[str]:
+    return [
+        datetime.fromisoformat(f"{day}T{sample['time']}").replace(tzinfo=timezone.utc).isoformat()
+        for sample in samples
+    ]
+
+
+def _seconds_of_day(times: List[Any]) -> Optional[np.ndarray]:
+    # None unless every time is exactly 'HH:MM:SS'; anything else takes the
+    # scalar path, which accepts or rejects it as before.
+    if not all(isinstance(time, str) and len(time) == 8 for time in times):
+        return None
+    try:
+        raw = np.frombuffer(''.join(times).encode('ascii'), dtype=np.uint8).reshape(-1, 8)
+    except UnicodeEncodeError:
+        return None
+    if not ((raw[:, 2] == _COLON) & (raw[:, 5] == _COLON)).all():
+        return None
+    digits = raw[:, [0, 1, 3, 4, 6, 7]].astype(np.int64) - _ZERO
+    if ((digits < 0) | (digits > 9)).any():
+        return None
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    minutes = digits[:, 2] * 10 + digits[:, 3]
+    seconds = digits[:, 4] * 10 + digits[:, 5]
+    if (hours > 23).any() or (minutes > 59).any() or (seconds > 59).any():
+        return None
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def _heart_rate_instants(day: str, samples: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+    # datetime64[s] UTC instants, or None if the fast path does not apply.
+    try:
+        start = np.datetime64(datetime.fromisoformat(f'{day}T00:00:00'), 's')
+        offsets = _seconds_of_day([sample['time'] for sample in samples])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if offsets is None:
+        return None
+    return start + offsets.astype('timedelta64[s]')
+
+
+def heart_rate_timestamps(day: str, samples: List[Dict[str, Any]]) -> List[str]:
+    # Same strings as the per-sample datetime path: '2023-09-01T00:00:05+00:00'.
+    instants = _heart_rate_instants(day, samples)
+    if instants is None:
+        return _heart_rate_scalar(day, samples)
+    return [stamp + '+00:00' for stamp in np.datetime_as_string(instants, unit='s').tolist()]
+
+
+def _chunks(payload: Dict[str, Any], chunk_samples: int) -> Iterator[List[Dict[str, Any]]]:
+    samples = iter(payload.get('heart_rate', {}).get('dataset', []))
+    while True:
+        chunk = list(islice(samples, chunk_samples))
+        if not chunk:
+            return
+        yield chunk
+
+
+def fitbit_heart_rate_batches(
+    payload: Dict[str, Any],
+    chunk_samples: int = HR_CHUNK_SAMPLES,
+) -> Iterator[Dict[str, Any]]:
+    # The intraday dataset as columnar batches (the /v1/telemetry:batch
+    # columnar form), one per chunk of samples.
+    for chunk in _chunks(payload, chunk_samples):
         yield {
             'kind': 'heart_rate',
-            'userId': user_id,
+            'userId': payload.get('user_id', 'fitbit-user'),
             'source': 'vendor_fitbit',
-            'ts': ts.isoformat(),
-            'bpm': hr_sample['value'],
-            'device': device_info,
+            'device': payload.get('device', {}),
+            'columns': {
+                'ts': heart_rate_timestamps(payload['dateTime'], chunk),
+                'bpm': [sample['value'] for sample in chunk],
+            },
         }
+
+
+def _heart_rate_events(payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    user_id = payload.get('user_id', 'fitbit-user')
+    device_info = payload.get('device', {})
+    for batch in fitbit_heart_rate_batches(payload):
+        columns = batch['columns']
+        for ts, bpm in zip(columns['ts'], columns['bpm']):
+            yield {
+                'kind': 'heart_rate',
+                'userId': user_id,
+                'source': 'vendor_fitbit',
+                'ts': ts,
+                'bpm': bpm,
+                'device': device_info,
+            }
+
+
+def _daily_events(payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    user_id = payload.get('user_id', 'fitbit-user')
+    device_info = payload.get('device', {})
     steps = payload.get('steps', {})
     if steps:
         yield {
@@ -37,3 +134,39 @@ def normalize_fitbit(payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
             'dur_s': session.get('duration', 0) / 1000,
             'device': device_info,
         }
+
+
+def normalize_fitbit(payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    yield from _heart_rate_events(payload)
+    yield from _daily_events(payload)
+
+
+def _heart_rate_event_batches(payload: Dict[str, Any], chunk_samples: int) -> Iterator[Normalized]:
+    # Straight from the dataset to arrays; chunks the fast path cannot take
+    # go through the dicts.
+    header = {
+        'kind': 'heart_rate',
+        'userId': payload.get('user_id', 'fitbit-user'),
+        'source': 'vendor_fitbit',
+        'device': payload.get('device', {}),
+    }
+    for chunk in _chunks(payload, chunk_samples):
+        instants = _heart_rate_instants(payload['dateTime'], chunk)
+        values = [sample['value'] for sample in chunk]
+        if instants is not None and all(type(value) in (int, float) for value in values):
+            yield EventBatch(header, instants, {'bpm': np.array(values, dtype=np.float64)})
+            continue
+        timestamps = _heart_rate_scalar(payload['dateTime'], chunk)
+        yield from group_events({**header, 'ts': ts, 'bpm': bpm} for ts, bpm in zip(timestamps, values))
+
+
+class FitbitNormalizer(Normalizer):
+    def accepts(self, source: str) -> bool:
+        return source == 'vendor_fitbit'
+
+    def normalize(self, payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        return normalize_fitbit(payload)
+
+    def normalize_batches(self, payload: Dict[str, Any]) -> Iterable[Normalized]:
+        yield from _heart_rate_event_batches(payload, HR_CHUNK_SAMPLES)
+        yield from group_events(_daily_events(payload))
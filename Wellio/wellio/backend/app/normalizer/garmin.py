@@ -1,5 +1,6 @@
 from typing import Dict, Any, Iterable
 from datetime import datetime
+from .base import Normalizer
 
 
 def normalize_garmin(payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
@@ -35,3 +36,11 @@ def normalize_garmin(payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
             'dur_s': sleep.get('durationInSeconds', 0),
             'device': device,
         }
+
+
+class GarminNormalizer(Normalizer):
+    def accepts(self, source: str) -> bool:
+        return source == 'vendor_garmin'
+
+    def normalize(self, payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        return normalize_garmin(payload)
@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import Dict, Any, Iterable
+from .base import Normalizer
 
 
 def normalize_health(payload: Dict[str, Any], source: str) -> Iterable[Dict[str, Any]]:
@@ -49,3 +50,16 @@ def normalize_health(payload: Dict[str, Any], source: str) -> Iterable[Dict[str,
             'stage': stage,
             'dur_s': float(payload.get('dur_s') or payload.get('duration', 0)),
         }
+
+
+class HealthNormalizer(Normalizer):
+    # One instance per on-device store ('healthkit', 'health_connect').
+
+    def __init__(self, source: str):
+        self.source = source
+
+    def accepts(self, source: str) -> bool:
+        return source == self.source
+
+    def normalize(self, payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        return normalize_health(payload, self.source)
@@ -1,4 +1,5 @@
 from typing import Dict, Any, Iterable
+from .base import Normalizer
 
 
 def normalize_oura(payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
@@ -24,3 +25,11 @@ def normalize_oura(payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
                 'dur_s': stage['duration'],
                 'device': device,
             }
+
+
+class OuraNormalizer(Normalizer):
+    def accepts(self, source: str) -> bool:
+        return source == 'vendor_oura'
+
+    def normalize(self, payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        return normalize_oura(payload)
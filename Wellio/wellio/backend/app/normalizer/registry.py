@@ -0,0 +1,25 @@
+from typing import List
+from .base import Normalizer
+from .ble_hr import BleNormalizer
+from .fitbit import FitbitNormalizer
+from .garmin import GarminNormalizer
+from .hk_hc import HealthNormalizer
+from .oura import OuraNormalizer
+from .withings import WithingsNormalizer
+
+NORMALIZERS: List[Normalizer] = [
+    HealthNormalizer('healthkit'),
+    HealthNormalizer('health_connect'),
+    BleNormalizer(),
+    FitbitNormalizer(),
+    GarminNormalizer(),
+    OuraNormalizer(),
+    WithingsNormalizer(),
+]
+
+
+def get_normalizer(source: str) -> Normalizer:
+    for normalizer in NORMALIZERS:
+        if normalizer.accepts(source):
+            return normalizer
+    raise KeyError(f'no normalizer for source {source!r}')
@@ -1,4 +1,5 @@
 from typing import Dict, Any, Iterable
+from .base import Normalizer
 
 
 def normalize_withings(payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
@@ -25,3 +26,11 @@ def normalize_withings(payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
             'dur_s': sleep.get('duration', 0),
             'device': device,
         }
+
+
+class WithingsNormalizer(Normalizer):
+    def accepts(self, source: str) -> bool:
+        return source == 'vendor_withings'
+
+    def normalize(self, payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        return normalize_withings(payload)
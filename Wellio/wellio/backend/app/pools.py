@@ -0,0 +1,78 @@
+from typing import Any, Dict
+import time
+from redis import BlockingConnectionPool
+from redis.asyncio import BlockingConnectionPool as AsyncBlockingConnectionPool
+from sqlalchemy.engine import Engine
+from .metrics import metrics
+
+
+def _idle(pool: Any) -> int:
+    # Blocking pools pre-fill their LIFO queue with None placeholders; only
+    # real connections sitting in it are idle.
+    queue = getattr(pool.pool, 'queue', None)
+    if queue is None:
+        queue = pool.pool._queue  # asyncio.LifoQueue
+    return sum(1 for connection in list(queue) if connection is not None)
+
+
+def pool_stats(pool: Any) -> Dict[str, int]:
+    created = len(pool._connections)
+    idle = _idle(pool)
+    return {
+        'max': pool.max_connections,
+        'created': created,
+        'idle': idle,
+        'in_use': created - idle,
+    }
+
+
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    # Application-wide Redis pool: bounded, waits up to `timeout` for a free
+    # connection instead of opening a new socket per request, and records
+    # checkout wait time and failures under '<name>.*'.
+
+    metrics_name = 'redis_pool'
+
+    def get_connection(self, command_name, *keys, **options):
+        started = time.perf_counter()
+        try:
+            return super().get_connection(command_name, *keys, **options)
+        except Exception:
+            metrics.incr(f'{self.metrics_name}.errors')
+            raise
+        finally:
+            metrics.observe(f'{self.metrics_name}.checkout_seconds', time.perf_counter() - started)
+
+
+class InstrumentedAsyncConnectionPool(AsyncBlockingConnectionPool):
+    metrics_name = 'async_redis_pool'
+
+    async def get_connection(self, command_name, *keys, **options):
+        started = time.perf_counter()
+        try:
+            return await super().get_connection(command_name, *keys, **options)
+        except Exception:
+            metrics.incr(f'{self.metrics_name}.errors')
+            raise
+        finally:
+            metrics.observe(f'{self.metrics_name}.checkout_seconds', time.perf_counter() - started)
+
+
+def register_redis_pool_metrics(pool: Any) -> None:
+    metrics.gauge(f'{pool.metrics_name}.connections', lambda: pool_stats(pool))
+
+
+def register_db_pool_metrics(engine: Engine, name: str = 'db_pool') -> None:
+    pool = engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return
+
+    def read() -> Dict[str, int]:
+        return {
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': pool.overflow(),
+        }
+
+    metrics.gauge(f'{name}.connections', read)
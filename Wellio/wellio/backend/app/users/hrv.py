@@ -0,0 +1,300 @@
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json
+import math
+import numpy as np
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy import select
+from ..metrics import metrics
+from ..models import Event
+
+# Heart rate variability per UTC-aligned window (hour or day). Beat-to-beat
+# intervals come from the `rr` lists BLE events keep in their payload; a
+# window without any falls back to 60000 / bpm of high-rate heart rate
+# samples (rr_source 'bpm'), which only yields metrics where samples are at
+# most MAX_GAP_S apart. Intervals outside RR_MIN_MS..RR_MAX_MS are artifacts
+# and dropped; successive differences are only taken between intervals of
+# one recording (no gap over MAX_GAP_S, no dropped interval in between).
+# All windows of a range are computed in one pass of array arithmetic.
+
+HRV_WINDOWS = {'hour': 3600, 'day': 86400}
+RR_MIN_MS = 300.0
+RR_MAX_MS = 2000.0
+MAX_GAP_S = 5.0
+# Intervals (and successive differences) a window needs for metrics.
+MIN_BEATS = 30
+NN50_MS = 50.0
+# resting_bpm is this percentile of the window's heart rate samples.
+RESTING_PERCENTILE = 5
+
+HRV_CACHE_PREFIX = 'hrv:'
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NAIVE_EPOCH = _EPOCH.replace(tzinfo=None)
+_SECOND = timedelta(seconds=1)
+
+
+def window_starts(start: datetime, end: datetime, width: int) -> List[datetime]:
+    # Windows overlapping [start, end), aligned to multiples of width.
+    first = int((start - _EPOCH).total_seconds() // width) * width
+    last = math.ceil((end - _EPOCH).total_seconds())
+    return [_EPOCH + timedelta(seconds=offset) for offset in range(first, last, width)]
+
+
+def hrv_stmt(user_id: str, start: datetime, end: datetime):
+    return (
+        select(Event.ts, Event.bpm, Event.payload)
+        .where(Event.user_id == user_id, Event.kind == 'heart_rate', Event.ts >= start, Event.ts < end)
+        .order_by(Event.ts)
+    )
+
+
+def _epoch_seconds(values: Sequence[datetime]) -> np.ndarray:
+    # SQLite hands back naive timestamps, which are stored in UTC.
+    return np.fromiter(
+        ((ts - (_EPOCH if ts.tzinfo is not None else _NAIVE_EPOCH)) / _SECOND for ts in values),
+        dtype=np.float64,
+        count=len(values),
+    )
+
+
+def _rr_lists(payloads: Sequence[Any]) -> List[List[float]]:
+    lists = []
+    for payload in payloads:
+        rr = payload.get('rr') if isinstance(payload, dict) else None
+        lists.append(rr if isinstance(rr, list) else [])
+    return lists
+
+
+def _interval_stats(ts: np.ndarray, window: np.ndarray, counts: np.ndarray, intervals: np.ndarray, windows: int):
+    # Per window: interval count, sum and sum of squares, then the count, sum
+    # of squares and NN50 count of successive differences. ts, window and
+    # counts are per event; intervals holds the events' intervals back to back.
+    has = counts > 0
+    ts, window, counts = ts[has], window[has], counts[has]
+    breaks = np.ones(len(ts), dtype=bool)
+    breaks[1:] = (np.diff(ts) > MAX_GAP_S) | (window[1:] != window[:-1])
+    beat_break = np.zeros(len(intervals), dtype=bool)
+    beat_break[np.cumsum(counts) - counts] = breaks
+    valid = (intervals >= RR_MIN_MS) & (intervals <= RR_MAX_MS)
+    # A dropped interval starts a new recording for the one after it.
+    recording = np.cumsum(beat_break | ~valid)[valid]
+    beat_window = np.repeat(window, counts)[valid]
+    beats = intervals[valid]
+
+    n = np.bincount(beat_window, minlength=windows)
+    total = np.bincount(beat_window, beats, minlength=windows)
+    squares = np.bincount(beat_window, beats * beats, minlength=windows)
+    same = recording[1:] == recording[:-1]
+    diffs = np.diff(beats)[same]
+    diff_window = beat_window[1:][same]
+    n_diffs = np.bincount(diff_window, minlength=windows)
+    diff_squares = np.bincount(diff_window, diffs * diffs, minlength=windows)
+    nn50 = np.bincount(diff_window, np.abs(diffs) > NN50_MS, minlength=windows)
+    return n, total, squares, n_diffs, diff_squares, nn50
+
+
+def _metrics(stats) -> Dict[str, np.ndarray]:
+    n, total, squares, n_diffs, diff_squares, nn50 = stats
+    enough = (n >= MIN_BEATS) & (n_diffs >= MIN_BEATS)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = np.maximum(squares - total * total / n, 0) / (n - 1)
+        return {
+            'beats': n,
+            'rmssd_ms': np.where(enough, np.sqrt(diff_squares / n_diffs), np.nan),
+            'sdnn_ms': np.where(enough, np.sqrt(variance), np.nan),
+            'pnn50': np.where(enough, 100 * nn50 / n_diffs, np.nan),
+        }
+
+
+def _resting_bpm(window: np.ndarray, bpm: np.ndarray, windows: int) -> np.ndarray:
+    # Nearest-rank percentile per window: sort by (window, bpm) and pick the
+    # rank inside each window's run.
+    present = ~np.isnan(bpm)
+    window, bpm = window[present], bpm[present]
+    order = np.lexsort((bpm, window))
+    counts = np.bincount(window, minlength=windows)
+    firsts = np.cumsum(counts) - counts
+    ranks = np.round((counts - 1) * RESTING_PERCENTILE / 100).astype(np.int64)
+    resting = np.full(windows, np.nan)
+    filled = counts > 0
+    resting[filled] = bpm[order][firsts[filled] + ranks[filled]]
+    return resting
+
+
+def hrv_columns(rows: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # hrv_stmt() rows as arrays: ts (epoch seconds), bpm (NaN if missing),
+    # RR intervals per event and all RR intervals back to back.
+    ts = _epoch_seconds([row.ts for row in rows])
+    bpm = np.array([row.bpm if row.bpm is not None else np.nan for row in rows], dtype=np.float64)
+    rr_lists = _rr_lists([row.payload for row in rows])
+    rr_counts = np.fromiter(map(len, rr_lists), dtype=np.int64, count=len(rr_lists))
+    rr = np.fromiter(chain.from_iterable(rr_lists), dtype=np.float64, count=int(rr_counts.sum()))
+    return ts, bpm, rr_counts, rr
+
+
+def compute_windows(columns: Tuple[np.ndarray, ...], origin: datetime, width: int, windows: int) -> List[Dict[str, Any]]:
+    # columns are hrv_columns() of the rows in [origin, origin + windows * width).
+    ts, bpm, rr_counts, rr = columns
+    window = np.clip(((ts - (origin - _EPOCH).total_seconds()) // width).astype(np.int64), 0, max(windows - 1, 0))
+    from_rr = _metrics(_interval_stats(ts, window, rr_counts, rr, windows))
+    sampled = bpm > 0
+    from_bpm = _metrics(_interval_stats(ts, window, sampled.astype(np.int64), 60000 / bpm[sampled], windows))
+    use_rr = from_rr['beats'] > 0
+    chosen = {name: np.where(use_rr, from_rr[name], from_bpm[name]) for name in from_rr}
+    resting = _resting_bpm(window, bpm, windows)
+
+    results = []
+    for index, (beats, rmssd, sdnn, pnn50, rest, rr_window) in enumerate(zip(
+        chosen['beats'].tolist(),
+        chosen['rmssd_ms'].tolist(),
+        chosen['sdnn_ms'].tolist(),
+        chosen['pnn50'].tolist(),
+        resting.tolist(),
+        use_rr.tolist(),
+    )):
+        results.append({
+            'start': (origin + timedelta(seconds=index * width)).isoformat(),
+            'beats': int(beats),
+            'rr_source': ('rr' if rr_window else 'bpm') if beats else None,
+            'rmssd_ms': _finite(rmssd),
+            'sdnn_ms': _finite(sdnn),
+            'pnn50': _finite(pnn50),
+            'resting_bpm': _finite(rest),
+        })
+    return results
+
+
+def _finite(value: float) -> Optional[float]:
+    return round(value, 2) if np.isfinite(value) else None
+
+
+# Results of completed windows are cached in Redis. A window counts as
+# completed settle_s after it ends, so most late uploads (vendor polling,
+# phone sync) land in it first; ingest drops the entries of the windows any
+# later heart rate falls into. Windows without beats are not cached.
+
+def hrv_cache_key(user_id: str, window: str, start: datetime) -> str:
+    return f'{HRV_CACHE_PREFIX}{user_id}:{window}:{int((start - _EPOCH).total_seconds())}'
+
+
+def missing_span(starts: List[datetime], cached: List[Optional[Dict[str, Any]]], width: int) -> Optional[Tuple[datetime, datetime]]:
+    missing = [start for start, value in zip(starts, cached) if value is None]
+    if not missing:
+        return None
+    return missing[0], missing[-1] + timedelta(seconds=width)
+
+
+def decode_cached(values: Sequence[Any]) -> List[Optional[Dict[str, Any]]]:
+    return [json.loads(value) if value is not None else None for value in values]
+
+
+def fill_windows(
+    starts: List[datetime],
+    cached: List[Optional[Dict[str, Any]]],
+    rows: Sequence[Any],
+    width: int,
+) -> Tuple[List[Dict[str, Any]], List[int]]:
+    # cached with the gaps computed from rows (fetched for missing_span());
+    # also returns the indices that were computed.
+    span = missing_span(starts, cached, width)
+    computed: List[Dict[str, Any]] = []
+    offset = 0
+    if span is not None:
+        offset = starts.index(span[0])
+        computed = compute_windows(hrv_columns(rows), span[0], width, int((span[1] - span[0]).total_seconds()) // width)
+    results = []
+    fresh = []
+    for index, value in enumerate(cached):
+        if value is None:
+            value = computed[index - offset]
+            fresh.append(index)
+        results.append(value)
+    metrics.incr('hrv.cache_hits', len(results) - len(fresh))
+    metrics.incr('hrv.windows_computed', len(fresh))
+    return results, fresh
+
+
+def cache_entries(
+    user_id: str,
+    window: str,
+    starts: List[datetime],
+    results: List[Dict[str, Any]],
+    indices: List[int],
+    now: datetime,
+    settle_s: int,
+) -> Dict[str, str]:
+    width = HRV_WINDOWS[window]
+    completed = now - timedelta(seconds=width + settle_s)
+    return {
+        hrv_cache_key(user_id, window, starts[index]): json.dumps(results[index])
+        for index in indices
+        if starts[index] <= completed and results[index]['beats']
+    }
+
+
+def queue_invalidation(pipe, rows: Sequence[Dict[str, Any]]) -> None:
+    # Deletes the cached windows that ingested heart rate rows fall into.
+    hours = set()
+    for row in rows:
+        if row['kind'] == 'heart_rate':
+            ts = row['ts']
+            hours.add((row['user_id'], int((ts - (_EPOCH if ts.tzinfo is not None else _NAIVE_EPOCH)) // _SECOND) // 3600))
+    keys = set()
+    for user_id, hour in hours:
+        for window, width in HRV_WINDOWS.items():
+            keys.add(hrv_cache_key(user_id, window, _EPOCH + timedelta(seconds=hour * 3600 // width * width)))
+    if keys:
+        pipe.delete(*keys)
+
+
+def hrv_response(window: str, start: datetime, end: datetime, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        'window': window,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'windows': results,
+    }
+
+
+# Cache I/O is best effort: without Redis every window is computed.
+
+def load_cached(redis: Redis, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+    try:
+        return decode_cached(redis.mget(keys))
+    except RedisError:
+        metrics.incr('hrv.cache_errors')
+        return [None] * len(keys)
+
+
+async def load_cached_async(redis: AsyncRedis, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+    try:
+        return decode_cached(await redis.mget(keys))
+    except RedisError:
+        metrics.incr('hrv.cache_errors')
+        return [None] * len(keys)
+
+
+def store_cached(redis: Redis, entries: Dict[str, str], ttl_s: int) -> None:
+    if not entries:
+        return
+    pipe = redis.pipeline(transaction=False)
+    for key, value in entries.items():
+        pipe.set(key, value, ex=ttl_s)
+    try:
+        pipe.execute()
+    except RedisError:
+        metrics.incr('hrv.cache_errors')
+
+
+async def store_cached_async(redis: AsyncRedis, entries: Dict[str, str], ttl_s: int) -> None:
+    if not entries:
+        return
+    pipe = redis.pipeline(transaction=False)
+    for key, value in entries.items():
+        pipe.set(key, value, ex=ttl_s)
+    try:
+        await pipe.execute()
+    except RedisError:
+        metrics.incr('hrv.cache_errors')
@@ -0,0 +1,132 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+import asyncio
+import json
+import logging
+from redis.asyncio import Redis as AsyncRedis
+from ..deps import get_async_redis
+from ..ingest.live import LIVE_PREFIX, live_channel
+from ..ingest.rows import parse_ts
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LiveSubscriber:
+    # Holds only the newest event per kind. A subscriber that falls behind
+    # gets one coalesced update on its next send instead of a backlog.
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._latest_ts: Dict[str, datetime] = {}
+        self._ready = asyncio.Event()
+
+    def offer(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            # Compared as datetimes: in format_ts() text a fractional second
+            # ('.5Z') sorts before a whole one ('Z').
+            ts = parse_ts(event['ts'])
+            current = self._latest.get(event['kind'])
+            if current is not None and self._latest_ts[event['kind']] > ts:
+                continue
+            if current is not None:
+                metrics.incr('live.coalesced')
+            self._latest[event['kind']] = event
+            self._latest_ts[event['kind']] = ts
+        if self._latest:
+            self._ready.set()
+
+    async def next_update(self) -> List[Dict[str, Any]]:
+        await self._ready.wait()
+        self._ready.clear()
+        events, self._latest, self._latest_ts = list(self._latest.values()), {}, {}
+        return events
+
+
+class LiveHub:
+    # One Redis pub/sub connection per process, subscribed to the channels of
+    # users with at least one local subscriber, fanned out in memory.
+
+    def __init__(self, redis: AsyncRedis):
+        self._redis = redis
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+        self._subscribers: Dict[str, Set[LiveSubscriber]] = {}
+        self._lock = asyncio.Lock()
+
+    async def subscribe(self, user_id: str) -> LiveSubscriber:
+        subscriber = LiveSubscriber(user_id)
+        async with self._lock:
+            if self._pubsub is None:
+                self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            local = self._subscribers.setdefault(user_id, set())
+            local.add(subscriber)
+            if len(local) == 1:
+                await self._pubsub.subscribe(live_channel(user_id))
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+        metrics.incr('live.subscribed')
+        return subscriber
+
+    async def unsubscribe(self, subscriber: LiveSubscriber) -> None:
+        async with self._lock:
+            local = self._subscribers.get(subscriber.user_id, set())
+            local.discard(subscriber)
+            if not local:
+                self._subscribers.pop(subscriber.user_id, None)
+                await self._pubsub.unsubscribe(live_channel(subscriber.user_id))
+
+    def subscriber_count(self) -> int:
+        return sum(len(local) for local in self._subscribers.values())
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # noqa: BLE001
+                metrics.incr('live.errors')
+                logger.exception('live pub/sub read failed')
+                await asyncio.sleep(1.0)
+                continue
+            if message is None or message['type'] != 'message':
+                continue
+            channel = message['channel']
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            events = json.loads(message['data'])['events']
+            for subscriber in list(self._subscribers.get(channel[len(LIVE_PREFIX):], ())):
+                subscriber.offer(events)
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.close()
+            self._pubsub = None
+        self._subscribers.clear()
+
+
+_hub: Optional[LiveHub] = None
+
+
+async def get_live_hub() -> LiveHub:
+    global _hub
+    if _hub is None:
+        _hub = LiveHub(await get_async_redis())
+        metrics.gauge('live.subscribers', _hub.subscriber_count)
+    return _hub
+
+
+async def close_live_hub() -> None:
+    global _hub
+    if _hub is not None:
+        await _hub.close()
+        _hub = None
@@ -0,0 +1,168 @@
+from datetime import datetime, timezone
+from typing import Literal
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from ..config import get_settings
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from ..deps import get_async_db, get_async_redis, get_db, get_redis
+from ..ingest.vitals import vitals_key, vitals_response
+from .hrv import (
+    HRV_WINDOWS,
+    cache_entries,
+    fill_windows,
+    hrv_cache_key,
+    hrv_response,
+    hrv_stmt,
+    load_cached,
+    load_cached_async,
+    missing_span,
+    store_cached,
+    store_cached_async,
+    window_starts,
+)
+from .live import LiveHub, get_live_hub
+from .series import parse_range, series_points, series_response, series_stmt, series_width
+
+# Per-user read endpoints, mounted under /v1/users. Handlers that touch the
+# database come in a sync and an async flavour picked by Settings.io_mode.
+router = APIRouter()
+_settings = get_settings()
+
+SERIES_MAX_POINTS = 5000
+SeriesKind = Literal['heart_rate', 'steps', 'sleep']
+# A month of hourly or two years of daily windows.
+HRV_MAX_WINDOWS = 31 * 24
+HrvWindow = Literal['hour', 'day']
+
+
+def _series_range(from_: str, to: str):
+    try:
+        start, end = parse_range(from_, to)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if end <= start:
+        raise HTTPException(status_code=400, detail='to must be after from')
+    return start, end
+
+
+def series(
+    user_id: str,
+    kind: SeriesKind,
+    from_: str = Query(..., alias='from'),
+    to: str = Query(...),
+    points: int = Query(500, ge=3, le=SERIES_MAX_POINTS),
+    lttb: bool = False,
+    db: Session = Depends(get_db),
+):
+    start, end = _series_range(from_, to)
+    width = series_width(start, end, points, lttb)
+    rows = db.execute(series_stmt(db.get_bind().dialect.name, user_id, kind, start, end, width)).all()
+    return series_response(kind, start, end, width, series_points(rows, points, lttb))
+
+
+async def series_async(
+    user_id: str,
+    kind: SeriesKind,
+    from_: str = Query(..., alias='from'),
+    to: str = Query(...),
+    points: int = Query(500, ge=3, le=SERIES_MAX_POINTS),
+    lttb: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    start, end = _series_range(from_, to)
+    width = series_width(start, end, points, lttb)
+    rows = (await db.execute(series_stmt(db.get_bind().dialect.name, user_id, kind, start, end, width))).all()
+    return series_response(kind, start, end, width, series_points(rows, points, lttb))
+
+
+router.add_api_route('/{user_id}/series', series_async if _settings.io_mode == 'async' else series, methods=['GET'])
+
+
+def _hrv_windows(from_: str, to: str, window: str):
+    start, end = _series_range(from_, to)
+    starts = window_starts(start, end, HRV_WINDOWS[window])
+    if len(starts) > HRV_MAX_WINDOWS:
+        raise HTTPException(status_code=400, detail=f'at most {HRV_MAX_WINDOWS} windows per request')
+    return start, end, starts
+
+
+def hrv(
+    user_id: str,
+    from_: str = Query(..., alias='from'),
+    to: str = Query(...),
+    window: HrvWindow = 'day',
+    db: Session = Depends(get_db),
+    redis: Redis = Depends(get_redis),
+):
+    start, end, starts = _hrv_windows(from_, to, window)
+    width = HRV_WINDOWS[window]
+    cached = load_cached(redis, [hrv_cache_key(user_id, window, window_start) for window_start in starts])
+    span = missing_span(starts, cached, width)
+    rows = db.execute(hrv_stmt(user_id, *span)).all() if span else []
+    results, fresh = fill_windows(starts, cached, rows, width)
+    now = datetime.now(timezone.utc)
+    store_cached(redis, cache_entries(user_id, window, starts, results, fresh, now, _settings.hrv_settle_s), _settings.hrv_cache_ttl_s)
+    return hrv_response(window, start, end, results)
+
+
+async def hrv_async(
+    user_id: str,
+    from_: str = Query(..., alias='from'),
+    to: str = Query(...),
+    window: HrvWindow = 'day',
+    db: AsyncSession = Depends(get_async_db),
+    redis: AsyncRedis = Depends(get_async_redis),
+):
+    start, end, starts = _hrv_windows(from_, to, window)
+    width = HRV_WINDOWS[window]
+    cached = await load_cached_async(redis, [hrv_cache_key(user_id, window, window_start) for window_start in starts])
+    span = missing_span(starts, cached, width)
+    rows = (await db.execute(hrv_stmt(user_id, *span))).all() if span else []
+    results, fresh = fill_windows(starts, cached, rows, width)
+    now = datetime.now(timezone.utc)
+    await store_cached_async(redis, cache_entries(user_id, window, starts, results, fresh, now, _settings.hrv_settle_s), _settings.hrv_cache_ttl_s)
+    return hrv_response(window, start, end, results)
+
+
+router.add_api_route('/{user_id}/hrv', hrv_async if _settings.io_mode == 'async' else hrv, methods=['GET'])
+
+
+def vitals(user_id: str, redis: Redis = Depends(get_redis)):
+    return vitals_response(redis.hgetall(vitals_key(user_id)))
+
+
+async def vitals_async(user_id: str, redis: AsyncRedis = Depends(get_async_redis)):
+    return vitals_response(await redis.hgetall(vitals_key(user_id)))
+
+
+router.add_api_route('/{user_id}/vitals', vitals_async if _settings.io_mode == 'async' else vitals, methods=['GET'])
+
+
+@router.websocket('/{user_id}/live')
+async def live(websocket: WebSocket, user_id: str, hub: LiveHub = Depends(get_live_hub)):
+    # Pushes {"events": [...]} with the newest event per kind whenever ingest
+    # accepts something for the user. Client messages are ignored; reading
+    # them only detects the disconnect.
+    await websocket.accept()
+    subscriber = await hub.subscribe(user_id)
+    receive = asyncio.ensure_future(websocket.receive())
+    update = asyncio.ensure_future(subscriber.next_update())
+    try:
+        while True:
+            await asyncio.wait({receive, update}, return_when=asyncio.FIRST_COMPLETED)
+            if update.done():
+                await websocket.send_json({'events': update.result()})
+                update = asyncio.ensure_future(subscriber.next_update())
+            if receive.done():
+                if receive.result()['type'] == 'websocket.disconnect':
+                    break
+                receive = asyncio.ensure_future(websocket.receive())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receive.cancel()
+        update.cancel()
+        await hub.unsubscribe(subscriber)
@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Sequence, Tuple
+import numpy as np
+from sqlalchemy import Integer, Interval, cast, func, literal, select
+from ..ingest.rows import parse_ts
+from ..models import Event
+
+# Bucket widths (seconds) a chart axis can label cleanly.
+NICE_WIDTHS = [
+    1, 2, 5, 10, 15, 30,
+    60, 2 * 60, 5 * 60, 10 * 60, 15 * 60, 30 * 60,
+    3600, 2 * 3600, 3 * 3600, 6 * 3600, 12 * 3600,
+    86400, 7 * 86400,
+]
+# With LTTB, SQL buckets at this many times the requested resolution and
+# LTTB picks the visually significant ones.
+LTTB_OVERSAMPLE = 4
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+VALUE_COLUMNS = {
+    'heart_rate': Event.bpm,
+    'steps': Event.steps,
+    'sleep': Event.dur_s,
+}
+
+
+def bucket_width(start: datetime, end: datetime, points: int) -> int:
+    span = max((end - start).total_seconds(), 1)
+    for width in NICE_WIDTHS:
+        if span / width <= points:
+            return width
+    return NICE_WIDTHS[-1]
+
+
+def _bucket(dialect: str, width: int):
+    if dialect == 'postgresql':
+        return func.date_bin(literal(timedelta(seconds=width), Interval()), Event.ts, literal(_EPOCH))
+    # SQLite: floor the unix epoch; the result is seconds, not a timestamp.
+    return cast(func.strftime('%s', Event.ts), Integer) // width * width
+
+
+def series_stmt(dialect: str, user_id: str, kind: str, start: datetime, end: datetime, width: int):
+    value = VALUE_COLUMNS[kind]
+    bucket = _bucket(dialect, width).label('bucket')
+    return (
+        select(
+            bucket,
+            func.count().label('count'),
+            func.avg(value).label('avg'),
+            func.min(value).label('min'),
+            func.max(value).label('max'),
+            func.sum(value).label('sum'),
+        )
+        .where(Event.user_id == user_id, Event.kind == kind, Event.ts >= start, Event.ts < end)
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+
+
+def _bucket_ts(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+    return datetime.fromtimestamp(int(value), timezone.utc)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: indices of `threshold` points that keep
+    # the shape of the series. First and last points are always kept.
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # threshold - 2 buckets over the points between the fixed end points.
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # The third vertex is the average of the next bucket (or the last point).
+        next_lo, next_hi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        px, py = x[previous], y[previous]
+        area = np.abs((px - avg_x) * (y[lo:hi] - py) - (px - x[lo:hi]) * (avg_y - py))
+        previous = lo + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+
+def series_points(rows: Sequence[Any], points: int, downsample: bool) -> List[Dict[str, Any]]:
+    result = [
+        {
+            'ts': _bucket_ts(row.bucket).isoformat(),
+            'count': row.count,
+            'avg': float(row.avg) if row.avg is not None else None,
+            'min': row.min,
+            'max': row.max,
+            'sum': row.sum,
+        }
+        for row in rows
+    ]
+    if downsample and len(result) > points:
+        x = np.array([_bucket_ts(row.bucket).timestamp() for row in rows])
+        y = np.array([point['avg'] if point['avg'] is not None else np.nan for point in result])
+        y = np.where(np.isnan(y), np.nanmean(y) if np.isfinite(y).any() else 0.0, y)
+        result = [result[index] for index in lttb(x, y, points)]
+    return result
+
+
+def series_width(start: datetime, end: datetime, points: int, downsample: bool) -> int:
+    return bucket_width(start, end, points * LTTB_OVERSAMPLE if downsample else points)
+
+
+def series_response(kind: str, start: datetime, end: datetime, width: int, points: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        'kind': kind,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'bucket_s': width,
+        'points': points,
+    }
+
+
+def parse_range(from_: str, to: str) -> Tuple[datetime, datetime]:
+    start, end = parse_ts(from_), parse_ts(to)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    return start, end
@@ -0,0 +1,62 @@
+from typing import Any, Dict, Iterator, List
+import io
+import json
+import ijson
+
+# Incremental decoding of large webhook bodies. lazy_document() makes one
+# pass over the body with ijson and returns its objects and scalars as plain
+# dicts and values, but every array as a LazyArray that decodes one element
+# at a time when iterated. The normalizers only iterate the arrays, so a day
+# of samples flows into them and on to ingest without ever being held as
+# Python objects; peak memory is the raw body plus one ingest chunk.
+
+
+class LazyArray:
+    def __init__(self, body: bytes, prefix: str):
+        self._body = body
+        self._prefix = f'{prefix}.item' if prefix else 'item'
+
+    def __iter__(self) -> Iterator[Any]:
+        return ijson.items(io.BytesIO(self._body), self._prefix, use_float=True)
+
+
+def lazy_document(body: bytes) -> Any:
+    root: Any = None
+    stack: List[Dict[str, Any]] = []
+    key = None
+    # Depth inside an array whose contents are skipped.
+    skip = 0
+    for prefix, event, value in ijson.parse(io.BytesIO(body), use_float=True):
+        if skip:
+            if event in ('start_map', 'start_array'):
+                skip += 1
+            elif event in ('end_map', 'end_array'):
+                skip -= 1
+            continue
+        if event == 'map_key':
+            key = value
+            continue
+        if event == 'end_map':
+            stack.pop()
+            continue
+        if event == 'start_map':
+            node: Any = {}
+        elif event == 'start_array':
+            node = LazyArray(body, prefix)
+            skip = 1
+        else:
+            node = value
+        if stack:
+            stack[-1][key] = node
+        else:
+            root = node
+        if event == 'start_map':
+            stack.append(node)
+    return root
+
+
+def load_payload(body: bytes, lazy_min_bytes: int) -> Any:
+    # json.loads is several times faster, so small bodies still use it.
+    if len(body) < lazy_min_bytes:
+        return json.loads(body)
+    return lazy_document(body)
@@ -0,0 +1,238 @@
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+import logging
+import time
+from redis import Redis, ResponseError
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy.orm import Session
+from ..config import get_settings
+from ..ingest.pipeline import ingest_events
+from ..metrics import metrics
+from ..normalizer.batch import EventBatch, Normalized
+from ..normalizer.registry import get_normalizer
+from .payloads import load_payload
+
+# Verified webhook bodies are appended to WEBHOOK_STREAM as {vendor, body}
+# and consumed by the WEBHOOK_GROUP consumer group. A message is acked only
+# once its events are committed; unacked messages are reclaimed by another
+# consumer after claim_idle_ms. Deliveries are counted per message id in
+# WEBHOOK_ATTEMPTS; a message delivered more than max_deliveries times, or one
+# that cannot be normalized at all, is moved to WEBHOOK_DEAD_LETTERS.
+WEBHOOK_STREAM = 'webhooks:stream'
+WEBHOOK_GROUP = 'webhook-workers'
+WEBHOOK_ATTEMPTS = 'webhooks:attempts'
+WEBHOOK_DEAD_LETTERS = 'webhooks:dead'
+
+Message = Tuple[bytes, Dict[bytes, bytes]]
+
+_settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def enqueue(redis: Redis, vendor: str, body: bytes, maxlen: Optional[int] = None) -> str:
+    message_id = redis.xadd(
+        WEBHOOK_STREAM,
+        {'vendor': vendor, 'body': body, 'received': f'{time.time():.3f}'},
+        maxlen=maxlen or _settings.webhook_stream_maxlen,
+        approximate=True,
+    )
+    metrics.incr(f'webhooks.enqueued.{vendor}')
+    return message_id.decode() if isinstance(message_id, bytes) else message_id
+
+
+async def enqueue_async(redis: AsyncRedis, vendor: str, body: bytes, maxlen: Optional[int] = None) -> str:
+    # enqueue() for pollers: polled payloads go through the same workers.
+    message_id = await redis.xadd(
+        WEBHOOK_STREAM,
+        {'vendor': vendor, 'body': body, 'received': f'{time.time():.3f}'},
+        maxlen=maxlen or _settings.webhook_stream_maxlen,
+        approximate=True,
+    )
+    metrics.incr(f'webhooks.enqueued.{vendor}')
+    return message_id.decode() if isinstance(message_id, bytes) else message_id
+
+
+def ensure_group(redis: Redis) -> None:
+    try:
+        redis.xgroup_create(WEBHOOK_STREAM, WEBHOOK_GROUP, id='0', mkstream=True)
+    except ResponseError as exc:
+        if 'BUSYGROUP' not in str(exc):
+            raise
+
+
+class _IngestFailed(Exception):
+    pass
+
+
+def normalize_message(fields: Dict[bytes, bytes], lazy_min_bytes: Optional[int] = None) -> Iterator[Normalized]:
+    normalizer = get_normalizer(f"vendor_{fields[b'vendor'].decode()}")
+    if lazy_min_bytes is None:
+        lazy_min_bytes = _settings.webhook_lazy_parse_min_bytes
+    yield from normalizer.normalize_batches(load_payload(fields[b'body'], lazy_min_bytes))
+
+
+class WebhookWorker:
+    def __init__(
+        self,
+        redis: Redis,
+        session_factory: Callable[[], Session],
+        consumer: str,
+        batch: int,
+        block_ms: int,
+        claim_idle_ms: int,
+        max_deliveries: int,
+        chunk_events: int,
+    ):
+        self._redis = redis
+        self._session_factory = session_factory
+        self.consumer = consumer
+        self._batch = batch
+        self._block_ms = block_ms
+        self._claim_idle_ms = claim_idle_ms
+        self._max_deliveries = max_deliveries
+        self._chunk_events = chunk_events
+        self._claim_cursor = '0-0'
+
+    def _claim(self) -> List[Message]:
+        # Walks the pending list a page per call, taking over messages whose
+        # consumer died or failed to ingest them.
+        reply = self._redis.xautoclaim(
+            WEBHOOK_STREAM,
+            WEBHOOK_GROUP,
+            self.consumer,
+            min_idle_time=self._claim_idle_ms,
+            start_id=self._claim_cursor,
+            count=self._batch,
+        )
+        self._claim_cursor = reply[0]
+        # Entries trimmed from the stream while pending come back empty.
+        messages = [(message_id, fields) for message_id, fields in reply[1] if fields]
+        if messages:
+            metrics.incr('webhooks.reclaimed', len(messages))
+        return messages
+
+    def _read(self, count: int, block: bool) -> List[Message]:
+        reply = self._redis.xreadgroup(
+            WEBHOOK_GROUP,
+            self.consumer,
+            {WEBHOOK_STREAM: '>'},
+            count=count,
+            block=self._block_ms if block else None,
+        )
+        return [message for _, messages in reply or [] for message in messages]
+
+    def _ack(self, message_ids: Sequence[bytes]) -> None:
+        if not message_ids:
+            return
+        pipe = self._redis.pipeline()
+        pipe.xack(WEBHOOK_STREAM, WEBHOOK_GROUP, *message_ids)
+        pipe.hdel(WEBHOOK_ATTEMPTS, *message_ids)
+        pipe.execute()
+
+    def _dead_letter(self, message_id: bytes, fields: Dict[bytes, bytes], attempts: int, error: str) -> None:
+        pipe = self._redis.pipeline()
+        pipe.xadd(
+            WEBHOOK_DEAD_LETTERS,
+            {**fields, b'id': message_id, b'attempts': attempts, b'error': error},
+            maxlen=_settings.webhook_stream_maxlen,
+            approximate=True,
+        )
+        pipe.xack(WEBHOOK_STREAM, WEBHOOK_GROUP, message_id)
+        pipe.hdel(WEBHOOK_ATTEMPTS, message_id)
+        pipe.execute()
+        metrics.incr('webhooks.dead_lettered')
+        logger.warning('webhook %s dead-lettered after %d deliveries: %s', message_id, attempts, error)
+
+    def handle(self, messages: Sequence[Message]) -> int:
+        # Counted before processing, so a message that crashes the worker
+        # still runs out of deliveries.
+        pipe = self._redis.pipeline(transaction=False)
+        for message_id, _ in messages:
+            pipe.hincrby(WEBHOOK_ATTEMPTS, message_id, 1)
+        attempts = pipe.execute()
+
+        live: List[Tuple[bytes, Dict[bytes, bytes], int]] = []
+        for (message_id, fields), attempt in zip(messages, attempts):
+            if attempt > self._max_deliveries:
+                self._dead_letter(message_id, fields, attempt, 'max deliveries exceeded')
+            else:
+                live.append((message_id, fields, attempt))
+        dead: Set[bytes] = set()
+        ready = self._process(live, dead)
+        if ready is None:
+            # One message failing the insert must not hold back (and in the
+            # end dead-letter) the rest of the read: retry them one at a time.
+            # Only the failing ones stay pending; the others are acked, which
+            # also clears their delivery count.
+            ready = []
+            if len(live) > 1:
+                for message in live:
+                    if message[0] not in dead:
+                        ready.extend(self._process([message], dead) or [])
+        self._ack(ready)
+        metrics.incr('webhooks.processed', len(ready))
+        return len(ready)
+
+    def _process(self, messages: Sequence[Tuple[bytes, Dict[bytes, bytes], int]], dead: Set[bytes]) -> Optional[List[bytes]]:
+        # Ingests the messages' events in shared chunks and returns the ids to
+        # ack, or None if an ingest failed. Messages that cannot be normalized
+        # are dead-lettered on the way and added to dead.
+        ready: List[bytes] = []
+        chunk: List[Normalized] = []
+        size = 0
+        db = self._session_factory()
+        try:
+            for message_id, fields, attempt in messages:
+                # Event batches are ingested in chunks as the normalizer yields them.
+                try:
+                    for item in normalize_message(fields):
+                        chunk.append(item)
+                        size += len(item) if isinstance(item, EventBatch) else 1
+                        if size >= self._chunk_events:
+                            self._ingest(db, chunk, size)
+                            chunk, size = [], 0
+                except _IngestFailed:
+                    raise
+                except Exception as exc:
+                    # Malformed payloads fail the same way on every delivery.
+                    # Events decoded before the error are kept; a replay of
+                    # the dead letter dedupes them.
+                    self._dead_letter(message_id, fields, attempt, f'normalize: {exc!r}')
+                    dead.add(message_id)
+                    continue
+                ready.append(message_id)
+            if chunk:
+                self._ingest(db, chunk, size)
+        except _IngestFailed:
+            # Nothing is acked; the messages are retried once they go idle
+            # and chunks already committed come back as duplicates.
+            metrics.incr('webhooks.failed', len(messages))
+            logger.exception('ingesting webhook events failed')
+            return None
+        finally:
+            db.close()
+        return ready
+
+    def _ingest(self, db: Session, items: List[Normalized], size: int) -> None:
+        try:
+            results = ingest_events(db, self._redis, items)
+        except Exception as exc:
+            raise _IngestFailed() from exc
+        metrics.incr('webhooks.events', size)
+        metrics.incr('webhooks.invalid_events', sum(1 for result in results if result['status'] == 'invalid'))
+
+    def run_once(self, block: bool = True) -> int:
+        messages = self._claim()
+        if len(messages) < self._batch:
+            messages += self._read(self._batch - len(messages), block and not messages)
+        if not messages:
+            return 0
+        return self.handle(messages)
+
+    def run(self, should_stop: Callable[[], bool] = lambda: False) -> None:
+        ensure_group(self._redis)
+        while not should_stop():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('webhook worker %s iteration failed', self.consumer)
+                time.sleep(1)
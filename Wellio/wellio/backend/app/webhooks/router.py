@@ -1,31 +1,23 @@
-from fastapi import APIRouter, Header, HTTPException
-from typing import Optional
-from ..normalizer import garmin as garmin_norm, fitbit as fitbit_norm, oura as oura_norm, withings as withings_norm
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from redis import Redis
+from ..config import get_settings
+from ..deps import get_redis
+from ..ingest.codecs import read_body
+from .queue import enqueue
+from .signatures import SIGNERS, verify_signature
 
 router = APIRouter()
-
-
-@router.post('/garmin')
-def garmin_webhook(payload: dict, x_garmin_signature: Optional[str] = Header(None)):
-    if not x_garmin_signature:
-        raise HTTPException(status_code=400, detail='missing signature')
-    events = list(garmin_norm.normalize_garmin(payload))
-    return {'received': len(events)}
-
-
-@router.post('/fitbit')
-def fitbit_webhook(payload: dict):
-    events = list(fitbit_norm.normalize_fitbit(payload))
-    return {'received': len(events)}
-
-
-@router.post('/oura')
-def oura_webhook(payload: dict):
-    events = list(oura_norm.normalize_oura(payload))
-    return {'received': len(events)}
-
-
-@router.post('/withings')
-def withings_webhook(payload: dict):
-    events = list(withings_norm.normalize_withings(payload))
-    return {'received': len(events)}
+_settings = get_settings()
+
+
+@router.post('/{vendor}', status_code=202)
+async def receive_webhook(vendor: str, request: Request, redis: Redis = Depends(get_redis)):
+    # Only the signature is checked here; normalization and ingest run in
+    # the webhook workers, so vendors get their 202 without waiting on them.
+    if vendor not in SIGNERS:
+        raise HTTPException(status_code=404, detail=f'unknown vendor: {vendor}')
+    body = await read_body(request, _settings.ingest_body_max_bytes)
+    if not verify_signature(vendor, body, request.headers):
+        raise HTTPException(status_code=401, detail='invalid signature')
+    return {'queued': await run_in_threadpool(enqueue, redis, vendor, body)}
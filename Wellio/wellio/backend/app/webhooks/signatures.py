@@ -0,0 +1,44 @@
+from typing import Callable, Dict, Mapping, Tuple
+import base64
+import hashlib
+import hmac
+from ..config import get_settings
+
+_settings = get_settings()
+
+
+def _fitbit(body: bytes) -> str:
+    # Fitbit subscriber notifications: base64 HMAC-SHA1 keyed with the
+    # client secret and a trailing '&'.
+    key = f'{_settings.fitbit_client_secret}&'.encode('utf-8')
+    return base64.b64encode(hmac.new(key, body, hashlib.sha1).digest()).decode('ascii')
+
+
+def _sha256_hex(secret: str) -> Callable[[bytes], str]:
+    def sign(body: bytes) -> str:
+        return hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return sign
+
+
+# vendor -> (signature header, signer over the raw body)
+SIGNERS: Dict[str, Tuple[str, Callable[[bytes], str]]] = {
+    'fitbit': ('x-fitbit-signature', _fitbit),
+    'garmin': ('x-garmin-signature', _sha256_hex(_settings.garmin_webhook_secret)),
+    'oura': ('x-oura-signature', _sha256_hex(_settings.oura_webhook_secret)),
+    'withings': ('x-withings-signature', _sha256_hex(_settings.withings_webhook_secret)),
+}
+
+
+def sign(vendor: str, body: bytes) -> str:
+    return SIGNERS[vendor][1](body)
+
+
+def verify_signature(vendor: str, body: bytes, headers: Mapping[str, str]) -> bool:
+    header, signer = SIGNERS[vendor]
+    signature = headers.get(header)
+    if not signature:
+        return False
+    expected = signer(body)
+    if vendor != 'fitbit':
+        signature = signature.lower()
+    return hmac.compare_digest(signature.encode('utf-8'), expected.encode('utf-8'))
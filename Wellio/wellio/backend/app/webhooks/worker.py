@@ -0,0 +1,71 @@
+from typing import List
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+from ..config import get_settings
+from ..deps import SessionLocal, redis_client
+from .queue import WebhookWorker, ensure_group
+
+# python -m app.webhooks.worker [--processes N]
+# Each process is one consumer of the webhook stream; scale out by running
+# more processes or more containers, they share the consumer group.
+
+logger = logging.getLogger(__name__)
+
+
+def run_consumer() -> None:
+    # Runs in a forked child: redis-py pools reset themselves after a fork
+    # and the engine has not connected in the parent.
+    settings = get_settings()
+    stopping = False
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    worker = WebhookWorker(
+        redis_client,
+        SessionLocal,
+        f'{socket.gethostname()}-{os.getpid()}',
+        settings.webhook_worker_batch,
+        settings.webhook_worker_block_ms,
+        settings.webhook_claim_idle_ms,
+        settings.webhook_max_deliveries,
+        settings.ingest_stream_chunk_events,
+    )
+    logger.info('webhook consumer %s started', worker.consumer)
+    worker.run(lambda: stopping)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.processes == 1:
+        run_consumer()
+        return
+    ensure_group(redis_client)
+    processes: List[multiprocessing.Process] = []
+    for _ in range(args.processes):
+        process = multiprocessing.Process(target=run_consumer)
+        process.start()
+        processes.append(process)
+
+    def stop(signum, frame) -> None:
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
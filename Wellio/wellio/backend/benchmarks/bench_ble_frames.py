@@ -0,0 +1,58 @@
+# Heart Rate Measurement decoding throughput in frames per second: the
+# per-frame struct decoder against decode_hr_frames() on the same frames, and
+# the WebSocket path (base64 frames to events) one notification at a time
+# against normalize_ble_frames().
+#
+#   cd backend && python -m benchmarks.bench_ble_frames
+import base64
+import struct
+import time
+
+import numpy as np
+
+from app.normalizer.ble_hr import decode_hr_frames, decode_hr_measurement, normalize_ble_frames, normalize_ble_notification
+
+FRAMES = 100_000
+ROUNDS = 3
+
+
+def _frames():
+    # A chest strap at ~60 bpm: every frame has contact status and one or two
+    # RR intervals, every tenth also energy expended.
+    rng = np.random.default_rng(1)
+    frames = []
+    for index in range(FRAMES):
+        rr = [int(value) for value in rng.integers(700, 1100, size=1 + index % 2)]
+        if index % 10 == 0:
+            frames.append(struct.pack(f'<BBH{len(rr)}H', 0x1E, 60 + index % 20, index % 500, *rr))
+        else:
+            frames.append(struct.pack(f'<BB{len(rr)}H', 0x16, 60 + index % 20, *rr))
+    return frames
+
+
+def _rate(run):
+    best = float('inf')
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return FRAMES / best
+
+
+def main() -> None:
+    frames = _frames()
+    payloads = [
+        {'frame': base64.b64encode(frame).decode(), 'userId': 'bench', 'ts': '2023-09-01T10:00:00Z', 'device': {}}
+        for frame in frames
+    ]
+    assert decode_hr_frames(frames).fields() == [decode_hr_measurement(frame) for frame in frames]
+    print(f'{FRAMES} frames, {sum(map(len, frames)) / FRAMES:.1f} bytes each on average')
+    print(f'decode, per frame        : {_rate(lambda: [decode_hr_measurement(frame) for frame in frames]):12,.0f} frames/s')
+    print(f'decode, batch arrays     : {_rate(lambda: decode_hr_frames(frames)):12,.0f} frames/s')
+    print(f'decode, batch to fields  : {_rate(lambda: decode_hr_frames(frames).fields()):12,.0f} frames/s')
+    print(f'events, per notification : {_rate(lambda: [next(iter(normalize_ble_notification(payload))) for payload in payloads]):12,.0f} frames/s')
+    print(f'events, batch            : {_rate(lambda: normalize_ble_frames(payloads)):12,.0f} frames/s')
+
+
+if __name__ == '__main__':
+    main()
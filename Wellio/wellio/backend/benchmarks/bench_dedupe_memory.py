@@ -0,0 +1,62 @@
+# Redis memory per dedupe key: one string key with TTL per event (flat)
+# against 16-byte digests in per-user-per-hour sets (compact). Needs a real,
+# otherwise idle Redis; it writes to and then flushes the database selected
+# by BENCH_REDIS_URL (default redis://localhost:6379/15).
+#
+#   cd backend && BENCH_REDIS_URL=redis://localhost:6379/15 python -m benchmarks.bench_dedupe_memory
+from datetime import datetime, timedelta
+import hashlib
+import os
+
+from redis import Redis
+
+from app.ingest.idempotency import dedupe_group, mark_seen_many
+
+USERS = 50
+HOURS = 4
+# 1 Hz heart rate: 3600 events per user-hour.
+EVENTS_PER_USER_HOUR = 3600
+BATCH = 1000
+
+
+def _events():
+    start = datetime(2023, 9, 1)
+    for user in range(USERS):
+        for second in range(HOURS * EVENTS_PER_USER_HOUR):
+            ts = start + timedelta(seconds=second)
+            key = hashlib.sha256(f'user-{user}|heart_rate|{ts.isoformat()}|ble'.encode()).hexdigest()
+            yield key, dedupe_group(f'user-{user}', ts)
+
+
+def _measure(redis: Redis, compact: bool) -> float:
+    redis.flushdb()
+    before = redis.info('memory')['used_memory']
+    keys, groups = [], []
+    total = 0
+    for key, group in _events():
+        keys.append(key)
+        groups.append(group)
+        if len(keys) == BATCH:
+            mark_seen_many(redis, keys, groups if compact else None)
+            total += len(keys)
+            keys, groups = [], []
+    if keys:
+        mark_seen_many(redis, keys, groups if compact else None)
+        total += len(keys)
+    used = redis.info('memory')['used_memory'] - before
+    redis.flushdb()
+    return used / total
+
+
+def main() -> None:
+    redis = Redis.from_url(os.environ.get('BENCH_REDIS_URL', 'redis://localhost:6379/15'))
+    flat = _measure(redis, compact=False)
+    compact = _measure(redis, compact=True)
+    events = USERS * HOURS * EVENTS_PER_USER_HOUR
+    print(f'{events} events, {USERS} users x {HOURS} h at 1 Hz')
+    print(f'flat    : {flat:7.1f} bytes/event')
+    print(f'compact : {compact:7.1f} bytes/event ({flat / compact:.1f}x smaller)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Memory held by 100k normalized heart rate samples as event dicts (one per
+# sample, header fields repeated) against EventBatch arrays, plus the cost
+# of validating each and turning it into insert rows.
+#
+#   cd backend && python -m benchmarks.bench_event_batch
+import gc
+import time
+import tracemalloc
+
+from app.ingest.rows import event_row
+from app.ingest.validation import batch_errors, validation_error
+from app.normalizer.batch import group_events
+from app.normalizer.registry import get_normalizer
+
+SAMPLES = 100_000
+
+
+def _payload():
+    # One 1 Hz stretch of Fitbit intraday data (~28 hours' worth of samples).
+    return {
+        'user_id': 'bench-user',
+        'dateTime': '2023-09-01',
+        'device': {'vendor': 'Fitbit', 'model': 'Charge 6'},
+        'heart_rate': {'dataset': [
+            {'time': f'{second % 86400 // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}', 'value': 55 + second % 60}
+            for second in range(SAMPLES)
+        ]},
+    }
+
+
+def _retained(build):
+    # Timed without tracing (tracemalloc slows allocation down a lot), then
+    # built again under tracemalloc for the memory it keeps.
+    started = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size, elapsed
+
+
+def main() -> None:
+    payload = _payload()
+    normalizer = get_normalizer('vendor_fitbit')
+    events, dict_bytes, dict_s = _retained(lambda: list(normalizer.normalize(payload)))
+    batches, batch_bytes, batch_s = _retained(lambda: list(normalizer.normalize_batches(payload)))
+    grouped, grouped_bytes, grouped_s = _retained(lambda: list(group_events(events)))
+    print(f'{SAMPLES} heart rate samples')
+    print(f'dicts                : {dict_bytes / 1e6:7.2f} MB ({dict_bytes / SAMPLES:5.0f} B/sample), built in {dict_s:.2f}s')
+    print(f'EventBatch (native)  : {batch_bytes / 1e6:7.2f} MB ({batch_bytes / SAMPLES:5.0f} B/sample), built in {batch_s:.2f}s')
+    print(f'EventBatch (grouped) : {grouped_bytes / 1e6:7.2f} MB ({grouped_bytes / SAMPLES:5.0f} B/sample), built in {grouped_s:.2f}s')
+
+    started = time.perf_counter()
+    for event in events:
+        validation_error(event)
+    validate_dicts = time.perf_counter() - started
+    started = time.perf_counter()
+    for batch in batches:
+        batch_errors(batch)
+    validate_batches = time.perf_counter() - started
+    print(f'validation           : dicts {validate_dicts:.2f}s, batches {validate_batches:.3f}s')
+
+    started = time.perf_counter()
+    for event in events:
+        event_row(event)
+    rows_from_dicts = time.perf_counter() - started
+    started = time.perf_counter()
+    for batch in batches:
+        batch.rows()
+    rows_from_batches = time.perf_counter() - started
+    print(f'insert rows          : dicts {rows_from_dicts:.2f}s, batches {rows_from_batches:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
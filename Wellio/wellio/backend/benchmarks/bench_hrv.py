@@ -0,0 +1,44 @@
+# HRV for one user-day of beat-to-beat data (a BLE strap worn all day: one
+# event per ~1.7 s with two RR intervals each) as hrv_stmt() rows, computed
+# for the day window and its 24 hour windows, the nightly job's work per
+# user once the rows are fetched.
+#
+#   cd backend && python -m benchmarks.bench_hrv
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import time
+
+import numpy as np
+
+from app.users.hrv import compute_windows, hrv_columns
+
+DAY = datetime(2023, 9, 1, tzinfo=timezone.utc)
+ROUNDS = 5
+
+
+def _rows():
+    rng = np.random.default_rng(5)
+    events = int(86400 / 1.7)
+    rr = (850 + rng.normal(0, 45, size=(events, 2))).tolist()
+    return [
+        SimpleNamespace(ts=(DAY + timedelta(seconds=index * 1.7)).replace(tzinfo=None), bpm=60000 / sum(pair) * 2, payload={'rr': pair})
+        for index, pair in enumerate(rr)
+    ]
+
+
+def main() -> None:
+    rows = _rows()
+    best = float('inf')
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        columns = hrv_columns(rows)
+        compute_windows(columns, DAY, 86400, 1)
+        compute_windows(columns, DAY, 3600, 24)
+        best = min(best, time.perf_counter() - started)
+    beats = 2 * len(rows)
+    print(f'{len(rows)} events, {beats} RR intervals')
+    print(f'day + 24 hours: {best * 1000:.0f} ms per user-day ({beats / best / 1e6:.1f}M intervals/s, {3600 / best:,.0f} user-days per CPU-hour)')
+
+
+if __name__ == '__main__':
+    main()
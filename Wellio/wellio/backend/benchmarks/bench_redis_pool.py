@@ -0,0 +1,53 @@
+# Load test of the dedupe SET NX under concurrency: a new client per request
+# (the old get_redis(), which built Redis.from_url each time) against the
+# shared InstrumentedConnectionPool. Runs on fakeredis, so it measures the
+# client-side pool and connection setup cost, not network latency.
+#
+#   cd backend && python -m benchmarks.bench_redis_pool
+from concurrent.futures import ThreadPoolExecutor
+import time
+import uuid
+
+import fakeredis
+from redis import Redis
+
+from app.ingest.idempotency import mark_seen
+from app.metrics import metrics
+from app.pools import InstrumentedConnectionPool, pool_stats
+
+THREADS = 32
+REQUESTS = 20000
+
+
+def _run(get_client) -> float:
+    def request(_):
+        mark_seen(get_client(), uuid.uuid4().hex)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as executor:
+        list(executor.map(request, range(REQUESTS)))
+    return REQUESTS / (time.perf_counter() - started)
+
+
+def main() -> None:
+    server = fakeredis.FakeServer()
+    per_request = _run(lambda: Redis(connection_pool=fakeredis.FakeRedis(server=server).connection_pool))
+
+    pool = InstrumentedConnectionPool(
+        connection_class=fakeredis.FakeConnection,
+        server=server,
+        max_connections=THREADS,
+        timeout=5,
+    )
+    shared = Redis(connection_pool=pool)
+    pooled = _run(lambda: shared)
+
+    checkout = metrics.snapshot()['timings']['redis_pool.checkout_seconds']
+    print(f'client per request : {per_request:10.0f} req/s')
+    print(f'shared pool        : {pooled:10.0f} req/s ({pooled / per_request:.1f}x)')
+    print(f'pool               : {pool_stats(pool)}')
+    print(f'checkout wait      : avg {checkout["avg"] * 1e6:.1f} us, max {checkout["max"] * 1e3:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
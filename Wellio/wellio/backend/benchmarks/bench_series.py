@@ -0,0 +1,90 @@
+# Chart data for a 30-day, 1 Hz heart-rate series: every raw event (what
+# /v1/summary returns) against /v1/users/{id}/series with 500 SQL buckets,
+# with and without LTTB, plus LTTB straight over the raw points. Runs on an
+# in-memory SQLite database, so absolute times are indicative only.
+#
+#   cd backend && python -m benchmarks.bench_series
+from datetime import datetime, timedelta, timezone
+import json
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, select
+from sqlalchemy.pool import StaticPool
+
+from app.ingest.rows import event_from_row
+from app.models import Base, Event
+from app.users.series import lttb, series_points, series_stmt, series_width
+
+DAYS = 30
+POINTS = 500
+CHUNK = 50000
+USER = 'bench-user'
+
+
+def _load(engine, start: datetime) -> int:
+    total = DAYS * 86400
+    rng = np.random.default_rng(7)
+    seconds = np.arange(total)
+    bpm = 65 + 15 * np.sin(seconds / 86400 * 2 * np.pi) + rng.normal(0, 4, total)
+    # Raw executemany in SQLite's DATETIME storage format keeps setup short.
+    stamps = np.char.replace(
+        np.datetime_as_string(np.datetime64(start.replace(tzinfo=None), 's') + seconds, unit='us'), 'T', ' '
+    )
+    sql = (
+        'INSERT INTO events (user_id, kind, ts, source, device_vendor, device_model, bpm, payload) '
+        "VALUES (?, 'heart_rate', ?, 'ble', 'Polar', 'H10', ?, '{}')"
+    )
+    with engine.begin() as conn:
+        for offset in range(0, total, CHUNK):
+            conn.exec_driver_sql(sql, [
+                (USER, str(stamp), float(value))
+                for stamp, value in zip(stamps[offset:offset + CHUNK], bpm[offset:offset + CHUNK])
+            ])
+    return total
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main() -> None:
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2023, 9, 1, tzinfo=timezone.utc)
+    end = start + timedelta(days=DAYS)
+    rows, load_s = _timed(lambda: _load(engine, start))
+    print(f'loaded {rows} events in {load_s:.1f}s')
+
+    with engine.connect() as conn:
+        def raw():
+            result = conn.execute(
+                select(Event.__table__)
+                .where(Event.user_id == USER, Event.ts >= start, Event.ts < end)
+                .order_by(Event.ts)
+            )
+            return json.dumps([event_from_row(row) for row in result])
+
+        def series(downsample):
+            width = series_width(start, end, POINTS, downsample)
+            result = conn.execute(series_stmt('sqlite', USER, 'heart_rate', start, end, width)).all()
+            return json.dumps(series_points(result, POINTS, downsample))
+
+        for label, fn in (
+            ('raw events', raw),
+            ('series (buckets)', lambda: series(False)),
+            ('series (lttb)', lambda: series(True)),
+        ):
+            body, seconds = _timed(fn)
+            print(f'{label:18}: {len(body) / 1e6:9.2f} MB {seconds:8.2f} s')
+
+        values = np.array(conn.execute(select(Event.bpm).order_by(Event.ts)).scalars().all())
+    x = np.arange(len(values), dtype=np.float64)
+    _, seconds = _timed(lambda: lttb(x, values, POINTS))
+    print(f'lttb over raw     : {len(values)} -> {POINTS} points in {seconds:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
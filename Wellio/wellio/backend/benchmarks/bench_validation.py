@@ -0,0 +1,39 @@
+# Per-event cost of telemetry validation: the original oneOf Draft7Validator
+# against the kind-dispatched compiled checks in app.ingest.validation.
+#
+#   cd backend && python -m benchmarks.bench_validation
+import timeit
+
+from app.ingest import validation
+
+EVENTS = [
+    {'kind': 'heart_rate', 'userId': 'user', 'source': 'ble', 'ts': '2023-09-01T00:00:00Z',
+     'bpm': 62, 'device': {'vendor': 'Polar', 'model': 'H10'}, 'meta': {'sampling_hz': 1}},
+    {'kind': 'steps', 'userId': 'user', 'source': 'healthkit', 'ts': '2023-09-01T00:00:00Z',
+     'steps': 1200, 'device': {'vendor': 'Apple'}, 'window': 'PT1H'},
+    {'kind': 'sleep', 'userId': 'user', 'source': 'vendor_oura', 'ts': '2023-09-01T00:00:00Z',
+     'stage': 'deep', 'dur_s': 900, 'device': {'vendor': 'Oura'}},
+]
+
+
+def _draft7(events):
+    for event in events:
+        validation._validator.validate(event)
+
+
+def _compiled(events):
+    for event in events:
+        assert validation.validation_error(event) is None
+
+
+def main(rounds: int = 20000) -> None:
+    n = rounds * len(EVENTS)
+    baseline = timeit.timeit(lambda: _draft7(EVENTS), number=rounds) / n
+    compiled = timeit.timeit(lambda: _compiled(EVENTS), number=rounds) / n
+    print(f'Draft7Validator oneOf : {baseline * 1e6:8.2f} us/event')
+    print(f'compiled, by kind     : {compiled * 1e6:8.2f} us/event')
+    print(f'speedup               : {baseline / compiled:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# Peak Python memory and time to normalize one day of 1 Hz Garmin heart rate
+# samples (~4 MB of JSON) with json.loads against the incremental ijson
+# decoder the webhook workers use for large bodies. Events are consumed in
+# ingest-sized chunks, as the worker does.
+#
+#   cd backend && python -m benchmarks.bench_webhook_parse
+import json
+import time
+import tracemalloc
+
+from app.webhooks.queue import normalize_message
+
+SAMPLES = 86400
+CHUNK = 1000
+
+
+def _body() -> bytes:
+    return json.dumps({
+        'userId': 'bench-user',
+        'device': {'vendor': 'Garmin', 'model': 'Forerunner'},
+        'heartRateSamples': [
+            {'endTimestampGMT': 1_693_526_400 + second, 'heartRate': 55 + second % 60}
+            for second in range(SAMPLES)
+        ],
+    }).encode()
+
+
+def _run(fields, lazy_min_bytes: int):
+    tracemalloc.start()
+    started = time.perf_counter()
+    events = 0
+    chunk = []
+    for event in normalize_message(fields, lazy_min_bytes):
+        chunk.append(event)
+        if len(chunk) == CHUNK:
+            events += len(chunk)
+            chunk = []
+    events += len(chunk)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return events, elapsed, peak
+
+
+def main() -> None:
+    body = _body()
+    fields = {b'vendor': b'garmin', b'body': body}
+    print(f'{SAMPLES} samples, {len(body) / 1e6:.1f} MB body')
+    for name, lazy_min_bytes in (('json.loads', len(body) + 1), ('ijson', 0)):
+        events, elapsed, peak = _run(fields, lazy_min_bytes)
+        print(f'{name:10}: {events} events in {elapsed:.2f}s, peak {peak / 1e6:6.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
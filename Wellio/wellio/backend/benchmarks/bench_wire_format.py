@@ -0,0 +1,86 @@
+# Bytes on the wire and server-side decode time per 1k heart-rate events:
+# the current JSON array of full events against MessagePack/CBOR and the
+# columnar batch form, with and without gzip/zstd. Decode covers
+# decompression, parsing and expansion into event dicts (what the ingest
+# routes hand to the pipeline).
+#
+#   cd backend && python -m benchmarks.bench_wire_format
+from datetime import datetime, timedelta, timezone
+import gzip
+import json
+import time
+
+import cbor2
+import msgpack
+import zstandard
+
+from app.ingest.codecs import body_events, decode_body
+
+EVENTS = 1000
+ROUNDS = 200
+
+
+def _events():
+    start = datetime(2023, 9, 1, tzinfo=timezone.utc)
+    return [
+        {
+            'kind': 'heart_rate',
+            'userId': 'a1b2c3d4-e5f6-7890-abcd-ef1234567890',
+            'device': {'vendor': 'Polar', 'model': 'H10', 'id': 'C4:7F:51:0E:22:9A'},
+            'source': 'ble',
+            'ts': (start + timedelta(seconds=i)).isoformat().replace('+00:00', 'Z'),
+            'bpm': 60 + i % 40,
+        }
+        for i in range(EVENTS)
+    ]
+
+
+def _columnar(events):
+    first = events[0]
+    start = datetime(2023, 9, 1, tzinfo=timezone.utc).timestamp()
+    return {
+        'kind': first['kind'],
+        'userId': first['userId'],
+        'device': first['device'],
+        'source': first['source'],
+        'columns': {
+            'ts': [start + i for i in range(len(events))],
+            'bpm': [event['bpm'] for event in events],
+        },
+    }
+
+
+def main() -> None:
+    events = _events()
+    columnar = _columnar(events)
+    zstd = zstandard.ZstdCompressor(level=3)
+    cases = [
+        ('json rows', json.dumps(events).encode(), 'application/json', None),
+        ('json rows + gzip', gzip.compress(json.dumps(events).encode()), 'application/json', 'gzip'),
+        ('msgpack rows', msgpack.packb(events), 'application/msgpack', None),
+        ('cbor rows', cbor2.dumps(events), 'application/cbor', None),
+        ('json columnar', json.dumps(columnar).encode(), 'application/json', None),
+        ('msgpack columnar', msgpack.packb(columnar), 'application/msgpack', None),
+        ('cbor columnar', cbor2.dumps(columnar), 'application/cbor', None),
+        ('msgpack col + gzip', gzip.compress(msgpack.packb(columnar)), 'application/msgpack', 'gzip'),
+        ('msgpack col + zstd', zstd.compress(msgpack.packb(columnar)), 'application/msgpack', 'zstd'),
+    ]
+    baseline_bytes = len(cases[0][1])
+    baseline_s = None
+    print(f'{"format":20} {"bytes":>8} {"ratio":>6} {"decode/1k":>10}')
+    for label, body, content_type, encoding in cases:
+        decoded = body_events(decode_body(body, content_type, encoding, 64 * 1024 * 1024))
+        assert len(decoded) == EVENTS
+        started = time.perf_counter()
+        for _ in range(ROUNDS):
+            body_events(decode_body(body, content_type, encoding, 64 * 1024 * 1024))
+        seconds = (time.perf_counter() - started) / ROUNDS
+        baseline_s = baseline_s or seconds
+        print(
+            f'{label:20} {len(body):8d} {len(body) / baseline_bytes:6.2f} '
+            f'{seconds * 1e3:8.2f}ms ({seconds / baseline_s:.2f}x)'
+        )
+
+
+if __name__ == '__main__':
+    main()
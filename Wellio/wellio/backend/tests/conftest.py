@@ -4,3 +4,86 @@ import sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from fakeredis import FakeRedis, FakeServer  # noqa: E402
+from fakeredis import aioredis as fake_aioredis  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+import app.main as app_main  # noqa: E402
+from app.main import app  # noqa: E402
+from app import deps as app_deps  # noqa: E402
+from app.models import Base  # noqa: E402
+
+engine = create_engine(
+    'sqlite:///:memory:',
+    connect_args={'check_same_thread': False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(bind=engine)
+app_deps.engine = engine
+app_main.engine = engine
+Base.metadata.create_all(bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+fake_server = FakeServer()
+fake_redis = FakeRedis(server=fake_server)
+
+
+def override_get_redis():
+    return fake_redis
+
+
+app.dependency_overrides[app_deps.get_db] = override_get_db
+app.dependency_overrides[app_deps.get_redis] = override_get_redis
+app.dependency_overrides[app_deps.get_session_factory] = lambda: TestingSessionLocal
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def redis():
+    return fake_redis
+
+
+@pytest.fixture
+def async_redis():
+    # Same fake server as `redis`, for code that talks redis.asyncio.
+    return fake_aioredis.FakeRedis(server=fake_server)
+
+
+@pytest.fixture
+def session_factory():
+    return TestingSessionLocal
+
+
+@pytest.fixture
+def db():
+    session = TestingSessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(autouse=True)
+def _clean_state():
+    yield
+    fake_redis.flushall()
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
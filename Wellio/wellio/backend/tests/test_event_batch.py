@@ -0,0 +1,77 @@
+from datetime import timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from app.ingest.pipeline import ingest_events, summarize
+from app.ingest.rows import event_row
+from app.models import Event
+from app.normalizer.batch import EventBatch, group_events, iter_events
+from app.normalizer.fitbit import normalize_fitbit
+from app.normalizer.registry import get_normalizer
+
+
+def _hr(user, second, bpm=70, **extra):
+    return {
+        'kind': 'heart_rate',
+        'userId': user,
+        'source': 'ble',
+        'ts': f'2023-10-01T06:00:{second:02d}Z',
+        'bpm': bpm,
+        'device': {'vendor': 'Polar', 'model': 'H10', 'id': 'strap'},
+        **extra,
+    }
+
+
+def test_group_events_batches_shared_headers_and_passes_the_rest_through():
+    odd_stage = {'kind': 'sleep', 'userId': 'u', 'source': 'ble', 'ts': '2023-10-01T00:00:00Z', 'stage': 'nap', 'dur_s': 60, 'device': {}}
+    bad_ts = _hr('u', 0, ts='yesterday')
+    events = [_hr('u', 0), _hr('u', 1, 71.5), odd_stage, _hr('u', 2), bad_ts, _hr('v', 3, meta={'confidence': 0.5})]
+    items = list(group_events(events))
+    assert [len(item) if isinstance(item, EventBatch) else item for item in items] == [2, odd_stage, 1, bad_ts, 1]
+    batch = items[0]
+    assert batch.header == {'kind': 'heart_rate', 'userId': 'u', 'source': 'ble', 'device': {'vendor': 'Polar', 'model': 'H10', 'id': 'strap'}}
+    assert batch.nbytes == 2 * 8 + 2 * 8
+    assert list(iter_events(items))[1] == {**_hr('u', 1), 'bpm': 71.5}
+    # Rows come straight from the arrays but match the dict path.
+    for item in items:
+        if isinstance(item, EventBatch):
+            assert item.rows() == [event_row(event) for event in item.events()]
+
+
+def test_registry_dispatches_by_source():
+    assert get_normalizer('health_connect').source == 'health_connect'
+    assert type(get_normalizer('vendor_oura')).__name__ == 'OuraNormalizer'
+    with pytest.raises(KeyError):
+        get_normalizer('vendor_polar')
+
+
+def test_fitbit_batches_match_normalize_fitbit():
+    payload = {
+        'user_id': 'fb',
+        'dateTime': '2023-09-01',
+        'heart_rate': {'dataset': [{'time': f'00:{minute:02d}:00', 'value': 60 + minute} for minute in range(60)] + [{'time': '01:00', 'value': 50}]},
+        'steps': {'dateTime': '2023-09-01', 'value': 5000},
+        'sleep': [{'startTime': '2023-08-31T22:00:00Z', 'duration': 3600000, 'levels': {'summary': {'stages': 'deep'}}}],
+    }
+    items = list(get_normalizer('vendor_fitbit').normalize_batches(payload))
+    assert all(isinstance(item, EventBatch) for item in items)
+    expected = [event_row(event) for event in normalize_fitbit(payload)]
+    # Date-only and naive ts parse to naive datetimes on the dict path; batch
+    # rows always carry UTC.
+    for row in expected:
+        row['ts'] = row['ts'].replace(tzinfo=timezone.utc)
+    assert [row for item in items for row in item.rows()] == expected
+
+
+def test_pipeline_ingests_batches_with_row_level_validation(db, redis):
+    batch = next(group_events([_hr('batch-user', 0), _hr('batch-user', 1, -5), _hr('batch-user', 2)]))
+    foreign = next(group_events([{**_hr('batch-user', 3), 'source': 'polar'}]))
+    results = ingest_events(db, redis, [batch, _hr('batch-user', 4), foreign])
+    assert [result['status'] for result in results] == ['accepted', 'invalid', 'accepted', 'accepted', 'invalid']
+    # Failing rows are rebuilt and get the dict path's message.
+    assert "'bpm': -5.0" in results[1]['detail']
+    assert results[1]['detail'].endswith('is not valid under any of the given schemas')
+    assert "'source': 'polar'" in results[4]['detail']
+    assert db.scalar(select(func.count()).select_from(Event).where(Event.user_id == 'batch-user')) == 3
+    assert summarize(ingest_events(db, redis, [batch]))['duplicate'] == 2
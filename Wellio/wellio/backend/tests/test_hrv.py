@@ -0,0 +1,95 @@
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.jobs.hrv import compute_nightly_hrv
+from app.users.hrv import compute_windows, hrv_cache_key, hrv_columns
+
+DAY = datetime(2023, 9, 1, tzinfo=timezone.utc)
+
+
+def _row(ts, bpm, rr=None):
+    return SimpleNamespace(ts=ts, bpm=bpm, payload={'rr': rr} if rr is not None else {})
+
+
+def test_compute_windows_matches_reference_and_respects_recordings():
+    rng = np.random.default_rng(3)
+    rr = 850 + rng.normal(0, 45, size=240)
+    rr[100] = 4000  # artifact
+    rows = []
+    ts = DAY
+    for index in range(0, 240, 2):
+        if index == 160:
+            ts += timedelta(minutes=10)  # strap taken off
+        rows.append(_row(ts, 70.0 + index % 9, list(rr[index:index + 2])))
+        ts += timedelta(seconds=1.7)
+    # Hour two: 1 Hz heart rate only; hour three: nothing.
+    rows += [_row(DAY + timedelta(hours=1, seconds=second), 60.0 + second % 4) for second in range(120)]
+
+    hour = compute_windows(hrv_columns(rows), DAY, 3600, 3)
+    clean = np.delete(rr, 100)
+    # Differences across the artifact and across the gap are not taken.
+    diffs = np.concatenate([np.diff(rr[:100]), np.diff(rr[101:160]), np.diff(rr[160:])])
+    assert hour[0]['beats'] == 239
+    assert hour[0]['rr_source'] == 'rr'
+    assert hour[0]['sdnn_ms'] == round(float(np.std(clean, ddof=1)), 2)
+    assert hour[0]['rmssd_ms'] == round(float(np.sqrt(np.mean(diffs ** 2))), 2)
+    assert hour[0]['pnn50'] == round(float(100 * np.mean(np.abs(diffs) > 50)), 2)
+    assert hour[0]['resting_bpm'] == 70.0
+    assert hour[1]['rr_source'] == 'bpm' and hour[1]['rmssd_ms'] is not None
+    assert hour[2] == {
+        'start': (DAY + timedelta(hours=2)).isoformat(),
+        'beats': 0,
+        'rr_source': None,
+        'rmssd_ms': None,
+        'sdnn_ms': None,
+        'pnn50': None,
+        'resting_bpm': None,
+    }
+
+
+def _rr_events(user_id):
+    return [
+        {
+            'kind': 'heart_rate',
+            'userId': user_id,
+            'source': 'ble',
+            'device': {},
+            'ts': (DAY + timedelta(seconds=second)).isoformat(),
+            'bpm': 70,
+            'rr': [840.0 + 10 * (second % 3), 860.0 - 10 * (second % 2)],
+        }
+        for second in range(60)
+    ]
+
+
+def test_hrv_endpoint_caches_completed_windows(client, redis):
+    assert client.post('/v1/telemetry:batch', json=_rr_events('hrv-user')).json()['accepted'] == 60
+    params = {'from': '2023-09-01T00:00:00Z', 'to': '2023-09-03T00:00:00Z'}
+    body = client.get('/v1/users/hrv-user/hrv', params=params).json()
+    assert [window['start'] for window in body['windows']] == ['2023-09-01T00:00:00+00:00', '2023-09-02T00:00:00+00:00']
+    assert body['windows'][0]['beats'] == 120
+    assert body['windows'][0]['rmssd_ms'] > 0
+    assert redis.get(hrv_cache_key('hrv-user', 'day', DAY)) is not None
+    # Windows without data are not cached: a later sync still shows up.
+    assert redis.get(hrv_cache_key('hrv-user', 'day', DAY + timedelta(days=1))) is None
+    # Served from the cache from now on.
+    redis.set(hrv_cache_key('hrv-user', 'day', DAY), '{"start": "cached"}')
+    assert client.get('/v1/users/hrv-user/hrv', params=params).json()['windows'][0] == {'start': 'cached'}
+    hours = client.get('/v1/users/hrv-user/hrv', params={**params, 'window': 'hour'}).json()['windows']
+    assert len(hours) == 48
+    assert client.get('/v1/users/hrv-user/hrv', params={'from': '2023-01-01', 'to': '2023-09-01', 'window': 'hour'}).status_code == 400
+    # Heart rate landing in a cached window drops its entries.
+    late = {**_rr_events('hrv-user')[0], 'ts': '2023-09-01T05:00:00Z'}
+    assert client.post('/v1/telemetry', json=late).json()['status'] == 'accepted'
+    assert redis.get(hrv_cache_key('hrv-user', 'day', DAY)) is None
+    assert client.get('/v1/users/hrv-user/hrv', params=params).json()['windows'][0]['beats'] == 122
+
+
+def test_nightly_job_caches_day_and_hours(client, redis, session_factory):
+    client.post('/v1/telemetry:batch', json=_rr_events('nightly-user'))
+    assert compute_nightly_hrv(session_factory, redis, date(2023, 9, 1)) == 1
+    assert redis.get(hrv_cache_key('nightly-user', 'day', DAY)) is not None
+    assert redis.get(hrv_cache_key('nightly-user', 'hour', DAY)) is not None
+    assert redis.get(hrv_cache_key('nightly-user', 'hour', DAY + timedelta(hours=23))) is None
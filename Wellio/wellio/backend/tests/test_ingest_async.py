@@ -0,0 +1,81 @@
+import fakeredis
+import pytest
+from fakeredis import aioredis as fake_aioredis
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import deps as app_deps
+from app.ingest.async_router import router as async_ingest_router
+from app.main import events_async, summary_async
+from app.models import Base, Event
+
+
+@pytest.fixture
+def async_client(tmp_path):
+    url = f'sqlite:///{tmp_path}/events.db'
+    sync_engine = create_engine(url)
+    Base.metadata.create_all(bind=sync_engine)
+    async_engine = create_async_engine(url.replace('sqlite', 'sqlite+aiosqlite', 1), poolclass=NullPool)
+    sessions = async_sessionmaker(async_engine, expire_on_commit=False)
+    server = fakeredis.FakeServer()
+
+    async def override_get_async_db():
+        async with sessions() as db:
+            yield db
+
+    async def override_get_async_redis():
+        yield fake_aioredis.FakeRedis(server=server)
+
+    app = FastAPI()
+    app.include_router(async_ingest_router, prefix='/v1')
+    app.add_api_route('/v1/summary', summary_async, methods=['GET'])
+    app.add_api_route('/v1/events', events_async, methods=['GET'])
+    app.dependency_overrides[app_deps.get_async_db] = override_get_async_db
+    app.dependency_overrides[app_deps.get_async_sessionmaker] = lambda: sessions
+    app.dependency_overrides[app_deps.get_async_redis] = override_get_async_redis
+    with TestClient(app) as client:
+        yield client, sync_engine
+
+
+def test_async_ingest_dedupes(async_client):
+    client, sync_engine = async_client
+    event = {
+        'kind': 'steps',
+        'userId': 'user',
+        'source': 'health_connect',
+        'ts': '2023-09-01T10:00:00Z',
+        'steps': 120,
+        'device': {},
+    }
+    assert client.post('/v1/telemetry', json=event).json() == {'status': 'accepted'}
+    assert client.post('/v1/telemetry', json=event).json() == {'status': 'duplicate'}
+    body = client.post('/v1/telemetry:batch', json=[event, {**event, 'ts': '2023-09-01T11:00:00Z'}]).json()
+    assert (body['accepted'], body['duplicate']) == (1, 1)
+    with sync_engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(Event)) == 2
+
+
+def test_async_events_streams_pages(async_client):
+    client, _ = async_client
+    events = [
+        {
+            'kind': 'steps',
+            'userId': 'user',
+            'source': 'health_connect',
+            'ts': f'2023-09-01T10:0{minute}:00Z',
+            'steps': minute,
+            'device': {},
+        }
+        for minute in range(3)
+    ]
+    client.post('/v1/telemetry:batch', json=events)
+    params = {'from_': '2023-09-01', 'to': '2023-09-02', 'limit': 2}
+    first = client.get('/v1/events', params=params).json()
+    assert first['events'] == events[:2]
+    second = client.get('/v1/events', params={**params, 'after': first['next_after']}).json()
+    assert second == {'events': events[2:], 'next_after': None}
+    [day] = client.get('/v1/summary', params=params).json()
+    assert day['events'] == events
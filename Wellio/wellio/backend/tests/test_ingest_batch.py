@@ -0,0 +1,77 @@
+import gzip
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+from app.ingest import router as ingest_router
+from app.ingest.stream import NdjsonDecoder, NdjsonError
+from app.models import Event
+
+
+def _hr(ts, bpm=60, user='user'):
+    return {
+        'kind': 'heart_rate',
+        'userId': user,
+        'source': 'ble',
+        'ts': ts,
+        'bpm': bpm,
+        'device': {'vendor': 'Polar'},
+    }
+
+
+def test_batch_reports_status_per_event(client, db):
+    events = [
+        _hr('2023-09-01T00:00:00Z'),
+        _hr('2023-09-01T00:00:01Z'),
+        _hr('2023-09-01T00:00:00Z'),
+        {'kind': 'heart_rate', 'userId': 'user'},
+    ]
+    resp = client.post('/v1/telemetry:batch', json=events)
+    assert resp.status_code == 202
+    body = resp.json()
+    assert [r['status'] for r in body['results']] == ['accepted', 'accepted', 'duplicate', 'invalid']
+    assert (body['accepted'], body['duplicate'], body['invalid']) == (2, 1, 1)
+    assert db.scalar(select(func.count()).select_from(Event)) == 2
+
+
+def test_batch_db_conflict_reported_as_duplicate(client, redis):
+    event = _hr('2023-09-01T00:00:00Z')
+    assert client.post('/v1/telemetry:batch', json=[event]).json()['accepted'] == 1
+    # Redis forgot the key (e.g. TTL expired); the unique constraint still dedupes.
+    redis.flushall()
+    body = client.post('/v1/telemetry:batch', json=[event, _hr('2023-09-01T00:00:05Z')]).json()
+    assert [r['status'] for r in body['results']] == ['duplicate', 'accepted']
+
+
+def test_batch_size_limit(client):
+    limit = ingest_router._settings.ingest_batch_max_events
+    resp = client.post('/v1/telemetry:batch', json=[{}] * (limit + 1))
+    assert resp.status_code == 413
+
+
+def _ndjson(events):
+    return ''.join(json.dumps(event) + '\n' for event in events).encode()
+
+
+def test_stream_ingest_gzip_ndjson(client, db):
+    events = [_hr(f'2023-09-01T00:00:{second:02d}Z') for second in range(30)]
+    body = gzip.compress(_ndjson(events[:20])) + gzip.compress(_ndjson(events[10:]) + b'not json\n')
+    resp = client.post(
+        '/v1/telemetry:stream',
+        content=body,
+        headers={'Content-Type': 'application/x-ndjson', 'Content-Encoding': 'gzip'},
+    )
+    assert resp.status_code == 202
+    body = resp.json()
+    assert (body['accepted'], body['duplicate'], body['invalid']) == (30, 10, 1)
+    assert body['errors'][0]['line'] == 41
+    assert db.scalar(select(func.count()).select_from(Event)) == 30
+
+
+def test_ndjson_decoder_bounds_line_length():
+    decoder = NdjsonDecoder(max_line_bytes=8)
+    assert list(decoder.feed(b'{"a":1}\n{"b"')) == [(1, b'{"a":1}')]
+    assert list(decoder.feed(b':2}\n')) == [(2, b'{"b":2}')]
+    with pytest.raises(NdjsonError):
+        list(decoder.feed(b'{"c": 12345}'))
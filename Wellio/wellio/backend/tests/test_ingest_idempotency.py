@@ -1,46 +1,10 @@
-from fastapi.testclient import TestClient
-from fakeredis import FakeRedis
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from datetime import datetime
 
-import app.main as app_main
-from app.main import app
-from app import deps as app_deps
-from app.models import Base
+from app.ingest import pipeline
+from app.ingest.idempotency import COMPACT_PREFIX, TTL_SECONDS, dedupe_group, mark_seen, mark_seen_many
 
-engine = create_engine(
-    'sqlite:///:memory:',
-    connect_args={'check_same_thread': False},
-    poolclass=StaticPool,
-)
-TestingSessionLocal = sessionmaker(bind=engine)
-app_deps.engine = engine
-app_main.engine = engine
 
-
-def override_get_db():
-    Base.metadata.create_all(bind=engine)
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-fake_redis = FakeRedis()
-
-
-def override_get_redis():
-    return fake_redis
-
-
-app.dependency_overrides[app_deps.get_db] = override_get_db
-app.dependency_overrides[app_deps.get_redis] = override_get_redis
-client = TestClient(app)
-
-
-def test_idempotent_ingest():
+def test_idempotent_ingest(client):
     payload = {
         'kind': 'heart_rate',
         'userId': 'user',
@@ -52,4 +16,59 @@ def test_idempotent_ingest():
     resp1 = client.post('/v1/telemetry', json=payload)
     resp2 = client.post('/v1/telemetry', json=payload)
     assert resp1.status_code == 202
+    assert resp1.json()['status'] == 'accepted'
     assert resp2.json()['status'] == 'duplicate'
+
+
+def test_invalid_event_rejected(client):
+    resp = client.post('/v1/telemetry', json={'kind': 'heart_rate', 'userId': 'user'})
+    assert resp.status_code == 400
+    assert resp.json()['detail'].startswith('invalid telemetry:')
+
+
+def test_compact_keyspace_groups_digests_per_user_hour(redis):
+    group = dedupe_group('user', datetime(2023, 9, 1, 7, 30))
+    assert group == 'user:2023090107'
+    keys = ['ab' * 32, 'cd' * 32, 'ab' * 32]
+    assert mark_seen_many(redis, keys, [group] * 3) == [True, True, False]
+    assert mark_seen(redis, 'cd' * 32, group) is False
+    assert redis.keys('*') == [f'{COMPACT_PREFIX}{group}'.encode()]
+    assert redis.scard(f'{COMPACT_PREFIX}{group}') == 2
+    assert 0 < redis.ttl(f'{COMPACT_PREFIX}{group}') <= TTL_SECONDS
+
+
+def test_compact_keyspace_ingest(client, redis, monkeypatch):
+    monkeypatch.setattr(pipeline._settings, 'dedupe_keyspace', 'compact')
+    payload = {
+        'kind': 'heart_rate',
+        'userId': 'user',
+        'source': 'ble',
+        'ts': '2023-09-01T07:30:00+02:00',
+        'bpm': 70,
+        'device': {},
+    }
+    assert client.post('/v1/telemetry', json=payload).json()['status'] == 'accepted'
+    assert redis.keys('telemetry_dedupe:*') == [b'telemetry_dedupe:g:user:2023090105']
+    assert client.post('/v1/telemetry', json=payload).json()['status'] == 'duplicate'
+
+
+def test_failed_insert_releases_dedupe_keys(client, monkeypatch):
+    payload = {
+        'kind': 'heart_rate',
+        'userId': 'release-user',
+        'source': 'healthkit',
+        'ts': '2023-09-02T00:00:00Z',
+        'bpm': 64,
+        'device': {},
+    }
+    insert_rows = pipeline.insert_rows
+
+    def failing_insert(db, rows):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(pipeline, 'insert_rows', failing_insert)
+    failing_client = type(client)(client.app, raise_server_exceptions=False)
+    assert failing_client.post('/v1/telemetry', json=payload).status_code == 500
+    monkeypatch.setattr(pipeline, 'insert_rows', insert_rows)
+    # The retry is stored instead of being answered as a duplicate.
+    assert client.post('/v1/telemetry', json=payload).json()['status'] == 'accepted'
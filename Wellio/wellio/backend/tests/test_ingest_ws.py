@@ -0,0 +1,107 @@
+import base64
+
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.ingest.buffer import BufferFull
+from app.ingest.ws import CLOSE_TRY_AGAIN, serve_ingest_ws
+from app.models import Event
+
+
+def _hr(second, bpm=70):
+    return {
+        'kind': 'heart_rate',
+        'userId': 'ws-user',
+        'device': {},
+        'source': 'ble',
+        'ts': f'2023-09-01T10:00:{second:02d}Z',
+        'bpm': bpm,
+    }
+
+
+def test_ws_ingest_acks_cumulatively_and_dedupes(client, redis):
+    with client.websocket_connect('/v1/telemetry/ws') as ws:
+        ws.send_json({'seq': 1, 'events': [_hr(1), _hr(2)]})
+        assert ws.receive_json() == {'ack': 1, 'accepted': 2, 'duplicate': 0, 'invalid': 0, 'errors': []}
+        # Resend after a lost ack is only re-acked.
+        ws.send_json({'seq': 1, 'events': [_hr(1), _hr(2)]})
+        assert ws.receive_json()['ack'] == 1
+        ws.send_json({'seq': 2, 'events': [_hr(2), _hr(3), {'kind': 'heart_rate'}]})
+        ack = ws.receive_json()
+        assert (ack['ack'], ack['accepted'], ack['duplicate'], ack['invalid']) == (2, 1, 1, 1)
+        assert ack['errors'][0]['index'] == 2
+    assert client.get('/v1/users/ws-user/vitals').json()['heart_rate']['bpm'] == 70
+
+
+def test_ws_ingest_decodes_ble_frames(client):
+    frame = base64.b64encode(bytes([0, 64])).decode()
+    with client.websocket_connect('/v1/telemetry/ws') as ws:
+        ws.send_json({
+            'seq': 7,
+            'userId': 'ws-user',
+            'device': {'vendor': 'Polar'},
+            'frames': [{'frame': frame, 'ts': '2023-09-01T10:00:05Z'}],
+        })
+        assert ws.receive_json()['accepted'] == 1
+    vitals = client.get('/v1/users/ws-user/vitals').json()
+    assert vitals['heart_rate']['bpm'] == 64
+
+
+def test_ws_ingest_keeps_rr_intervals_and_rejects_bad_frames(client, db):
+    rr_frame = base64.b64encode(bytes([0x10, 60, 0x00, 0x04])).decode()
+    with client.websocket_connect('/v1/telemetry/ws') as ws:
+        ws.send_json({
+            'seq': 1,
+            'userId': 'rr-user',
+            'frames': [
+                {'frame': rr_frame, 'ts': '2023-09-01T10:00:00Z'},
+                {'frame': base64.b64encode(bytes([0x01, 60])).decode(), 'ts': '2023-09-01T10:00:01Z'},
+            ],
+        })
+        ack = ws.receive_json()
+    assert (ack['accepted'], ack['invalid']) == (1, 1)
+    assert ack['errors'][0]['index'] == 1
+    event = db.scalars(select(Event).where(Event.user_id == 'rr-user')).one()
+    assert event.payload['rr'] == [1000.0]
+
+
+def test_ws_ingest_closes_on_protocol_error(client):
+    with client.websocket_connect('/v1/telemetry/ws') as ws:
+        ws.send_text('{"events": []}')
+        assert 'seq' in ws.receive_json()['error']
+        assert ws.receive()['code'] == 1007
+
+
+def test_ws_ingest_closes_when_events_or_frames_are_not_arrays(client):
+    for message in ('{"seq": 1, "events": 5}', '{"seq": 1, "events": {"kind": "steps"}}', '{"seq": 1, "frames": "ab"}'):
+        with client.websocket_connect('/v1/telemetry/ws') as ws:
+            ws.send_text(message)
+            assert 'arrays' in ws.receive_json()['error']
+            assert ws.receive()['code'] == 1007
+
+
+def test_ws_ingest_closes_instead_of_acking_past_a_refused_message():
+    stub = FastAPI()
+    chunks = []
+
+    async def ingest_chunk(events):
+        chunks.append(len(events))
+        if len(chunks) == 1:
+            raise BufferFull('full')
+        return [{'status': 'accepted'} for _ in events]
+
+    @stub.websocket('/ws')
+    async def ws_route(websocket: WebSocket):
+        await serve_ingest_ws(websocket, ingest_chunk, 100)
+
+    with TestClient(stub).websocket_connect('/ws') as ws:
+        ws.send_json({'seq': 1, 'events': [_hr(1)]})
+        ws.send_json({'seq': 2, 'events': [_hr(2)]})
+        assert ws.receive_json() == {'error': 'busy', 'seq': 1, 'retry_after': 1}
+        assert ws.receive()['code'] == CLOSE_TRY_AGAIN
+    # seq 2 was never taken, let alone acked.
+    assert chunks == [1]
+    with TestClient(stub).websocket_connect('/ws') as ws:
+        ws.send_json({'seq': 1, 'events': [_hr(1)]})
+        assert ws.receive_json()['ack'] == 1
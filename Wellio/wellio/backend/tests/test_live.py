@@ -0,0 +1,44 @@
+import asyncio
+import time
+from app.main import app
+from app.users.live import LiveHub, LiveSubscriber, get_live_hub
+
+
+def _hr(ts, bpm):
+    return {'kind': 'heart_rate', 'userId': 'live-user', 'device': {}, 'source': 'ble', 'ts': ts, 'bpm': bpm}
+
+
+def test_subscriber_coalesces_latest_per_kind():
+    async def run():
+        subscriber = LiveSubscriber('u')
+        subscriber.offer([_hr('2023-09-01T10:00:01Z', 70)])
+        subscriber.offer([_hr('2023-09-01T10:00:03Z', 72)])
+        subscriber.offer([_hr('2023-09-01T10:00:02Z', 99)])
+        first = await subscriber.next_update()
+        # A fractional second is newer than the whole one, whatever the text sorts as.
+        subscriber.offer([_hr('2023-09-01T10:00:04.500000Z', 74)])
+        subscriber.offer([_hr('2023-09-01T10:00:04Z', 99)])
+        return first, await subscriber.next_update()
+
+    assert asyncio.run(run()) == ([_hr('2023-09-01T10:00:03Z', 72)], [_hr('2023-09-01T10:00:04.500000Z', 74)])
+
+
+def test_live_websocket_receives_ingested_events(client, redis, async_redis):
+    async def hub():
+        return LiveHub(async_redis)
+
+    app.dependency_overrides[get_live_hub] = hub
+    try:
+        with client.websocket_connect('/v1/users/live-user/live') as websocket:
+            # Wait until the hub's channel subscription is visible to publishers.
+            for _ in range(100):
+                if redis.pubsub_numsub('telemetry:live:live-user')[0][1]:
+                    break
+                time.sleep(0.01)
+            client.post('/v1/telemetry:batch', json=[
+                _hr('2023-09-01T10:00:01Z', 70),
+                _hr('2023-09-01T10:00:02Z', 71),
+            ])
+            assert websocket.receive_json() == {'events': [_hr('2023-09-01T10:00:02Z', 71)]}
+    finally:
+        del app.dependency_overrides[get_live_hub]
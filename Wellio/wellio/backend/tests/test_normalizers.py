@@ -1,7 +1,13 @@
-from app.normalizer.hk_hc import normalize_health
-from app.normalizer.ble_hr import parse_hr_measurement, normalize_ble_notification
-from app.normalizer.fitbit import normalize_fitbit
+import base64
+import struct
+
+import numpy as np
+import pytest
+
+from app.normalizer.ble_hr import decode_hr_frames, decode_hr_measurement, normalize_ble_frames, parse_hr_measurement, normalize_ble_notification
+from app.normalizer.fitbit import _heart_rate_scalar, fitbit_heart_rate_batches, heart_rate_timestamps, normalize_fitbit
 from app.normalizer.garmin import normalize_garmin
+from app.normalizer.hk_hc import normalize_health
 from app.normalizer.oura import normalize_oura
 from app.normalizer.withings import normalize_withings
 
@@ -15,7 +21,6 @@ def test_normalize_health_heart_rate():
 
 def test_parse_ble_frame():
     # Flags = 0 (uint8), hr=60
-    import base64
     frame = base64.b64encode(bytes([0, 60])).decode()
     assert parse_hr_measurement(frame) == 60
 
@@ -27,6 +32,47 @@ def test_normalize_ble_notification():
     assert events[0]['source'] == 'ble'
 
 
+def test_decode_hr_measurement_reads_every_field():
+    # uint16 bpm, contact supported and detected, energy, two RR intervals.
+    frame = struct.pack('<BHHHH', 0x1F, 300, 12, 1024, 512)
+    assert decode_hr_measurement(frame) == {'bpm': 300, 'energy_kj': 12, 'rr': [1000.0, 500.0], 'sensor_contact': True}
+    # Contact supported but lost; a trailing odd byte is not an interval.
+    assert decode_hr_measurement(bytes([0x14, 61, 0, 4, 7])) == {'bpm': 61, 'rr': [1000.0], 'sensor_contact': False}
+    with pytest.raises(ValueError):
+        decode_hr_measurement(bytes([0x09, 60, 1]))
+
+
+def test_decode_hr_frames_matches_single_frame_decoder():
+    rng = np.random.default_rng(7)
+    frames = [b'', bytes([0x01, 70]), bytes([0x08, 70, 1])]
+    for _ in range(500):
+        flags = int(rng.integers(0, 32))
+        frames.append(bytes([flags]) + rng.integers(0, 256, size=int(rng.integers(1, 12))).astype(np.uint8).tobytes())
+    expected = []
+    for frame in frames:
+        try:
+            expected.append(decode_hr_measurement(frame))
+        except ValueError:
+            expected.append(None)
+    assert decode_hr_frames(frames).fields() == expected
+
+
+def test_normalize_ble_frames_carries_rr_and_contact():
+    frame = base64.b64encode(struct.pack('<BBHH', 0x16, 58, 1100, 1050)).decode()
+    payloads = [
+        {'frame': frame, 'userId': 'user', 'ts': '2023-09-01T10:00:00Z', 'meta': {'confidence': 0.9}},
+        {'frame': 'not base64!', 'userId': 'user'},
+        {'bpm': 61, 'userId': 'user', 'ts': '2023-09-01T10:00:01Z'},
+    ]
+    events = normalize_ble_frames(payloads)
+    assert events[0]['bpm'] == 58
+    assert events[0]['rr'] == [1100 * 1000 / 1024, 1050 * 1000 / 1024]
+    assert events[0]['meta'] == {'confidence': 0.9, 'sensor_contact': True}
+    assert events[1]['bpm'] is None
+    assert events[2]['bpm'] == 61
+    assert [event for payload in payloads for event in normalize_ble_notification(payload)][::2] == events[::2]
+
+
 def test_fitbit_normalizer():
     payload = {
         'user_id': 'fitbit-user',
@@ -74,3 +120,30 @@ def test_withings_normalizer():
     events = list(normalize_withings(payload))
     assert len(events) == 2
     assert any(event['kind'] == 'steps' for event in events)
+
+
+def test_fitbit_intraday_matches_per_sample_conversion():
+    dataset = [{'time': f'{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}', 'value': 60 + second % 7} for second in range(0, 86400, 37)]
+    assert heart_rate_timestamps('2023-09-01', dataset) == _heart_rate_scalar('2023-09-01', dataset)
+    # Times outside the fast path's exact 'HH:MM:SS' shape keep the old behaviour.
+    odd = [{'time': '00:00'}, {'time': '12:30:15.250000'}, {'time': '23:59:59'}]
+    assert heart_rate_timestamps('2023-09-01', odd) == _heart_rate_scalar('2023-09-01', odd)
+
+    payload = {'user_id': 'u', 'dateTime': '2023-09-01', 'heart_rate': {'dataset': dataset}}
+    batches = list(fitbit_heart_rate_batches(payload, chunk_samples=1000))
+    assert [len(batch['columns']['ts']) for batch in batches] == [1000, 1000, 336]
+    events = list(normalize_fitbit(payload))
+    assert events[1] == {
+        'kind': 'heart_rate',
+        'userId': 'u',
+        'source': 'vendor_fitbit',
+        'ts': '2023-09-01T00:00:37+00:00',
+        'bpm': 62,
+        'device': {},
+    }
+
+
+def test_fitbit_intraday_rejects_invalid_times():
+    payload = {'dateTime': '2023-09-01', 'heart_rate': {'dataset': [{'time': '24:00:00', 'value': 60}]}}
+    with pytest.raises(ValueError):
+        list(normalize_fitbit(payload))
@@ -0,0 +1,64 @@
+from datetime import date
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex, CreateTable
+from app.config import get_settings
+from app.jobs.partitions import (
+    expired_partitions,
+    maintain_partitions,
+    partition_ddl,
+    partition_name,
+    partitioned_events_table,
+)
+from app.jobs.scheduler import schedule_jobs, scheduler
+
+
+def test_partitioned_table_keeps_dedupe_constraint():
+    table = partitioned_events_table()
+    ddl = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+    assert 'PARTITION BY RANGE (ts)' in ddl
+    assert 'PRIMARY KEY (id, ts)' in ddl
+    assert 'CONSTRAINT uq_event_dedupe UNIQUE (user_id, kind, ts, source)' in ddl
+    indexes = {str(CreateIndex(index).compile(dialect=postgresql.dialect())) for index in table.indexes}
+    assert 'CREATE INDEX idx_events_user_ts ON events (user_id, ts)' in indexes
+
+
+def test_daily_partitions_cover_today_and_ahead():
+    statements = partition_ddl(date(2024, 2, 28), 'day', 2)
+    assert [name for name, _ in statements] == ['events_p20240228', 'events_p20240229', 'events_p20240301']
+    create, move, attach = statements[1][1]
+    assert create == 'CREATE TABLE events_p20240229 (LIKE events INCLUDING DEFAULTS)'
+    # Rows that went to the default partition move over before the attach.
+    assert "DELETE FROM events_default WHERE ts >= '2024-02-29T00:00:00+00:00' AND ts < '2024-03-01T00:00:00+00:00'" in move
+    assert attach == (
+        'ALTER TABLE events ATTACH PARTITION events_p20240229 '
+        "FOR VALUES FROM ('2024-02-29T00:00:00+00:00') TO ('2024-03-01T00:00:00+00:00')"
+    )
+
+
+def test_monthly_partitions_roll_over_year():
+    statements = partition_ddl(date(2024, 12, 31), 'month', 1)
+    assert [name for name, _ in statements] == ['events_p202412', 'events_p202501']
+    assert "FROM ('2024-12-01T00:00:00+00:00') TO ('2025-01-01T00:00:00+00:00')" in statements[0][1][-1]
+
+
+def test_expired_partitions_only_whole_ranges():
+    names = [
+        partition_name(date(2024, 1, 1), 'month'),
+        partition_name(date(2024, 2, 1), 'month'),
+        'events_default',
+    ]
+    assert expired_partitions(names, 'month', date(2024, 2, 15)) == ['events_p202401']
+    assert expired_partitions(names, 'month', date(2024, 3, 1)) == ['events_p202401', 'events_p202402']
+
+
+def test_maintenance_is_noop_off_postgres(session_factory, monkeypatch):
+    monkeypatch.setattr(get_settings(), 'events_partitioning', 'day')
+    assert maintain_partitions(session_factory.kw['bind']) == {'created': [], 'expired': []}
+
+
+def test_schedule_jobs_follows_settings():
+    try:
+        assert schedule_jobs(partitions=True, hrv_nightly=False) == ['events-partitions']
+    finally:
+        scheduler.remove_all_jobs()
+    assert scheduler.get_jobs() == []
@@ -0,0 +1,76 @@
+import asyncio
+from datetime import date
+
+import httpx
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, select
+
+from app.auth.tokens import store_tokens
+from app.jobs.polling import FitbitPoller, cursor_key, poll_vendor
+from app.models import Event
+from app.webhooks import queue
+from app.webhooks.queue import WEBHOOK_ATTEMPTS, WEBHOOK_STREAM, WebhookWorker
+
+TODAY = date(2023, 9, 2)
+SAMPLES = {
+    ('token-a', '2023-09-01'): [{'time': f'10:00:0{second}', 'value': 60 + second} for second in range(3)],
+    ('token-a', '2023-09-02'): [{'time': '08:00:00', 'value': 70}],
+}
+
+
+def _stub_fitbit(calls):
+    stub = FastAPI()
+
+    @stub.get('/1/user/-/activities/heart/date/{day}/1d/1sec/time/{start}/{end}.json')
+    def intraday(day: str, start: str, end: str, authorization: str = Header()):
+        token = authorization.split(' ', 1)[1]
+        calls.append((token, day, start))
+        if token == 'token-throttled':
+            return JSONResponse(status_code=429, content={'errors': [{'errorType': 'request'}]})
+        dataset = [sample for sample in SAMPLES.get((token, day), []) if sample['time'][:5] >= start]
+        return {'activities-heart-intraday': {'dataset': dataset}}
+
+    return stub
+
+
+def _cycles(async_redis, poller, count):
+    # [(stats, requests the stub saw)] per cycle, all on one event loop.
+    async def run():
+        results = []
+        for _ in range(count):
+            calls = []
+            transport = httpx.ASGITransport(app=_stub_fitbit(calls))
+            async with httpx.AsyncClient(transport=transport) as client:
+                results.append((await poll_vendor(client, async_redis, poller, TODAY), sorted(calls)))
+        return results
+
+    return asyncio.run(run())
+
+
+def test_poller_fetches_incrementally_within_quota(redis, async_redis, session_factory, db):
+    store_tokens(redis, 'poll-a', 'fitbit', {'access_token': 'token-a'})
+    store_tokens(redis, 'poll-b', 'fitbit', {'access_token': 'token-throttled'})
+    poller = FitbitPoller('http://fitbit.test', concurrency=4, user_requests_per_hour=3)
+    try:
+        (stats, first), (_, second), (_, third) = _cycles(async_redis, poller, 3)
+        assert stats == {'polled': 2}
+        # New accounts start at yesterday; the throttled one keeps no cursor.
+        assert first == [
+            ('token-a', '2023-09-01', '00:00'),
+            ('token-a', '2023-09-02', '00:00'),
+            ('token-throttled', '2023-09-01', '00:00'),
+        ]
+        assert redis.hgetall(cursor_key('fitbit')) == {b'poll-a': b'2023-09-02T08:00:00'}
+        # The next cycle asks only for what is new; the one after that is
+        # over poll-a's three requests an hour and sends nothing for it.
+        assert [call for call in second if call[0] == 'token-a'] == [('token-a', '2023-09-02', '08:00')]
+        assert [call for call in third if call[0] == 'token-a'] == []
+
+        # Polled payloads are ingested by the webhook workers.
+        queue.ensure_group(redis)
+        WebhookWorker(redis, session_factory, 'poll-test', 10, 0, 60_000, 3, 100).run_once(block=False)
+        count = db.scalar(select(func.count()).select_from(Event).where(Event.user_id == 'poll-a'))
+        assert count == 4
+    finally:
+        redis.delete(WEBHOOK_STREAM, WEBHOOK_ATTEMPTS, cursor_key('fitbit'), 'links:fitbit')
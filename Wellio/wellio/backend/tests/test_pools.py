@@ -0,0 +1,35 @@
+import fakeredis
+import pytest
+from redis import Redis
+from redis.exceptions import ConnectionError
+
+from app.metrics import metrics
+from app.pools import InstrumentedConnectionPool, pool_stats
+
+
+def _pool(**options):
+    return InstrumentedConnectionPool(connection_class=fakeredis.FakeConnection, server=fakeredis.FakeServer(), **options)
+
+
+def _counter(name):
+    return metrics.snapshot()['counters'].get(name, 0)
+
+
+def test_shared_pool_reuses_connections():
+    pool = _pool(max_connections=4, timeout=1)
+    client = Redis(connection_pool=pool)
+    for i in range(10):
+        client.set(f'key:{i}', 1, nx=True)
+    assert pool_stats(pool) == {'max': 4, 'created': 1, 'idle': 1, 'in_use': 0}
+    assert metrics.snapshot()['timings']['redis_pool.checkout_seconds']['count'] >= 10
+
+
+def test_exhausted_pool_counts_errors():
+    pool = _pool(max_connections=1, timeout=0.01)
+    held = pool.get_connection('SET')
+    assert pool_stats(pool)['in_use'] == 1
+    errors = _counter('redis_pool.errors')
+    with pytest.raises(ConnectionError):
+        Redis(connection_pool=pool).get('key')
+    assert _counter('redis_pool.errors') == errors + 1
+    pool.release(held)
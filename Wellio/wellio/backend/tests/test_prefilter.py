@@ -0,0 +1,81 @@
+import hashlib
+
+import pytest
+
+from app.ingest import prefilter
+from app.ingest.prefilter import MAYBE, NEW, SEEN, BloomFilter, SeenFilter
+
+
+def _key(i):
+    return hashlib.sha256(str(i).encode()).hexdigest()
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bloom_has_no_false_negatives_and_bounded_fp_rate():
+    bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+    for i in range(10_000):
+        bloom.add(_key(i))
+    assert all(_key(i) in bloom for i in range(10_000))
+    false_positives = sum(_key(i) in bloom for i in range(10_000, 30_000))
+    assert false_positives / 20_000 < 0.02
+    assert bloom.estimated_fp_rate() == pytest.approx(0.01, rel=0.2)
+
+
+def test_plan_answers_locally_and_defers_publication():
+    seen = SeenFilter(capacity=1000, error_rate=0.01, lru_size=2, deferred_max=3, clock=Clock())
+    plan = seen.plan([_key(1), _key(2), _key(1)])
+    assert plan.fresh == [True, True, False]
+    assert plan.redis_keys == []
+    # Third NEW key fills the deferred list: all three are published to Redis.
+    plan = seen.plan([_key(3)])
+    assert plan.redis_keys == [_key(1), _key(2), _key(3)]
+    assert plan.resolve([True, True, True]) == [True]
+    # The LRU holds two keys; key 2 was evicted but is still in the Bloom filter.
+    assert seen.check(_key(3)) == SEEN
+    assert seen.check(_key(2)) == MAYBE
+    plan = seen.plan([_key(2)])
+    assert plan.redis_keys == [_key(2)]
+    assert plan.resolve([False]) == [False]
+    stats = seen.stats()
+    assert stats['false_positives'] == 0
+    assert stats['maybe_resolved'] == 1
+
+
+def test_generations_rotate_with_ttl_window():
+    clock = Clock()
+    seen = SeenFilter(capacity=1000, error_rate=0.01, lru_size=0, deferred_max=100, window_seconds=10, clock=clock)
+    seen.plan([_key(1)])
+    clock.now = 15
+    assert seen.check(_key(1)) == MAYBE
+    clock.now = 25
+    assert seen.check(_key(1)) == NEW
+    assert seen.stats()['rotations'] == 2
+
+
+@pytest.fixture
+def seen_filter():
+    seen = SeenFilter(capacity=1000, error_rate=0.01, lru_size=100, deferred_max=100)
+    prefilter.configure_seen_filter(seen)
+    yield seen
+    prefilter.configure_seen_filter(None)
+
+
+def test_ingest_skips_redis_for_local_answers(client, redis, seen_filter):
+    event = {
+        'kind': 'heart_rate',
+        'userId': 'user',
+        'source': 'ble',
+        'ts': '2023-09-01T00:00:00Z',
+        'bpm': 70,
+        'device': {},
+    }
+    assert client.post('/v1/telemetry', json=event).json()['status'] == 'accepted'
+    assert client.post('/v1/telemetry', json=event).json()['status'] == 'duplicate'
+    assert redis.keys('telemetry_dedupe:*') == []
+    assert seen_filter.stats()['answered_locally'] == 1.0
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from app.ingest import ratelimit
+from app.ingest.ratelimit import ConcurrencyGate, RateLimited, RateLimiter
+from app.ingest.ws import CLOSE_TRY_AGAIN
+from app.metrics import metrics
+from app.models import Event
+
+
+def _hr(user, minute, source='ble'):
+    return {
+        'kind': 'heart_rate',
+        'userId': user,
+        'source': source,
+        'ts': f'2023-11-02T08:{minute:02d}:00Z',
+        'bpm': 60 + minute,
+        'device': {},
+    }
+
+
+def _count(db, user):
+    return db.scalar(select(func.count()).select_from(Event).where(Event.user_id == user))
+
+
+@pytest.fixture
+def limiter(redis):
+    # Refill is slow enough not to matter within a test.
+    limiter = RateLimiter(user_rate=0.5, user_burst=3, source_rate=0.5, source_burst=5)
+    ratelimit.configure_rate_limits(limiter)
+    yield limiter
+    ratelimit.configure_rate_limits(None)
+    for key in redis.scan_iter(f'{ratelimit.RATE_LIMIT_PREFIX}*'):
+        redis.delete(key)
+
+
+def test_user_bucket_rejects_before_any_write(client, db, redis, limiter):
+    assert client.post('/v1/telemetry:batch', json=[_hr('rl-a', 0), _hr('rl-a', 1)]).json()['accepted'] == 2
+    resp = client.post('/v1/telemetry:batch', json=[_hr('rl-a', 2), _hr('rl-a', 3)])
+    assert resp.status_code == 429
+    assert resp.json()['scope'] == 'user'
+    assert resp.headers['Retry-After'] == '2'
+    assert _count(db, 'rl-a') == 2
+    # Neither bucket was debited by the rejected request.
+    assert float(redis.hget('ratelimit:user:rl-a', 'tokens')) == pytest.approx(1, abs=0.1)
+    assert float(redis.hget('ratelimit:source:ble', 'tokens')) == pytest.approx(3, abs=0.1)
+    # And nothing was marked seen: a single event still fits and is accepted.
+    assert client.post('/v1/telemetry', json=_hr('rl-a', 2)).json()['status'] == 'accepted'
+    counters = metrics.snapshot()['counters']
+    assert counters['ratelimit.limited.user'] >= 1
+    assert counters['ratelimit.allowed_events'] >= 3
+
+
+def test_source_bucket_is_shared_across_users(client, limiter):
+    client.post('/v1/telemetry:batch', json=[_hr('rl-b', 0, 'vendor_oura'), _hr('rl-c', 0, 'vendor_oura'), _hr('rl-d', 0, 'vendor_oura')])
+    resp = client.post('/v1/telemetry:batch', json=[_hr('rl-e', 0, 'vendor_oura'), _hr('rl-f', 0, 'vendor_oura'), _hr('rl-g', 0, 'vendor_oura')])
+    assert resp.status_code == 429
+    assert resp.json()['scope'] == 'source'
+
+
+def test_batch_larger_than_burst_goes_into_debt(redis, limiter):
+    events = [_hr('rl-h', minute, 'vendor_garmin') for minute in range(5)]
+    limiter.take(redis, events)
+    assert float(redis.hget('ratelimit:user:rl-h', 'tokens')) == pytest.approx(-2, abs=0.1)
+    with pytest.raises(RateLimited) as exc:
+        limiter.take(redis, events[:1])
+    assert exc.value.retry_after == pytest.approx(6, abs=0.1)
+
+
+def test_async_limiter_shares_buckets(redis, async_redis, limiter):
+    limiter.take(redis, [_hr('rl-i', 0), _hr('rl-i', 1), _hr('rl-i', 2)])
+    with pytest.raises(RateLimited):
+        asyncio.run(limiter.take_async(async_redis, [_hr('rl-i', 3)]))
+
+
+def test_gate_sheds_with_503(client, redis, limiter):
+    gate = ConcurrencyGate(1)
+    ratelimit.configure_ingest_gate(gate)
+    try:
+        with gate.enter():
+            resp = client.post('/v1/telemetry', json=_hr('rl-j', 0))
+        assert resp.status_code == 503
+        assert resp.headers['Retry-After'] == '1'
+        # Shed requests spend no tokens.
+        assert not redis.exists('ratelimit:user:rl-j')
+        assert client.post('/v1/telemetry', json=_hr('rl-j', 0)).status_code == 202
+        assert gate.in_flight == 0
+    finally:
+        ratelimit.configure_ingest_gate(None)
+    assert metrics.snapshot()['counters']['ingest_gate.rejected'] >= 1
+
+
+def test_ws_rate_limited_message_is_not_acked(client, limiter):
+    with client.websocket_connect('/v1/telemetry/ws') as ws:
+        ws.send_json({'seq': 1, 'events': [_hr('rl-k', minute) for minute in range(3)]})
+        assert ws.receive_json()['ack'] == 1
+        ws.send_json({'seq': 2, 'events': [_hr('rl-k', 3)]})
+        assert ws.receive_json() == {'error': 'rate_limited', 'seq': 2, 'retry_after': pytest.approx(2, abs=0.1)}
+        assert ws.receive()['code'] == CLOSE_TRY_AGAIN
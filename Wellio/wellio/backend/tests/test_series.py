@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from sqlalchemy.dialects import postgresql
+from app.users.series import bucket_width, lttb, series_stmt
+
+
+def _hr(ts, bpm):
+    return {
+        'kind': 'heart_rate',
+        'userId': 'series-user',
+        'device': {},
+        'source': 'ble',
+        'ts': ts,
+        'bpm': bpm,
+    }
+
+
+def test_bucket_width_picks_nice_resolution():
+    start = datetime(2023, 9, 1, tzinfo=timezone.utc)
+    assert bucket_width(start, start + timedelta(days=30), 500) == 2 * 3600
+    assert bucket_width(start, start + timedelta(hours=1), 500) == 10
+    assert bucket_width(start, start + timedelta(seconds=100), 500) == 1
+
+
+def test_lttb_keeps_end_points_and_peaks():
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[500] = 100.0
+    selected = lttb(x, y, 20)
+    assert len(selected) == 20
+    assert selected[0] == 0 and selected[-1] == 999
+    assert 500 in selected
+    assert list(selected) == sorted(selected)
+    assert list(lttb(x[:10], y[:10], 20)) == list(range(10))
+
+
+def test_postgres_buckets_with_date_bin():
+    start = datetime(2023, 9, 1, tzinfo=timezone.utc)
+    stmt = series_stmt('postgresql', 'u', 'heart_rate', start, start + timedelta(days=1), 300)
+    assert 'date_bin' in str(stmt.compile(dialect=postgresql.dialect()))
+
+
+def test_series_endpoint_aggregates_buckets(client):
+    events = [_hr(f'2023-09-01T08:00:{second:02d}Z', 60 + second) for second in range(0, 60, 10)]
+    events.append(_hr('2023-09-01T08:05:00Z', 120))
+    client.post('/v1/telemetry:batch', json=events)
+    params = {'kind': 'heart_rate', 'from': '2023-09-01T08:00:00Z', 'to': '2023-09-01T09:00:00Z', 'points': 12}
+    body = client.get('/v1/users/series-user/series', params=params).json()
+    assert body['bucket_s'] == 300
+    assert body['points'] == [
+        {'ts': '2023-09-01T08:00:00+00:00', 'count': 6, 'avg': 85.0, 'min': 60, 'max': 110, 'sum': 510},
+        {'ts': '2023-09-01T08:05:00+00:00', 'count': 1, 'avg': 120.0, 'min': 120, 'max': 120, 'sum': 120},
+    ]
+
+
+def test_series_lttb_limits_points(client):
+    events = [_hr(f'2023-09-01T08:{minute:02d}:00Z', 60 + minute % 7) for minute in range(60)]
+    client.post('/v1/telemetry:batch', json=events)
+    params = {'kind': 'heart_rate', 'from': '2023-09-01T08:00:00Z', 'to': '2023-09-01T09:00:00Z', 'points': 10, 'lttb': 'true'}
+    body = client.get('/v1/users/series-user/series', params=params).json()
+    assert len(body['points']) == 10
+    assert body['points'][0]['ts'] == '2023-09-01T08:00:00+00:00'
+
+
+def test_series_rejects_empty_range(client):
+    params = {'kind': 'steps', 'from': '2023-09-02', 'to': '2023-09-01'}
+    assert client.get('/v1/users/u/series', params=params).status_code == 400
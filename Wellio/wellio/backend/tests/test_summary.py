@@ -0,0 +1,71 @@
+import json
+import app.main as main
+
+
+def _steps(user_id, minute):
+    return {
+        'kind': 'steps',
+        'userId': user_id,
+        'device': {},
+        'source': 'healthkit',
+        'ts': f'2023-09-01T10:{minute:02d}:00Z',
+        'steps': minute,
+    }
+
+
+def _pages(client, **params):
+    params = {'from_': '2023-09-01', 'to': '2023-09-02', **params}
+    while True:
+        page = client.get('/v1/events', params=params).json()
+        yield page
+        if page['next_after'] is None:
+            return
+        params['after'] = page['next_after']
+
+
+def test_events_keyset_pages_cover_every_event_once(client):
+    events = [_steps('alice', minute) for minute in range(7)] + [_steps('bob', minute) for minute in range(3)]
+    client.post('/v1/telemetry:batch', json=events)
+
+    pages = list(_pages(client, limit=3))
+    assert [len(page['events']) for page in pages] == [3, 3, 3, 1]
+    seen = [(event['userId'], event['ts']) for page in pages for event in page['events']]
+    assert len(set(seen)) == len(events)
+    assert seen == sorted(seen, key=lambda item: item[1])
+
+
+def test_events_and_summary_filter_by_user(client):
+    client.post('/v1/telemetry:batch', json=[_steps('alice', 1), _steps('bob', 2)])
+    pages = list(_pages(client, user_id='bob'))
+    assert [event['userId'] for event in pages[0]['events']] == ['bob']
+    # /v1/summary keeps its grouped shape.
+    days = client.get('/v1/summary', params={'from_': '2023-09-01', 'to': '2023-09-02', 'user_id': 'bob'}).json()
+    assert days == [{'kind': 'steps', 'day': '2023-09-01T00:00:00+00:00', 'events': [_steps('bob', 2)]}]
+
+
+def test_events_rejects_bad_cursor(client):
+    resp = client.get('/v1/events', params={'from_': '2023-09-01', 'to': '2023-09-02', 'after': 'nope'})
+    assert resp.status_code == 400
+
+
+def test_summary_streams_groups_by_day_and_kind(client, session_factory, monkeypatch):
+    late = {**_steps('alice', 5), 'ts': '2023-09-02T01:00:00Z'}
+    heart = {'kind': 'heart_rate', 'userId': 'alice', 'device': {}, 'source': 'healthkit', 'ts': '2023-09-01T10:03:00Z', 'bpm': 61}
+    events = [late, _steps('alice', 2), heart, _steps('alice', 1), _steps('bob', 4)]
+    client.post('/v1/telemetry:batch', json=events)
+    monkeypatch.setattr(main, 'EVENTS_YIELD_PER', 2)
+
+    chunks = list(main._summary_body(session_factory, '2023-09-01', '2023-09-03', None))
+    assert len(chunks) > 1
+    days = json.loads(''.join(chunks))
+    assert [(day['day'][:10], day['kind'], len(day['events'])) for day in days] == [
+        ('2023-09-01', 'heart_rate', 1),
+        ('2023-09-01', 'steps', 3),
+        ('2023-09-02', 'steps', 1),
+    ]
+    assert days[1]['events'] == [_steps('alice', 1), _steps('alice', 2), _steps('bob', 4)]
+    assert days == client.get('/v1/summary', params={'from_': '2023-09-01', 'to': '2023-09-03'}).json()
+
+
+def test_summary_streams_empty_range(client):
+    assert client.get('/v1/summary', params={'from_': '2023-09-01', 'to': '2023-09-02'}).json() == []
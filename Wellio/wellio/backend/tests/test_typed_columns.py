@@ -0,0 +1,61 @@
+from sqlalchemy import insert, select
+from app.ingest.rows import event_from_row, event_row
+from app.migrations.typed_columns import upgrade
+from app.models import Event
+
+HEART_RATE = {
+    'kind': 'heart_rate',
+    'userId': 'typed-user',
+    'device': {'vendor': 'Polar', 'model': 'H10', 'id': 'abc'},
+    'source': 'ble',
+    'ts': '2023-09-01T08:00:00Z',
+    'bpm': 72.5,
+    'meta': {'sampling_hz': 1},
+}
+
+
+def test_row_keeps_only_leftover_fields_in_payload():
+    row = event_row(HEART_RATE)
+    assert row['bpm'] == 72.5
+    assert row['steps'] is None
+    assert row['payload'] == {'meta': {'sampling_hz': 1}, 'device': {'id': 'abc'}}
+
+
+def test_event_round_trips_through_columns(client, db):
+    steps = {
+        'kind': 'steps',
+        'userId': 'typed-user',
+        'device': {},
+        'source': 'healthkit',
+        'ts': '2023-09-01T09:00:00Z',
+        'steps': 1200,
+        'window': 'PT1H',
+    }
+    for event in (HEART_RATE, steps):
+        assert client.post('/v1/telemetry', json=event).json()['status'] == 'accepted'
+    stored = db.execute(select(Event).order_by(Event.ts)).scalars().all()
+    assert [event_from_row(row) for row in stored] == [HEART_RATE, steps]
+    assert stored[1].steps == 1200
+
+
+def test_backfill_moves_measurements_out_of_payload(session_factory, db):
+    legacy = dict(HEART_RATE, bpm=64)
+    row = event_row(legacy)
+    db.execute(insert(Event).values(**dict(row, bpm=None, payload=legacy)))
+    db.commit()
+    engine = session_factory.kw['bind']
+    assert upgrade(engine) == 1
+    assert upgrade(engine) == 0
+    db.expire_all()
+    stored = db.execute(select(Event)).scalar_one()
+    assert stored.bpm == 64
+    assert stored.payload == {'meta': {'sampling_hz': 1}, 'device': {'id': 'abc'}}
+    assert event_from_row(stored) == legacy
+
+
+def test_summary_rebuilds_events(client):
+    assert client.post('/v1/telemetry', json=HEART_RATE).json()['status'] == 'accepted'
+    days = client.get('/v1/summary', params={'from_': '2023-09-01', 'to': '2023-09-02'}).json()
+    assert days == [{'kind': 'heart_rate', 'day': '2023-09-01T00:00:00+00:00', 'events': [HEART_RATE]}]
+    page = client.get('/v1/events', params={'from_': '2023-09-01', 'to': '2023-09-02'}).json()
+    assert page == {'events': [HEART_RATE], 'next_after': None}
@@ -0,0 +1,51 @@
+import pytest
+
+from app.ingest import validation
+from app.ingest.validation import validation_error
+
+BASE = {'userId': 'user', 'source': 'ble', 'ts': '2023-09-01T00:00:00Z', 'device': {'vendor': 'Polar'}}
+
+VALID = [
+    {**BASE, 'kind': 'heart_rate', 'bpm': 61.5, 'meta': {'confidence': 1}},
+    {**BASE, 'kind': 'steps', 'steps': 1000, 'window': 'P1D'},
+    {**BASE, 'kind': 'steps', 'steps': 10.0},
+    {**BASE, 'kind': 'sleep', 'stage': 'rem', 'dur_s': 0},
+]
+
+INVALID = [
+    None,
+    [],
+    {},
+    {**BASE, 'kind': 'heart_rate'},
+    {**BASE, 'kind': 'heart_rate', 'bpm': -1},
+    {**BASE, 'kind': 'heart_rate', 'bpm': True},
+    {**BASE, 'kind': 'heart_rate', 'bpm': '60'},
+    {**BASE, 'kind': 'heart_rate', 'bpm': 60, 'meta': {'confidence': 1.5}},
+    {**BASE, 'kind': 'heart_rate', 'bpm': 60, 'extra': 1},
+    {**BASE, 'kind': 'steps', 'steps': 1.5},
+    {**BASE, 'kind': 'sleep', 'stage': 'nap', 'dur_s': 10},
+    {**BASE, 'kind': 'sleep', 'stage': 'rem', 'dur_s': 10, 'device': {'serial': 'x'}},
+    {**BASE, 'kind': 'swim', 'laps': 3},
+    {**BASE, 'kind': ['heart_rate'], 'bpm': 60},
+    {**BASE, 'kind': 'steps', 'steps': 5, 'source': 'fax'},
+]
+
+
+def _reference(event):
+    for error in validation._validator.iter_errors(event):
+        return error.message
+    return None
+
+
+def test_every_kind_is_compiled():
+    assert set(validation._checks_by_kind) == {'heart_rate', 'steps', 'sleep'}
+
+
+@pytest.mark.parametrize('event', VALID + INVALID)
+def test_matches_reference_validator(event):
+    assert validation_error(event) == _reference(event)
+
+
+@pytest.mark.parametrize('event', VALID)
+def test_valid_events_pass_fast_path(event):
+    assert validation._checks_by_kind[event['kind']](event)
@@ -0,0 +1,50 @@
+from app.ingest.vitals import vitals_key
+
+
+def _event(kind, ts, **fields):
+    return {'kind': kind, 'userId': 'vitals-user', 'device': {}, 'source': 'healthkit', 'ts': ts, **fields}
+
+
+def _vitals(client):
+    return client.get('/v1/users/vitals-user/vitals').json()
+
+
+def test_vitals_empty(client):
+    assert _vitals(client) == {'heart_rate': None, 'steps': None, 'sleep': None}
+
+
+def test_latest_bpm_ignores_out_of_order_events(client, redis):
+    client.post('/v1/telemetry', json=_event('heart_rate', '2023-09-01T10:00:00Z', bpm=70))
+    client.post('/v1/telemetry', json=_event('heart_rate', '2023-09-01T09:00:00Z', bpm=150))
+    assert _vitals(client)['heart_rate'] == {'bpm': 70.0, 'ts': '2023-09-01T10:00:00+00:00'}
+    client.post('/v1/telemetry:batch', json=[
+        _event('heart_rate', '2023-09-01T10:00:05Z', bpm=72),
+        _event('heart_rate', '2023-09-01T10:00:01Z', bpm=99),
+    ])
+    assert _vitals(client)['heart_rate']['bpm'] == 72.0
+    assert redis.ttl(vitals_key('vitals-user')) > 0
+
+
+def test_day_steps_roll_over_and_count_once(client):
+    increment = _event('steps', '2023-09-01T08:00:00Z', steps=100, window='PT1H')
+    client.post('/v1/telemetry', json=increment)
+    client.post('/v1/telemetry', json=increment)
+    client.post('/v1/telemetry', json=_event('steps', '2023-09-01T09:00:00Z', steps=250, window='PT1H'))
+    assert _vitals(client)['steps'] == {'day': '2023-09-01', 'total': 350, 'ts': '2023-09-01T09:00:00+00:00'}
+    client.post('/v1/telemetry', json=_event('steps', '2023-09-02T00:00:00Z', steps=4000, window='P1D'))
+    client.post('/v1/telemetry', json=_event('steps', '2023-08-31T12:00:00Z', steps=9000, window='PT1H'))
+    assert _vitals(client)['steps']['total'] == 4000
+    assert _vitals(client)['steps']['day'] == '2023-09-02'
+
+
+def test_latest_night_sleep_stages(client):
+    client.post('/v1/telemetry:batch', json=[
+        _event('sleep', '2023-08-31T23:30:00Z', stage='light', dur_s=1200),
+        _event('sleep', '2023-09-01T02:00:00Z', stage='deep', dur_s=1800),
+        _event('sleep', '2023-09-01T03:00:00Z', stage='deep', dur_s=600),
+    ])
+    # An older night arriving late does not replace the newest one.
+    client.post('/v1/telemetry', json=_event('sleep', '2023-08-30T23:00:00Z', stage='rem', dur_s=999))
+    sleep = _vitals(client)['sleep']
+    assert sleep['day'] == '2023-09-01'
+    assert sleep['stages_s'] == {'light': 1200.0, 'deep': 2400.0, 'rem': 0.0, 'awake': 0.0}
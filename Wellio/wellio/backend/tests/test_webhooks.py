@@ -0,0 +1,150 @@
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+from app.metrics import metrics
+from app.models import Event
+from app.normalizer.batch import EventBatch, iter_events
+from app.webhooks import queue
+from app.webhooks.payloads import LazyArray, lazy_document
+from app.webhooks.queue import WEBHOOK_ATTEMPTS, WEBHOOK_DEAD_LETTERS, WEBHOOK_GROUP, WEBHOOK_STREAM, WebhookWorker
+from app.webhooks.signatures import sign
+
+GARMIN = {
+    'userId': 'webhook-user',
+    'heartRateSamples': [{'endTimestampGMT': 1_600_000_000, 'heartRate': 90}],
+    'stepsSummary': {'calendarDate': '2023-09-01', 'steps': 4000},
+    'device': {'vendor': 'Garmin'},
+}
+
+
+def _post(client, vendor, payload, signature=None):
+    body = json.dumps(payload).encode()
+    header = {'fitbit': 'X-Fitbit-Signature'}.get(vendor, f'X-{vendor.title()}-Signature')
+    return client.post(
+        f'/webhooks/{vendor}',
+        content=body,
+        headers={header: signature if signature is not None else sign(vendor, body)},
+    )
+
+
+def _count(db, user):
+    return db.scalar(select(func.count()).select_from(Event).where(Event.user_id == user))
+
+
+@pytest.fixture
+def worker(redis, session_factory):
+    queue.ensure_group(redis)
+    yield WebhookWorker(redis, session_factory, 'test-consumer', batch=10, block_ms=0, claim_idle_ms=0, max_deliveries=2, chunk_events=2)
+    redis.delete(WEBHOOK_STREAM, WEBHOOK_DEAD_LETTERS, WEBHOOK_ATTEMPTS)
+
+
+def test_signature_is_required(client, redis, worker):
+    assert _post(client, 'garmin', GARMIN, signature='').status_code == 401
+    assert _post(client, 'garmin', GARMIN, signature='00' * 32).status_code == 401
+    assert client.post('/webhooks/polar', json={}).status_code == 404
+    assert redis.xlen(WEBHOOK_STREAM) == 0
+
+
+def test_webhook_is_queued_then_ingested_by_worker(client, db, redis, worker):
+    resp = _post(client, 'garmin', GARMIN)
+    assert resp.status_code == 202
+    assert redis.xlen(WEBHOOK_STREAM) == 1
+    assert _count(db, 'webhook-user') == 0
+
+    assert worker.run_once(block=False) == 1
+    assert _count(db, 'webhook-user') == 2
+    assert redis.xpending(WEBHOOK_STREAM, WEBHOOK_GROUP)['pending'] == 0
+    assert redis.hlen(WEBHOOK_ATTEMPTS) == 0
+
+
+def test_fitbit_signature(client, worker):
+    payload = {'user_id': 'fitbit-hook', 'dateTime': '2023-09-01', 'heart_rate': {'dataset': [{'time': '00:00:00', 'value': 80}]}}
+    assert _post(client, 'fitbit', payload).status_code == 202
+
+
+def test_failed_ingest_is_retried_then_dead_lettered(client, db, redis, worker, monkeypatch):
+    payload = {**GARMIN, 'userId': 'webhook-retry'}
+    _post(client, 'garmin', payload)
+
+    def failing_ingest(db, redis, events):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(queue, 'ingest_events', failing_ingest)
+    assert worker.run_once(block=False) == 0
+    assert redis.xpending(WEBHOOK_STREAM, WEBHOOK_GROUP)['pending'] == 1
+    # The idle message is reclaimed; the second delivery succeeds.
+    monkeypatch.undo()
+    assert worker.run_once(block=False) == 1
+    assert _count(db, 'webhook-retry') == 2
+
+    _post(client, 'garmin', {**GARMIN, 'userId': 'webhook-dead'})
+    monkeypatch.setattr(queue, 'ingest_events', failing_ingest)
+    worker.run_once(block=False)
+    worker.run_once(block=False)
+    worker.run_once(block=False)
+    assert redis.xpending(WEBHOOK_STREAM, WEBHOOK_GROUP)['pending'] == 0
+    [(_, fields)] = redis.xrange(WEBHOOK_DEAD_LETTERS)
+    assert fields[b'attempts'] == b'3'
+    assert fields[b'error'] == b'max deliveries exceeded'
+
+
+def test_failing_message_does_not_hold_back_the_rest_of_the_read(client, db, redis, worker, monkeypatch):
+    ingest_events = queue.ingest_events
+
+    def poisoned_ingest(db, redis, events):
+        if any(isinstance(event, EventBatch) and event.header['userId'] == 'webhook-poison' for event in events):
+            raise RuntimeError('insert failed')
+        return ingest_events(db, redis, events)
+
+    monkeypatch.setattr(queue, 'ingest_events', poisoned_ingest)
+    _post(client, 'garmin', {**GARMIN, 'userId': 'webhook-poison'})
+    _post(client, 'garmin', {**GARMIN, 'userId': 'webhook-healthy'})
+    assert worker.run_once(block=False) == 1
+    assert _count(db, 'webhook-healthy') == 2
+    assert redis.xpending(WEBHOOK_STREAM, WEBHOOK_GROUP)['pending'] == 1
+    worker.run_once(block=False)
+    worker.run_once(block=False)
+    [(_, fields)] = redis.xrange(WEBHOOK_DEAD_LETTERS)
+    assert json.loads(fields[b'body'])['userId'] == 'webhook-poison'
+
+
+def test_malformed_payload_is_dead_lettered_at_once(client, redis, worker):
+    body = b'{"userId": "x", "heartRateSamples": [{"heartRate": 90}]}'
+    client.post('/webhooks/garmin', content=body, headers={'X-Garmin-Signature': sign('garmin', body)})
+    assert worker.run_once(block=False) == 0
+    [(_, fields)] = redis.xrange(WEBHOOK_DEAD_LETTERS)
+    assert fields[b'body'] == body
+    assert fields[b'error'].startswith(b'normalize:')
+    assert metrics.snapshot()['counters']['webhooks.dead_lettered'] >= 1
+
+
+def test_lazy_document_feeds_normalizers_the_same_events():
+    payloads = {
+        'fitbit': {
+            'user_id': 'lazy-fitbit',
+            'dateTime': '2023-09-01',
+            'heart_rate': {'dataset': [{'time': f'00:00:{second:02d}', 'value': 60.5 + second} for second in range(30)]},
+            'steps': {'dateTime': '2023-09-01', 'value': 5000},
+            'sleep': [{'startTime': '2023-08-31T22:00:00Z', 'duration': 3600000, 'levels': {'summary': {'stages': 'deep'}}}],
+        },
+        'garmin': {**GARMIN, 'sleepLevels': [{'startGMT': '2023-09-01T00:00:00Z', 'durationInSeconds': 300}]},
+        'oura': {'user': 'lazy-oura', 'sleep': {'stages': [{'start': '2023-09-01T00:00:00Z', 'stage': 'rem', 'duration': 900}]}},
+    }
+    for vendor, payload in payloads.items():
+        body = json.dumps(payload).encode()
+        fields = {b'vendor': vendor.encode(), b'body': body}
+        lazy = list(iter_events(queue.normalize_message(fields, lazy_min_bytes=0)))
+        assert lazy == list(iter_events(queue.normalize_message(fields, lazy_min_bytes=len(body) + 1)))
+    document = lazy_document(json.dumps(payloads['fitbit']).encode())
+    assert isinstance(document['heart_rate']['dataset'], LazyArray)
+    assert document['steps'] == {'dateTime': '2023-09-01', 'value': 5000}
+
+
+def test_worker_ingests_large_bodies_in_chunks(client, db, redis, worker, monkeypatch):
+    monkeypatch.setattr(queue._settings, 'webhook_lazy_parse_min_bytes', 0)
+    samples = [{'endTimestampGMT': 1_600_000_000 + second, 'heartRate': 60 + second % 40} for second in range(25)]
+    _post(client, 'garmin', {'userId': 'webhook-lazy', 'heartRateSamples': samples})
+    assert worker.run_once(block=False) == 1
+    assert _count(db, 'webhook-lazy') == 25
@@ -0,0 +1,90 @@
+import gzip
+import json
+import cbor2
+import msgpack
+import pytest
+import zstandard
+from app.ingest.codecs import BodyError, decode_body
+
+COLUMNAR = {
+    'userId': 'wire-user',
+    'source': 'ble',
+    'device': {'vendor': 'Polar'},
+    'kind': 'heart_rate',
+    'columns': {
+        'ts': [1693562400, '2023-09-01T10:00:01Z'],
+        'bpm': [70, 71],
+    },
+}
+
+
+def _post(client, body, content_type, encoding=None):
+    headers = {'Content-Type': content_type}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return client.post('/v1/telemetry:batch', content=body, headers=headers)
+
+
+@pytest.mark.parametrize('content_type, encode', [
+    ('application/msgpack', msgpack.packb),
+    ('application/cbor', cbor2.dumps),
+    ('application/json', lambda doc: json.dumps(doc).encode()),
+])
+def test_columnar_batch_in_each_format(client, content_type, encode):
+    resp = _post(client, encode(COLUMNAR), content_type)
+    assert resp.status_code == 202
+    assert resp.json()['accepted'] == 2
+    events = client.get('/v1/events', params={'from_': '2023-09-01', 'to': '2023-09-02'}).json()['events']
+    assert [event['ts'] for event in events] == ['2023-09-01T10:00:00Z', '2023-09-01T10:00:01Z']
+    assert events[0]['device'] == {'vendor': 'Polar'}
+
+
+@pytest.mark.parametrize('encoding, compress', [
+    ('gzip', gzip.compress),
+    ('zstd', lambda data: zstandard.ZstdCompressor().compress(data)),
+])
+def test_compressed_bodies(client, encoding, compress):
+    resp = _post(client, compress(msgpack.packb(COLUMNAR)), 'application/msgpack', encoding)
+    assert resp.json()['accepted'] == 2
+
+
+def test_single_event_as_cbor(client):
+    event = {**{key: COLUMNAR[key] for key in ('userId', 'source', 'device', 'kind')}, 'ts': '2023-09-01T10:00:00Z', 'bpm': 70}
+    resp = client.post('/v1/telemetry', content=cbor2.dumps(event), headers={'Content-Type': 'application/cbor'})
+    assert resp.json() == {'status': 'accepted'}
+
+
+def test_rejects_unknown_media_and_bad_columns(client):
+    assert _post(client, b'x', 'text/csv').status_code == 415
+    assert _post(client, b'[]', 'application/json', 'br').status_code == 415
+    ragged = dict(COLUMNAR, columns={'ts': [1], 'bpm': [1, 2]})
+    assert _post(client, msgpack.packb(ragged), 'application/msgpack').status_code == 400
+
+
+def test_decompressed_size_is_bounded():
+    bomb = zstandard.ZstdCompressor().compress(b'[' + b' ' * 10_000 + b']')
+    with pytest.raises(BodyError):
+        decode_body(bomb, 'application/json', 'zstd', max_bytes=1000)
+    with pytest.raises(BodyError):
+        decode_body(gzip.compress(b' ' * 10_000), 'application/json', 'gzip', max_bytes=1000)
+
+
+@pytest.mark.parametrize('encoding, compress', [
+    ('gzip', gzip.compress),
+    ('zstd', lambda data: zstandard.ZstdCompressor().compress(data)),
+])
+def test_multi_member_bodies_are_read_whole(encoding, compress):
+    body = compress(b'[1, ') + compress(b'2]')
+    assert decode_body(body, 'application/json', encoding, max_bytes=1000) == [1, 2]
+    with pytest.raises(BodyError):
+        decode_body(compress(b' ' * 600) + compress(b' ' * 600), 'application/json', encoding, max_bytes=1000)
+
+
+def test_out_of_range_epochs_only_invalidate_their_rows(client):
+    for user, bad in (('wire-huge', 1e300), ('wire-nan', float('nan')), ('wire-bigint', 10 ** 400)):
+        batch = dict(COLUMNAR, userId=user, columns={'ts': [bad, '2023-09-01T10:00:01Z'], 'bpm': [70, 71]})
+        resp = _post(client, json.dumps(batch).encode(), 'application/json')
+        assert [result['status'] for result in resp.json()['results']] == ['invalid', 'accepted']
+        numeric = dict(batch, columns={'ts': [bad, 1693562402], 'bpm': [70, 71]})
+        resp = _post(client, json.dumps(numeric).encode(), 'application/json')
+        assert [result['status'] for result in resp.json()['results']] == ['invalid', 'accepted']
@@ -16,3 +16,114 @@ export async function postTelemetry(event: Telemetry): Promise<void> {
     throw new Error(`Failed to post telemetry: ${resp.status} ${text}`);
   }
 }
+
+// Push channel for events ingested server-side (vendor pollers and webhooks).
+// The server coalesces to the newest event per kind, so each message is a
+// snapshot rather than a backlog. Reconnects with a capped backoff.
+export function subscribeLiveTelemetry(userId: string, onEvents: (events: Telemetry[]) => void): () => void {
+  const url = `${API_BASE.replace(/^http/, 'ws')}/v1/users/${encodeURIComponent(userId)}/live`;
+  let socket: WebSocket | undefined;
+  let closed = false;
+  let retryMs = 1000;
+  let retryTimer: ReturnType<typeof setTimeout> | undefined;
+
+  const connect = () => {
+    socket = new WebSocket(url);
+    socket.onopen = () => {
+      retryMs = 1000;
+    };
+    socket.onmessage = (message) => {
+      try {
+        onEvents(JSON.parse(String(message.data)).events as Telemetry[]);
+      } catch (err) {
+        console.warn('Malformed live telemetry message', err);
+      }
+    };
+    socket.onclose = () => {
+      if (!closed) {
+        retryTimer = setTimeout(connect, retryMs);
+        retryMs = Math.min(retryMs * 2, 30000);
+      }
+    };
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    if (retryTimer) {
+      clearTimeout(retryTimer);
+    }
+    socket?.close();
+  };
+}
+
+export interface TelemetrySocket {
+  send(event: Telemetry): void;
+  close(): void;
+}
+
+// Long-lived ingest channel for continuous streams (BLE heart rate). Events
+// are numbered, batched every flushMs and kept until the server's
+// cumulative ack covers them; unacked messages are resent on reconnect.
+// A message the server cannot take (busy, rate limited) is answered with an
+// error and the socket is closed, so reconnect after its retry_after.
+export function openTelemetrySocket(flushMs = 1000): TelemetrySocket {
+  const url = `${API_BASE.replace(/^http/, 'ws')}/v1/telemetry/ws`;
+  const unacked: { seq: number; events: Telemetry[] }[] = [];
+  let pending: Telemetry[] = [];
+  let seq = 0;
+  let socket: WebSocket | undefined;
+  let closed = false;
+  let retryMs = 1000;
+
+  const connect = () => {
+    socket = new WebSocket(url);
+    socket.onopen = () => {
+      retryMs = 1000;
+      for (const message of unacked) {
+        socket?.send(JSON.stringify(message));
+      }
+    };
+    socket.onmessage = (message) => {
+      const reply = JSON.parse(String(message.data));
+      if (typeof reply.ack === 'number') {
+        while (unacked.length && unacked[0].seq <= reply.ack) {
+          unacked.shift();
+        }
+      } else if (typeof reply.retry_after === 'number') {
+        retryMs = Math.max(retryMs, reply.retry_after * 1000);
+      }
+    };
+    socket.onclose = () => {
+      if (!closed) {
+        setTimeout(connect, retryMs);
+        retryMs = Math.min(retryMs * 2, 30000);
+      }
+    };
+  };
+
+  const timer = setInterval(() => {
+    if (!pending.length) {
+      return;
+    }
+    seq += 1;
+    const message = { seq, events: pending };
+    pending = [];
+    unacked.push(message);
+    if (socket?.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify(message));
+    }
+  }, flushMs);
+
+  connect();
+  return {
+    send(event: Telemetry) {
+      pending.push(event);
+    },
+    close() {
+      closed = true;
+      clearInterval(timer);
+      socket?.close();
+    }
+  };
+}
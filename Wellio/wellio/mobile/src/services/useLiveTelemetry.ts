@@ -4,7 +4,7 @@ import { selectSource } from './SourceSelector';
 import { subscribeHealthKit } from '../sources/healthkit/module';
 import { pollHealthConnect } from '../sources/healthconnect/module';
 import { streamBleHeartRate } from '../sources/ble/HrClient';
-import { postTelemetry } from './Transport';
+import { openTelemetrySocket, postTelemetry, subscribeLiveTelemetry } from './Transport';
 
 export function useLiveTelemetry(): LiveState {
   const [state, setState] = useState<LiveState>({});
@@ -30,12 +30,27 @@ export function useLiveTelemetry(): LiveState {
           await safePost(event);
         });
       } else if (source === 'ble') {
-        teardown = await streamBleHeartRate(async (event) => {
+        // ~1 Hz samples go over one WebSocket instead of a POST each.
+        const channel = openTelemetrySocket();
+        const stopStream = await streamBleHeartRate(async (event) => {
           setState((prev) => ({ ...prev, heartRate: event }));
-          await safePost(event);
+          channel.send(event);
         });
+        teardown = () => {
+          stopStream();
+          channel.close();
+        };
       } else {
-        // vendor link is handled by backend pollers; we only listen for push updates via notifications.
+        // Vendor data is ingested by backend pollers and webhooks; listen for pushes.
+        teardown = subscribeLiveTelemetry('local-user', (events) => {
+          setState((prev) => {
+            const next = { ...prev };
+            for (const event of events) {
+              next[event.kind === 'heart_rate' ? 'heartRate' : event.kind === 'steps' ? 'steps' : 'sleep'] = event as any;
+            }
+            return next;
+          });
+        });
       }
     }
 
@@ -17,6 +17,7 @@ export type Source =
 export type Meta = {
   sampling_hz?: number;
   confidence?: number;
+  sensor_contact?: boolean;
 };
 
 export type HeartRateTelemetry = {
@@ -26,6 +27,9 @@ export type HeartRateTelemetry = {
   source: Source;
   ts: string;
   bpm: number;
+  // RR intervals (milliseconds between beats) from the BLE measurement.
+  rr?: number[];
+  energy_kj?: number;
   meta?: Meta;
 };
 